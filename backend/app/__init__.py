@@ -2,11 +2,13 @@
 
 提供应用初始化和启动配置。
 """
+import asyncio
+
 from fastapi import FastAPI
 from loguru import logger
 
 from app.core.config import settings
-from app.core.cache import default_cache
+from app.core.cache import default_cache, restore_caches, snapshot_caches, warm_up
 
 def create_app() -> FastAPI:
     """创建并配置 FastAPI 应用实例"""
@@ -18,18 +20,26 @@ def create_app() -> FastAPI:
     @app.on_event("startup")
     async def startup_event():
         """应用启动时的初始化操作"""
-        # 初始化缓存
+        # 初始化缓存，恢复快照并在后台预热
         await default_cache.initialize()
+        if settings.cache.snapshot_enabled:
+            await asyncio.to_thread(restore_caches)
+        if settings.cache.warmup_enabled:
+            app.state.warmup_task = asyncio.create_task(warm_up(settings.cache.warmup_timeout))
         logger.info("缓存已初始化")
 
     @app.on_event("shutdown")
     async def shutdown_event():
         """应用关闭时的清理操作"""
-        # 清理缓存
-        await default_cache.clear()
-        if default_cache._cleanup_task:
-            default_cache._cleanup_task.cancel()
-        logger.info("缓存已清理")
+        warmup_task = getattr(app.state, "warmup_task", None)
+        if warmup_task and not warmup_task.done():
+            warmup_task.cancel()
+            
+        # 保存缓存快照，停止缓存清理任务，待写条目落盘
+        if settings.cache.snapshot_enabled:
+            await asyncio.to_thread(snapshot_caches)
+        await default_cache.close()
+        logger.info("缓存已关闭")
 
     return app
 
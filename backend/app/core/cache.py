@@ -1,18 +1,30 @@
 """缓存管理模块
 
 提供应用级缓存管理，支持 TTL 缓存、性能监控和缓存策略配置。
+
+缓存分为两级：进程内 LRU（每个键独立过期时间，过期时间用最小堆维护），
+以及可选的 SQLite 磁盘缓存（重启后仍然有效）。
 """
 import asyncio
-import json
+import hashlib
+import heapq
+import inspect
+import os
+import pickle
+import sqlite3
+import sys
+import threading
 import time
-from datetime import datetime, timedelta
+import zlib
+from collections import OrderedDict
+from datetime import date, datetime
 from functools import wraps
-from typing import Any, Callable, Dict, List, Optional, Set, Union
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple, Union
 
-from cachetools import LRUCache, TTLCache
 from loguru import logger
 
 from app.core.config import ConfigError, settings
+from app.core.metrics import LatencyHistogram, SpaceSaving
 
 class CacheError(Exception):
     """缓存错误"""
@@ -23,43 +35,327 @@ class CacheStrategy:
     TTL = "ttl"  # 基于时间的缓存
     LRU = "lru"  # 最近最少使用缓存
 
+# 区分“未命中”和“缓存了 None”
+_MISSING = object()
+
+def path_tag(path: str) -> str:
+    """路径标签：缓存以 path 为前缀的查询结果时使用"""
+    return f"path:{path.strip('/')}"
+
+def path_tags(path: str) -> List[str]:
+    """路径及其所有祖先目录的标签：path 变化时需要失效的全部前缀"""
+    parts = [part for part in path.strip('/').split('/') if part]
+    return ["path:"] + [f"path:{'/'.join(parts[:i])}" for i in range(1, len(parts) + 1)]
+
+def file_tag(file_id: str) -> str:
+    """文件标签：缓存单个文件的查询结果时使用"""
+    return f"file:{file_id}"
+
+def estimate_size(value: Any, sample: int = 8) -> int:
+    """估算值占用的字节数
+    
+    对容器只抽样前几个元素再按数量外推，避免为了统计大小而遍历或序列化整个值。
+    """
+    size = sys.getsizeof(value)
+    if isinstance(value, (str, bytes, bytearray, int, float, bool)) or value is None:
+        return size
+    if isinstance(value, dict):
+        items = value.items()
+        count = len(value)
+        if count:
+            sampled = 0
+            total = 0
+            for k, v in items:
+                total += sys.getsizeof(k) + sys.getsizeof(v)
+                sampled += 1
+                if sampled >= sample:
+                    break
+            size += total * count // sampled
+        return size
+    if isinstance(value, (list, tuple, set, frozenset)):
+        count = len(value)
+        if count:
+            sampled = 0
+            total = 0
+            for item in value:
+                total += sys.getsizeof(item)
+                sampled += 1
+                if sampled >= sample:
+                    break
+            size += total * count // sampled
+        return size
+    # 普通对象按 __dict__ 估算
+    attrs = getattr(value, "__dict__", None)
+    if attrs:
+        size += estimate_size(attrs, sample)
+    return size
+
 class CacheValue:
     """缓存值包装器"""
     
-    def __init__(self, value: Any, created_at: datetime = None):
+    __slots__ = ("value", "expires_at", "size", "tags", "seq", "created_at", "access_count")
+    
+    def __init__(
+        self,
+        value: Any,
+        expires_at: Optional[float] = None,
+        size: int = 0,
+        tags: Tuple[str, ...] = (),
+        created_at: float = None
+    ):
         """初始化缓存值
         
         Args:
             value: 原始值
-            created_at: 创建时间
+            expires_at: 过期时间戳（time.time()），None 表示永不过期
+            size: 估算的字节数
+            tags: 失效标签
+            created_at: 创建时间戳
         """
         self.value = value
-        self.created_at = created_at or datetime.now()
+        self.expires_at = expires_at
+        self.size = size
+        self.tags = tags
+        self.seq = 0
+        self.created_at = created_at or time.time()
         self.access_count = 0
-        self.last_accessed = None
         
-    def access(self):
-        """记录访问"""
-        self.access_count += 1
-        self.last_accessed = datetime.now()
+    def is_expired(self, now: float) -> bool:
+        """是否已过期"""
+        return self.expires_at is not None and self.expires_at <= now
         
     def to_dict(self) -> Dict:
         """转换为字典"""
         return {
             "value": self.value,
-            "created_at": self.created_at.isoformat(),
-            "access_count": self.access_count,
-            "last_accessed": self.last_accessed.isoformat() if self.last_accessed else None
+            "created_at": datetime.fromtimestamp(self.created_at).isoformat(),
+            "expires_at": datetime.fromtimestamp(self.expires_at).isoformat() if self.expires_at else None,
+            "size": self.size,
+            "tags": list(self.tags),
+            "access_count": self.access_count
         }
 
+class DiskCache:
+    """SQLite 磁盘缓存
+    
+    多个命名空间共用一个数据库文件，值使用 pickle 序列化。
+    超过容量时优先淘汰最早过期的条目。
+    """
+    
+    # 标签列中的分隔符
+    TAG_SEPARATOR = "\x1f"
+    
+    def __init__(self, path: str, max_bytes: int):
+        """初始化磁盘缓存
+        
+        Args:
+            path: 数据库文件路径
+            max_bytes: 最大占用字节数
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            
+        # 连接在事件循环和工作线程之间共享，事务不能交错，每个操作都在锁内执行
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS cache_entries (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value BLOB NOT NULL,
+                expires_at REAL,
+                tags TEXT NOT NULL DEFAULT '',
+                PRIMARY KEY (namespace, key)
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_cache_expires ON cache_entries (expires_at)"
+        )
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS cache_tags (
+                namespace TEXT NOT NULL,
+                tag TEXT NOT NULL,
+                key TEXT NOT NULL,
+                PRIMARY KEY (namespace, tag, key)
+            )
+            """
+        )
+        
+    def get(self, namespace: str, key: str) -> Optional[Tuple[bytes, Optional[float], Tuple[str, ...]]]:
+        """读取一条缓存，返回 (序列化值, 过期时间, 标签)"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at, tags FROM cache_entries WHERE namespace = ? AND key = ?",
+                (namespace, key)
+            ).fetchone()
+        if row is None:
+            return None
+        value, expires_at, tags = row
+        return value, expires_at, tuple(tags.split(self.TAG_SEPARATOR)) if tags else ()
+        
+    def write(self, namespace: str, entries: Dict[str, Optional[CacheValue]]):
+        """批量写入或删除（值为 None 表示删除）"""
+        rows = []
+        tag_rows = []
+        keys = []
+        for key, entry in entries.items():
+            keys.append((namespace, key))
+            if entry is None:
+                continue
+            try:
+                rows.append((
+                    namespace,
+                    key,
+                    pickle.dumps(entry.value, pickle.HIGHEST_PROTOCOL),
+                    entry.expires_at,
+                    self.TAG_SEPARATOR.join(entry.tags)
+                ))
+                tag_rows.extend((namespace, tag, key) for tag in entry.tags)
+            except Exception as e:
+                logger.debug(f"缓存值无法序列化，跳过磁盘缓存 [{key}]: {str(e)}")
+                
+        with self._lock:
+            self._write_rows(keys, rows, tag_rows)
+            
+    def _write_rows(self, keys: List[Tuple[str, str]], rows: List[Tuple], tag_rows: List[Tuple[str, str, str]]):
+        self._conn.execute("BEGIN")
+        try:
+            # 先删除旧值和旧标签，再写入新值
+            self._conn.executemany(
+                "DELETE FROM cache_entries WHERE namespace = ? AND key = ?", keys
+            )
+            self._conn.executemany(
+                "DELETE FROM cache_tags WHERE namespace = ? AND key = ?", keys
+            )
+            if rows:
+                self._conn.executemany(
+                    "INSERT INTO cache_entries (namespace, key, value, expires_at, tags) VALUES (?, ?, ?, ?, ?)",
+                    rows
+                )
+            if tag_rows:
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO cache_tags (namespace, tag, key) VALUES (?, ?, ?)",
+                    tag_rows
+                )
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+            
+    def invalidate_tags(self, namespace: str, tags: Iterable[str]) -> int:
+        """删除带有任一标签的条目，返回删除数量"""
+        params = [(namespace, tag) for tag in tags]
+        with self._lock:
+            return self._invalidate_rows(namespace, params)
+            
+    def _invalidate_rows(self, namespace: str, params: List[Tuple[str, str]]) -> int:
+        self._conn.execute("BEGIN")
+        try:
+            removed = 0
+            for param in params:
+                removed += self._conn.execute(
+                    "DELETE FROM cache_entries WHERE namespace = ? AND key IN "
+                    "(SELECT key FROM cache_tags WHERE namespace = ? AND tag = ?)",
+                    (namespace, *param)
+                ).rowcount
+            self._conn.executemany(
+                "DELETE FROM cache_tags WHERE namespace = ? AND tag = ?", params
+            )
+            self._conn.execute("COMMIT")
+            return removed
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+            
+    def clear(self, namespace: str):
+        """清除命名空间下的所有条目"""
+        with self._lock:
+            self._conn.execute("DELETE FROM cache_entries WHERE namespace = ?", (namespace,))
+            self._conn.execute("DELETE FROM cache_tags WHERE namespace = ?", (namespace,))
+            
+    def purge(self, now: float) -> int:
+        """删除过期条目并把总大小控制在上限内，返回删除数量"""
+        with self._lock:
+            return self._purge(now)
+            
+    def _purge(self, now: float) -> int:
+        removed = self._conn.execute(
+            "DELETE FROM cache_entries WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,)
+        ).rowcount
+        
+        total = self._conn.execute(
+            "SELECT COALESCE(SUM(LENGTH(value)), 0) FROM cache_entries"
+        ).fetchone()[0]
+        if total > self.max_bytes:
+            # 按过期时间从早到晚淘汰，永不过期的最后淘汰
+            rows = self._conn.execute(
+                "SELECT rowid, LENGTH(value) FROM cache_entries "
+                "ORDER BY expires_at IS NULL, expires_at"
+            )
+            victims = []
+            for rowid, length in rows:
+                if total <= self.max_bytes:
+                    break
+                victims.append((rowid,))
+                total -= length
+            self._conn.executemany("DELETE FROM cache_entries WHERE rowid = ?", victims)
+            removed += len(victims)
+            
+        if removed:
+            self._conn.execute(
+                "DELETE FROM cache_tags WHERE NOT EXISTS ("
+                "SELECT 1 FROM cache_entries e "
+                "WHERE e.namespace = cache_tags.namespace AND e.key = cache_tags.key)"
+            )
+        return removed
+        
+    def count(self, namespace: str) -> int:
+        """命名空间下的条目数量"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM cache_entries WHERE namespace = ?", (namespace,)
+            ).fetchone()[0]
+            
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
+
 class CacheManager:
     """缓存管理器
     
     提供应用级缓存管理，支持多种缓存策略和性能监控。
+    
+    内存层使用 OrderedDict 实现 LRU，get/set 均为 O(1)；每个条目有独立的过期时间，
+    过期时间放在最小堆中，只在到期时弹出（惰性删除），不需要扫描全部键。
+    内存层同时受条目数和字节数限制。磁盘层可选，写入先进入待写缓冲区，批量落盘。
+    
+    磁盘层的读写都不持有内存层的锁；异步调用方使用 aget / ainvalidate_tags，
+    磁盘操作在线程中执行，不阻塞事件循环。
     """
     
     _instances: Dict[str, 'CacheManager'] = {}
     
+    # 待写入磁盘的条目达到该数量时立即落盘
+    DISK_FLUSH_THRESHOLD = 100
+    # 后台任务的最短唤醒间隔（秒），用于定期落盘
+    FLUSH_INTERVAL = 5
+    # 每 N 次读写采样一次耗时（2 的幂）
+    LATENCY_SAMPLE_RATE = 64
+    # 每 N 次读取记录一次热点键（2 的幂）
+    HOT_KEY_SAMPLE_RATE = 4
+    # 热点键计数器数量
+    HOT_KEY_CAPACITY = 64
+    
     @classmethod
     def get_instance(
         cls,
@@ -81,36 +377,109 @@ class CacheManager:
     
     def __init__(
         self,
+        namespace: str = "default",
         strategy: str = "ttl",
         default_ttl: int = 300,
         maxsize: int = 1000,
-        cleanup_interval: int = 3600
+        max_bytes: int = 64 * 1024 * 1024,
+        cleanup_interval: int = 3600,
+        disk_path: Optional[str] = None,
+        disk_max_bytes: int = 512 * 1024 * 1024
     ):
+        """初始化缓存管理器
+        
+        Args:
+            namespace: 缓存命名空间
+            strategy: 缓存策略（ttl 时未指定过期时间的条目使用 default_ttl，lru 时永不过期）
+            default_ttl: 默认过期时间（秒）
+            maxsize: 内存层最大条目数
+            max_bytes: 内存层最大字节数
+            cleanup_interval: 清理间隔（秒）
+            disk_path: 磁盘缓存文件路径，None 表示不启用磁盘层
+            disk_max_bytes: 磁盘层最大字节数
+        """
+        self.namespace = namespace
         self.strategy = strategy
         self.default_ttl = default_ttl
         self.maxsize = maxsize
+        self.max_bytes = max_bytes
         self.cleanup_interval = cleanup_interval
         
-        # 缓存存储
-        self._cache = {}
-        self._access_count = 0
-        self._hit_count = 0
-        self._miss_count = 0
-        self._cleanup_count = 0
-        self._last_cleanup = None
-        self._cleanup_task = None
+        # 内存层
+        self._entries: "OrderedDict[str, CacheValue]" = OrderedDict()
+        self._expiry: List[Tuple[float, int, str]] = []  # (过期时间, 序号, 键)
+        self._seq = 0
+        self._bytes = 0
+        self._tags: Dict[str, Set[str]] = {}  # 标签 -> 键
+        self.epoch = 0  # 每次按标签失效时递增
+        self._lock = threading.RLock()
+        
+        # 磁盘层
+        self._disk: Optional[DiskCache] = None
+        self._pending: Dict[str, Optional[CacheValue]] = {}
+        # 磁盘层内容的版本：落盘、按标签删除和清空的前后各加一，
+        # 读取磁盘期间版本变化时放弃读到的值，避免把旧值提升到内存层
+        self._disk_version = 0
+        # 保证落盘和磁盘删除按发起的顺序执行
+        self._disk_write_lock = threading.Lock()
+        if disk_path:
+            try:
+                self._disk = DiskCache(disk_path, disk_max_bytes)
+            except Exception as e:
+                logger.error(f"初始化磁盘缓存失败 [{disk_path}]: {str(e)}")
+                
+        # 统计信息
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self.set_operations = 0
+        self.failed_operations = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.tag_invalidations = 0
+        self.max_value_size = 0
+        self._get_ops = 0
+        self._set_ops = 0
+        self._get_latency = LatencyHistogram()
+        self._set_latency = LatencyHistogram()
+        self._hot_keys = SpaceSaving(self.HOT_KEY_CAPACITY)
+        self._created_at = datetime.now()
+        self._last_cleanup: Optional[datetime] = None
+        self._cleanup_task: Optional[asyncio.Task] = None
         
     async def initialize(self):
         """初始化缓存管理器，启动清理任务"""
         if not self._cleanup_task:
             self._cleanup_task = asyncio.create_task(self._cleanup_loop())
             
+    async def close(self):
+        """停止清理任务并把待写条目落盘（不清除缓存内容）"""
+        if self._cleanup_task:
+            self._cleanup_task.cancel()
+            try:
+                await self._cleanup_task
+            except asyncio.CancelledError:
+                pass
+            self._cleanup_task = None
+        await asyncio.to_thread(self.flush)
+        if self._disk:
+            with self._disk_write_lock:
+                disk, self._disk = self._disk, None
+            disk.close()
+                
     async def _cleanup_loop(self):
         """清理循环任务"""
+        last_cleanup = time.monotonic()
         while True:
             try:
-                await asyncio.sleep(self.cleanup_interval)
-                await self._cleanup_expired()
+                await asyncio.sleep(min(self.FLUSH_INTERVAL, self.cleanup_interval))
+                if self._pending:
+                    await asyncio.to_thread(self.flush)
+                if time.monotonic() - last_cleanup >= self.cleanup_interval:
+                    last_cleanup = time.monotonic()
+                    await asyncio.to_thread(self._cleanup_expired)
+            except asyncio.CancelledError:
+                raise
             except Exception as e:
                 logger.error(f"缓存清理失败: {str(e)}")
                 
@@ -118,66 +487,194 @@ class CacheManager:
         """获取完整的缓存键"""
         return f"{self.namespace}:{key}"
     
-    def _record_access_time(self, key: str, start_time: float):
-        """记录访问时间"""
-        access_time = time.time() - start_time
-        self._access_times[key] = access_time
-        
-        # 更新热点键
-        if access_time < 0.001:  # 访问时间小于 1ms
-            self._hot_keys.add(key)
+    def _resolve_ttl(self, ttl: Optional[int]) -> Optional[float]:
+        """计算过期时间戳"""
+        if ttl is None and self.strategy == CacheStrategy.TTL:
+            ttl = self.default_ttl
+        return time.time() + ttl if ttl else None
     
-    def _record_value_size(self, key: str, value: Any):
-        """记录值大小"""
-        try:
-            size = len(json.dumps(value)) if isinstance(value, (dict, list)) else len(str(value))
-            self._value_sizes[key] = size
+    def _store(self, key: str, entry: CacheValue):
+        """写入内存层（调用方持有锁）"""
+        self._remove(key)
+        self._entries[key] = entry
+        self._bytes += entry.size
+        for tag in entry.tags:
+            self._tags.setdefault(tag, set()).add(key)
+        if entry.expires_at is not None:
+            self._seq += 1
+            entry.seq = self._seq
+            heapq.heappush(self._expiry, (entry.expires_at, entry.seq, key))
+        self._evict()
+        
+    def _remove(self, key: str) -> Optional[CacheValue]:
+        """从内存层删除（调用方持有锁）"""
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._forget(key, entry)
+        return entry
+        
+    def _forget(self, key: str, entry: CacheValue):
+        """扣减已移出内存层的条目的大小和标签索引（调用方持有锁）"""
+        self._bytes -= entry.size
+        for tag in entry.tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+                    
+    def _expire(self, now: float):
+        """弹出堆顶所有已到期的条目（调用方持有锁）"""
+        expiry = self._expiry
+        while expiry and expiry[0][0] <= now:
+            _, seq, key = heapq.heappop(expiry)
+            entry = self._entries.get(key)
+            # 堆中可能有被覆盖或删除的旧记录，只处理序号一致的条目
+            if entry is not None and entry.seq == seq:
+                self._remove(key)
+                self.expirations += 1
+                
+        # 覆盖写入过多时堆中会积累失效记录，重建一次
+        if len(expiry) > 2 * len(self._entries) + 1024:
+            self._expiry = [
+                (entry.expires_at, entry.seq, key)
+                for key, entry in self._entries.items()
+                if entry.expires_at is not None
+            ]
+            heapq.heapify(self._expiry)
             
-            # 如果值过大，记录警告
-            if size > 1024 * 1024:  # 1MB
-                logger.warning(f"缓存值过大 [{key}]: {size} bytes")
-        except Exception:
-            self._value_sizes[key] = 0
-    
-    def get(self, key: str) -> Optional[Any]:
+    def _evict(self):
+        """按 LRU 淘汰直到满足条目数和字节数限制（调用方持有锁）"""
+        self._expire(time.time())
+        while self._entries and (len(self._entries) > self.maxsize or self._bytes > self.max_bytes):
+            key, entry = self._entries.popitem(last=False)
+            self._forget(key, entry)
+            self.evictions += 1
+            
+    def _get_memory(self, key: str) -> Tuple[Any, Optional[int]]:
+        """查找内存层和待写缓冲区
+        
+        Returns:
+            (缓存值或 _MISSING, 需要读取磁盘层时为读取前的磁盘层版本，否则为 None)
+        """
+        with self._lock:
+            if not self._get_ops & (self.HOT_KEY_SAMPLE_RATE - 1):
+                self._hot_keys.add(key)
+            now = time.time()
+            entry = self._entries.get(key)
+            if entry is not None:
+                if not entry.is_expired(now):
+                    self._entries.move_to_end(key)
+                    entry.access_count += 1
+                    self.hits += 1
+                    return entry.value, None
+                self._remove(key)
+                self.expirations += 1
+                
+            if self._disk is None:
+                self.misses += 1
+                return _MISSING, None
+                
+            if key in self._pending:
+                entry = self._pending[key]
+                if entry is None or entry.is_expired(now):
+                    self.misses += 1
+                    return _MISSING, None
+                self._store(key, entry)
+                self.hits += 1
+                self.disk_hits += 1
+                return entry.value, None
+                
+            return _MISSING, self._disk_version
+            
+    def _get_disk(self, key: str, version: int) -> Any:
+        """读取磁盘层并提升到内存层（不持有内存层的锁）
+        
+        Args:
+            key: 缓存键
+            version: 查找内存层时的磁盘层版本
+        """
+        disk = self._disk
+        row = disk.get(self.namespace, key) if disk is not None else None
+        value = _MISSING
+        if row is not None:
+            data, expires_at, tags = row
+            if expires_at is None or expires_at > time.time():
+                value = pickle.loads(data)
+                
+        with self._lock:
+            # 读取期间其他调用可能已经写入了更新的值
+            entry = self._entries.get(key)
+            if entry is not None and not entry.is_expired(time.time()):
+                self.hits += 1
+                return entry.value
+            if value is _MISSING or self._disk_version != version or key in self._pending:
+                self.misses += 1
+                return _MISSING
+            self._store(key, CacheValue(value, expires_at, estimate_size(value), tags))
+            self.hits += 1
+            self.disk_hits += 1
+            return value
+            
+    def get(self, key: str, default: Any = None) -> Any:
         """获取缓存值
         
         Args:
             key: 缓存键
+            default: 未命中时返回的值
             
         Returns:
-            缓存的值或 None（如果不存在）
+            缓存的值或 default（如果不存在）
         """
-        start_time = time.time()
-        full_key = self._get_full_key(key)
+        self._get_ops += 1
+        if self._get_ops & (self.LATENCY_SAMPLE_RATE - 1):
+            return self._get(key, default)
+        start = time.perf_counter()
+        value = self._get(key, default)
+        self._get_latency.record(time.perf_counter() - start)
+        return value
         
+    def _get(self, key: str, default: Any) -> Any:
         try:
-            cached = self.cache.get(full_key)
-            if cached is not None:
-                if isinstance(cached, CacheValue):
-                    cached.access()
-                    value = cached.value
-                else:
-                    value = cached
-                    
-                self.hits += 1
-                self._record_access_time(full_key, start_time)
-                return value
+            value, version = self._get_memory(key)
+            if version is not None:
+                value = self._get_disk(key, version)
+            return default if value is _MISSING else value
             
-            self.misses += 1
-            return None
+        except Exception as e:
+            self.failed_operations += 1
+            logger.error(f"获取缓存失败 [{self._get_full_key(key)}]: {str(e)}")
+            return default
+            
+    async def aget(self, key: str, default: Any = None) -> Any:
+        """异步获取缓存值，内存层未命中时在线程中读取磁盘层
+        
+        Args:
+            key: 缓存键
+            default: 未命中时返回的值
+            
+        Returns:
+            缓存的值或 default（如果不存在）
+        """
+        self._get_ops += 1
+        try:
+            value, version = self._get_memory(key)
+            if version is not None:
+                value = await asyncio.to_thread(self._get_disk, key, version)
+            return default if value is _MISSING else value
             
         except Exception as e:
             self.failed_operations += 1
-            logger.error(f"获取缓存失败 [{full_key}]: {str(e)}")
-            return None
+            logger.error(f"获取缓存失败 [{self._get_full_key(key)}]: {str(e)}")
+            return default
 
     def set(
         self,
         key: str,
         value: Any,
         ttl: Optional[int] = None,
-        track_access: bool = True
+        track_access: bool = True,
+        tags: Optional[Iterable[str]] = None
     ) -> bool:
         """设置缓存值
         
@@ -185,38 +682,56 @@ class CacheManager:
             key: 缓存键
             value: 要缓存的值
             ttl: 可选的过期时间（秒）
-            track_access: 是否跟踪访问信息
+            track_access: 是否跟踪访问信息（保留参数，访问次数总是记录在条目上）
+            tags: 失效标签，之后可以通过 invalidate_tags 一次清除
             
         Returns:
             是否设置成功
         """
-        full_key = self._get_full_key(key)
+        self._set_ops += 1
+        if self._set_ops & (self.LATENCY_SAMPLE_RATE - 1):
+            return self._set(key, value, ttl, tags)
+        start = time.perf_counter()
+        result = self._set(key, value, ttl, tags)
+        self._set_latency.record(time.perf_counter() - start)
+        return result
         
+    def _set(self, key: str, value: Any, ttl: Optional[int], tags: Optional[Iterable[str]]) -> bool:
         try:
-            # 包装缓存值
-            if track_access:
-                cache_value = CacheValue(value)
-                value_to_cache = cache_value
-            else:
-                value_to_cache = value
-            
-            if ttl and self.strategy == CacheStrategy.TTL:
-                # 创建新的 TTL 缓存用于特定过期时间
-                temp_cache = TTLCache(maxsize=1, ttl=ttl)
-                temp_cache[full_key] = value_to_cache
-                self.cache[full_key] = temp_cache[full_key]
-            else:
-                self.cache[full_key] = value_to_cache
+            size = estimate_size(value)
+            if size > self.max_bytes:
+                logger.warning(f"缓存值过大，跳过缓存 [{self._get_full_key(key)}]: {size} bytes")
+                return False
                 
-            self.set_operations += 1
-            self._record_value_size(full_key, value)
+            entry = CacheValue(value, self._resolve_ttl(ttl), size, tuple(tags) if tags else ())
+            with self._lock:
+                self._store(key, entry)
+                self.set_operations += 1
+                if size > self.max_value_size:
+                    self.max_value_size = size
+                if self._disk is not None:
+                    self._pending[key] = entry
+                    flush = len(self._pending) >= self.DISK_FLUSH_THRESHOLD
+                else:
+                    flush = False
+            if flush:
+                if _on_event_loop():
+                    _spawn(asyncio.to_thread(self.flush))
+                else:
+                    self.flush()
             return True
             
         except Exception as e:
             self.failed_operations += 1
-            logger.error(f"设置缓存失败 [{full_key}]: {str(e)}")
+            logger.error(f"设置缓存失败 [{self._get_full_key(key)}]: {str(e)}")
             return False
 
+    def contains(self, key: str) -> bool:
+        """内存层中是否存在未过期的键（不影响 LRU 顺序和统计）"""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and not entry.is_expired(time.time())
+            
     def invalidate(self, key: str) -> bool:
         """清除指定缓存
         
@@ -226,127 +741,283 @@ class CacheManager:
         Returns:
             是否清除成功
         """
-        full_key = self._get_full_key(key)
-        
         try:
-            if full_key in self.cache:
-                del self.cache[full_key]
-                if full_key in self._access_times:
-                    del self._access_times[full_key]
-                if full_key in self._value_sizes:
-                    del self._value_sizes[full_key]
-                self._hot_keys.discard(full_key)
-                self._expired_keys.add(full_key)
+            with self._lock:
+                self._remove(key)
+                if self._disk is not None:
+                    self._pending[key] = None
             return True
             
         except Exception as e:
             self.failed_operations += 1
-            logger.error(f"清除缓存失败 [{full_key}]: {str(e)}")
+            logger.error(f"清除缓存失败 [{self._get_full_key(key)}]: {str(e)}")
             return False
 
-    def clear(self) -> bool:
-        """清除所有缓存"""
+    def invalidate_tags(self, *tags: str) -> int:
+        """清除带有任一标签的所有缓存（包括磁盘层）
+        
+        通过标签索引直接定位条目，耗时与被清除的条目数成正比。
+        
+        Args:
+            *tags: 要清除的标签
+            
+        Returns:
+            清除的条目数量
+        """
+        if not tags:
+            return 0
+        try:
+            tag_set = set(tags)
+            removed = self._invalidate_memory_tags(tag_set)
+            if self._disk is not None:
+                removed += self._invalidate_disk_tags(tag_set)
+            return removed
+            
+        except Exception as e:
+            self.failed_operations += 1
+            logger.error(f"按标签清除缓存失败 [{self.namespace}]: {str(e)}")
+            return 0
+            
+    async def ainvalidate_tags(self, *tags: str) -> int:
+        """异步清除带有任一标签的所有缓存，内存层立即失效，磁盘层在线程中删除
+        
+        Args:
+            *tags: 要清除的标签
+            
+        Returns:
+            清除的条目数量
+        """
+        if not tags:
+            return 0
         try:
-            # 记录所有键为过期
-            self._expired_keys.update(self.cache.keys())
+            tag_set = set(tags)
+            removed = self._invalidate_memory_tags(tag_set)
+            if self._disk is not None:
+                removed += await asyncio.to_thread(self._invalidate_disk_tags, tag_set)
+            return removed
             
-            # 清除所有数据
-            self.cache.clear()
-            self._access_times.clear()
-            self._value_sizes.clear()
-            self._hot_keys.clear()
+        except Exception as e:
+            self.failed_operations += 1
+            logger.error(f"按标签清除缓存失败 [{self.namespace}]: {str(e)}")
+            return 0
             
+    def _invalidate_memory_tags(self, tag_set: Set[str]) -> int:
+        """清除内存层和待写缓冲区中带有任一标签的条目"""
+        with self._lock:
+            removed = 0
+            for tag in tag_set:
+                for key in self._tags.pop(tag, ()):
+                    entry = self._entries.pop(key, None)
+                    if entry is None:
+                        continue
+                    self._forget(key, entry)
+                    removed += 1
+                    if self._disk is not None:
+                        self._pending[key] = None
+                        
+            if self._disk is not None:
+                # 已被淘汰出内存、尚未落盘的条目
+                for key, entry in list(self._pending.items()):
+                    if entry is not None and tag_set.intersection(entry.tags):
+                        self._pending[key] = None
+                self._disk_version += 1
+                
+            self.epoch += 1
+            self.tag_invalidations += 1
+            return removed
+            
+    def _invalidate_disk_tags(self, tag_set: Set[str]) -> int:
+        """删除磁盘层中带有任一标签的条目（在正在进行的落盘完成之后执行）"""
+        with self._disk_write_lock:
+            try:
+                disk = self._disk
+                return disk.invalidate_tags(self.namespace, tag_set) if disk is not None else 0
+            finally:
+                with self._lock:
+                    self._disk_version += 1
+                    
+    def clear(self) -> bool:
+        """清除所有缓存（包括磁盘层）"""
+        try:
+            with self._lock:
+                self._entries.clear()
+                self._expiry.clear()
+                self._tags.clear()
+                self._bytes = 0
+                self._pending.clear()
+                self._disk_version += 1
+            if self._disk is not None:
+                with self._disk_write_lock:
+                    try:
+                        self._disk.clear(self.namespace)
+                    finally:
+                        with self._lock:
+                            self._disk_version += 1
             return True
         except Exception as e:
             logger.error(f"清除所有缓存失败: {str(e)}")
             return False
 
-    def get_stats(self) -> dict:
-        """获取缓存统计信息
+    def flush(self):
+        """把待写条目写入磁盘层"""
+        if self._disk is None:
+            return
+        with self._disk_write_lock:
+            with self._lock:
+                if not self._pending:
+                    return
+                pending, self._pending = self._pending, {}
+                self._disk_version += 1
+            try:
+                self._disk.write(self.namespace, pending)
+            except Exception as e:
+                self.failed_operations += 1
+                logger.error(f"写入磁盘缓存失败 [{self.namespace}]: {str(e)}")
+            finally:
+                with self._lock:
+                    self._disk_version += 1
+                
+    def _cleanup_expired(self):
+        """清理内存层和磁盘层中的过期条目"""
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+        # 磁盘层只删除已过期或超出容量的条目，不影响读取的正确性，不需要持有锁
+        removed = self._disk.purge(now) if self._disk is not None else 0
+        self._last_cleanup = datetime.now()
+        logger.info(
+            f"缓存清理完成 [{self.namespace}]: {len(self._entries)} 个有效键，"
+            f"磁盘删除 {removed} 个"
+        )
         
+    # 快照文件格式版本
+    SNAPSHOT_VERSION = 1
+    
+    def snapshot(self, path: str) -> int:
+        """把内存层中未过期的条目写入快照文件
+        
+        按 LRU 顺序（最久未使用在前）保存，无法序列化的条目跳过。
+        先写临时文件再替换，避免中途退出留下损坏的快照。
+        
+        Args:
+            path: 快照文件路径
+            
         Returns:
-            包含统计信息的字典
+            写入的条目数量
         """
-        total_ops = self.hits + self.misses
-        current_time = datetime.now()
+        now = time.time()
+        with self._lock:
+            items = [
+                (key, entry)
+                for key, entry in self._entries.items()
+                if not entry.is_expired(now)
+            ]
+            
+        entries = []
+        for key, entry in items:
+            try:
+                data = pickle.dumps(entry.value, pickle.HIGHEST_PROTOCOL)
+            except Exception:
+                continue
+            entries.append((key, data, entry.expires_at, entry.tags))
+            
+        payload = zlib.compress(pickle.dumps({
+            "version": self.SNAPSHOT_VERSION,
+            "namespace": self.namespace,
+            "created_at": now,
+            "entries": entries
+        }, pickle.HIGHEST_PROTOCOL))
         
-        # 计算平均访问时间
-        avg_access_time = (
-            sum(self._access_times.values()) / len(self._access_times)
-            if self._access_times else 0
-        )
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(payload)
+        os.replace(temp_path, path)
+        return len(entries)
         
-        # 获取最大值大小
-        max_value_size = max(self._value_sizes.values()) if self._value_sizes else 0
+    def restore(self, path: str) -> int:
+        """从快照文件恢复未过期的条目
         
-        # 获取热点键信息
-        hot_keys = [
-            {
-                "key": key.split(":", 1)[1],  # 移除命名空间前缀
-                "access_time": self._access_times.get(key, 0),
-                "size": self._value_sizes.get(key, 0)
-            }
-            for key in self._hot_keys
-        ]
+        恢复后删除快照文件：运行期间发生的失效不会反映到旧快照中，
+        异常退出后再次启动时不能重复加载它。
         
+        Args:
+            path: 快照文件路径
+            
+        Returns:
+            恢复的条目数量
+        """
+        if not os.path.exists(path):
+            return 0
+        try:
+            with open(path, "rb") as f:
+                payload = pickle.loads(zlib.decompress(f.read()))
+        finally:
+            os.remove(path)
+            
+        if payload.get("version") != self.SNAPSHOT_VERSION:
+            logger.warning(f"缓存快照版本不匹配，跳过恢复 [{self.namespace}]")
+            return 0
+            
+        now = time.time()
+        restored = 0
+        with self._lock:
+            for key, data, expires_at, tags in payload["entries"]:
+                if expires_at is not None and expires_at <= now:
+                    continue
+                try:
+                    value = pickle.loads(data)
+                except Exception:
+                    continue
+                self._store(key, CacheValue(value, expires_at, estimate_size(value), tuple(tags)))
+                restored += 1
+        return restored
+        
+    def get_stats(self) -> dict:
+        """获取缓存统计信息
+        
+        只读取计数器、固定桶直方图和热点键计数器，不遍历缓存内容。
+        
+        Returns:
+            包含统计信息的字典
+        """
+        total_ops = self.hits + self.misses
+        with self._lock:
+            size = len(self._entries)
+            hot_keys = self._hot_keys.top(10)
         return {
             "namespace": self.namespace,
             "strategy": self.strategy,
-            "size": len(self.cache),
-            "maxsize": self.cache.maxsize,
+            "size": size,
+            "maxsize": self.maxsize,
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "avg_value_size": self._bytes / size if size else 0,
+            "max_value_size": self.max_value_size,
             "hits": self.hits,
             "misses": self.misses,
+            "disk_hits": self.disk_hits,
             "hit_rate": self.hits / total_ops if total_ops > 0 else 0,
             "set_operations": self.set_operations,
             "failed_operations": self.failed_operations,
             "error_rate": self.failed_operations / (self.set_operations + total_ops) if (self.set_operations + total_ops) > 0 else 0,
-            "avg_access_time": avg_access_time,
-            "total_size": sum(self._value_sizes.values()),
-            "max_value_size": max_value_size,
-            "hot_keys": hot_keys[:10],  # 只返回前10个热点键
-            "expired_keys_count": len(self._expired_keys),
-            "last_cleanup": self._last_cleanup.isoformat(),
-            "uptime": (current_time - self._last_cleanup).total_seconds()
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "tags": len(self._tags),
+            "tag_invalidations": self.tag_invalidations,
+            "latency": {
+                "sample_rate": self.LATENCY_SAMPLE_RATE,
+                "get": self._get_latency.snapshot(),
+                "set": self._set_latency.snapshot()
+            },
+            "hot_keys": hot_keys,
+            "disk_enabled": self._disk is not None,
+            "disk_pending": len(self._pending),
+            "last_cleanup": self._last_cleanup.isoformat() if self._last_cleanup else None,
+            "uptime": (datetime.now() - self._created_at).total_seconds()
         }
-        
-    async def _cleanup_task(self):
-        """清理任务"""
-        while True:
-            try:
-                # 等待清理间隔
-                await asyncio.sleep(self.cleanup_interval)
-                
-                # 清理过期数据
-                self._last_cleanup = datetime.now()
-                expired_time = self._last_cleanup - timedelta(seconds=self.ttl)
-                
-                # 清理访问时间记录
-                for key, access_time in list(self._access_times.items()):
-                    if key not in self.cache:
-                        del self._access_times[key]
-                
-                # 清理值大小记录
-                for key in list(self._value_sizes.keys()):
-                    if key not in self.cache:
-                        del self._value_sizes[key]
-                
-                # 清理热点键
-                self._hot_keys = {
-                    key for key in self._hot_keys
-                    if key in self.cache
-                }
-                
-                # 清理过期键记录
-                cutoff_time = datetime.now() - timedelta(days=7)  # 保留7天的记录
-                self._expired_keys = {
-                    key for key in self._expired_keys
-                    if key in self.cache or key in self._access_times
-                }
-                
-                logger.info(f"缓存清理完成 [{self.namespace}]: {len(self.cache)} 个有效键")
-                
-            except Exception as e:
-                logger.error(f"缓存清理失败: {str(e)}")
 
 # 创建默认缓存实例
 try:
@@ -354,66 +1025,512 @@ try:
         strategy=settings.cache.strategy,
         default_ttl=settings.cache.default_ttl,
         maxsize=settings.cache.maxsize,
-        cleanup_interval=settings.cache.cleanup_interval
+        max_bytes=settings.cache.max_memory_mb * 1024 * 1024,
+        cleanup_interval=settings.cache.cleanup_interval,
+        disk_path=settings.cache.disk_path if settings.cache.disk_enabled else None,
+        disk_max_bytes=settings.cache.disk_max_mb * 1024 * 1024
     )
 except Exception as e:
     logger.warning(f"使用默认配置创建缓存: {str(e)}")
     default_cache = CacheManager()
 
+CacheManager._instances[default_cache.namespace] = default_cache
+
+def _snapshot_path(namespace: str) -> str:
+    return os.path.join(settings.cache.snapshot_dir, f"{namespace}.snapshot")
+
+def snapshot_caches() -> Dict[str, int]:
+    """为配置的命名空间写入缓存快照（关闭时调用）"""
+    result = {}
+    for namespace in settings.cache.snapshot_namespaces:
+        manager = CacheManager._instances.get(namespace)
+        if manager is None:
+            continue
+        try:
+            result[namespace] = manager.snapshot(_snapshot_path(namespace))
+        except Exception as e:
+            logger.error(f"写入缓存快照失败 [{namespace}]: {str(e)}")
+    if result:
+        logger.info(f"缓存快照已保存: {result}")
+    return result
+
+def restore_caches() -> Dict[str, int]:
+    """从快照恢复配置的命名空间（启动时调用）"""
+    result = {}
+    for namespace in settings.cache.snapshot_namespaces:
+        manager = CacheManager._instances.get(namespace)
+        if manager is None:
+            continue
+        try:
+            result[namespace] = manager.restore(_snapshot_path(namespace))
+        except Exception as e:
+            logger.error(f"恢复缓存快照失败 [{namespace}]: {str(e)}")
+    if result:
+        logger.info(f"缓存快照已恢复: {result}")
+    return result
+
+# 预热钩子：名称 -> 无参协程函数
+_warmup_hooks: Dict[str, Callable[[], Awaitable[Any]]] = {}
+
+def register_warmup(name: str, hook: Callable[[], Awaitable[Any]]):
+    """注册缓存预热钩子
+    
+    钩子应调用带 @cached 的常用查询，让结果在第一次请求前进入缓存。
+    
+    Args:
+        name: 钩子名称（重复注册会覆盖）
+        hook: 无参协程函数
+    """
+    _warmup_hooks[name] = hook
+
+async def warm_up(timeout: float = 30) -> Dict[str, bool]:
+    """并发执行所有预热钩子，单个钩子失败或超时不影响其他钩子
+    
+    Args:
+        timeout: 每个钩子的超时时间（秒）
+        
+    Returns:
+        每个钩子是否成功
+    """
+    async def run(name: str, hook: Callable[[], Awaitable[Any]]) -> bool:
+        try:
+            await asyncio.wait_for(hook(), timeout)
+            return True
+        except Exception as e:
+            logger.warning(f"缓存预热失败 [{name}]: {str(e) or type(e).__name__}")
+            return False
+            
+    start_time = time.monotonic()
+    names = list(_warmup_hooks)
+    results = await asyncio.gather(*(run(name, _warmup_hooks[name]) for name in names))
+    result = dict(zip(names, results))
+    logger.info(f"缓存预热完成 ({time.monotonic() - start_time:.2f}s): {result}")
+    return result
+
+# 缓存键长度上限，超过时告警并把超出部分替换为摘要
+MAX_KEY_LENGTH = 256
+# 单个参数的表示超过该长度时使用摘要
+MAX_ARG_LENGTH = 64
+
+def _digest(text: str) -> str:
+    """计算短摘要"""
+    return "#" + hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=12).hexdigest()
+
+def _key_part(value: Any) -> str:
+    """把参数转换为稳定的缓存键片段
+    
+    - 标量直接使用 repr，过长的字符串使用摘要
+    - set/frozenset/dict 先排序，list/tuple 保持顺序，拼接后过长则使用摘要
+    - ORM 对象使用 “类名(主键)”，不依赖内存地址
+    - 其他对象可以实现 __cache_key__() 提供自己的键
+    """
+    if value is None or isinstance(value, (bool, int, float)):
+        return repr(value)
+    if isinstance(value, str):
+        return repr(value) if len(value) <= MAX_ARG_LENGTH else _digest(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, (set, frozenset)):
+        text = "{" + ",".join(sorted(_key_part(item) for item in value)) + "}"
+    elif isinstance(value, dict):
+        text = "{" + ",".join(sorted(f"{_key_part(k)}:{_key_part(v)}" for k, v in value.items())) + "}"
+    elif isinstance(value, (list, tuple)):
+        text = "[" + ",".join(_key_part(item) for item in value) + "]"
+    else:
+        key_method = getattr(value, "__cache_key__", None)
+        state = getattr(value, "_sa_instance_state", None)
+        if key_method is not None:
+            text = str(key_method())
+        elif state is not None and state.identity is not None:
+            text = f"{type(value).__name__}{state.identity}"
+        else:
+            text = repr(value)
+    return text if len(text) <= MAX_ARG_LENGTH else _digest(text)
+
+def make_key_builder(
+    func: Callable,
+    prefix: str = "",
+    key_args: Optional[Iterable[str]] = None,
+    max_length: int = MAX_KEY_LENGTH
+) -> Callable[..., str]:
+    """创建缓存键生成函数
+    
+    参数按函数签名绑定（位置参数和关键字参数得到相同的键，默认值也参与），
+    方法的 self/cls 不参与键的生成。
+    
+    Args:
+        func: 被缓存的函数
+        prefix: 缓存键前缀
+        key_args: 参与生成键的参数名，None 表示全部参数
+        max_length: 键长度上限，超过时告警并截断为摘要
+        
+    Returns:
+        接收原函数参数、返回缓存键的函数
+    """
+    signature = inspect.signature(func)
+    names = list(signature.parameters)
+    if names and names[0] in ("self", "cls"):
+        names = names[1:]
+    if key_args is not None:
+        unknown = set(key_args) - set(names)
+        if unknown:
+            raise CacheError(f"缓存键参数不存在 [{func.__qualname__}]: {', '.join(sorted(unknown))}")
+        names = [name for name in names if name in set(key_args)]
+    base = f"{prefix}:{func.__qualname__}"
+    warned = False
+    
+    def build(*args, **kwargs) -> str:
+        nonlocal warned
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        arguments = bound.arguments
+        key = base + "".join(f":{name}={_key_part(arguments[name])}" for name in names)
+        if len(key) > max_length:
+            if not warned:
+                warned = True
+                logger.warning(f"缓存键过长 [{base}]: {len(key)} 字符，已截断为摘要")
+            key = key[:max_length - 26] + _digest(key)
+        return key
+        
+    return build
+
+class RowSnapshot:
+    """ORM 记录的只读快照
+    
+    保存记录的列值和 to_dict() 的结果，脱离数据库会话后仍可安全读取，
+    也可以被磁盘缓存序列化。
+    """
+    
+    __slots__ = ("_model", "_values", "_dict")
+    
+    def __init__(self, model: str, values: Dict[str, Any], data: Dict[str, Any]):
+        object.__setattr__(self, "_model", model)
+        object.__setattr__(self, "_values", values)
+        object.__setattr__(self, "_dict", data)
+        
+    def __getattr__(self, name: str) -> Any:
+        try:
+            return self._values[name]
+        except KeyError:
+            raise AttributeError(f"{self._model} 快照没有属性 {name}") from None
+            
+    def __setattr__(self, name: str, value: Any):
+        raise AttributeError(f"{self._model} 快照是只读的")
+        
+    def __reduce__(self):
+        return (RowSnapshot, (self._model, self._values, self._dict))
+        
+    def __eq__(self, other: Any) -> bool:
+        return (
+            isinstance(other, RowSnapshot)
+            and self._model == other._model
+            and self._values == other._values
+        )
+        
+    def __hash__(self) -> int:
+        return hash((self._model, tuple(sorted(self._values.items(), key=lambda item: item[0]))))
+        
+    def __repr__(self) -> str:
+        return f"<{self._model}Snapshot {self._values}>"
+        
+    def to_dict(self) -> Dict[str, Any]:
+        """返回创建快照时计算的字典（浅拷贝）"""
+        return dict(self._dict)
+
+def snapshot(value: Any) -> Any:
+    """把 ORM 记录（包括列表、元组和字典中的记录）转换为只读快照
+    
+    只读取已加载的列，不会触发数据库查询；非 ORM 值原样返回。
+    """
+    state = getattr(value, "_sa_instance_state", None)
+    if state is not None:
+        loaded = state.dict
+        values = {
+            attr.key: loaded[attr.key]
+            for attr in state.mapper.column_attrs
+            if attr.key in loaded
+        }
+        data = values
+        to_dict = getattr(value, "to_dict", None)
+        if to_dict is not None:
+            try:
+                data = to_dict()
+            except Exception as e:
+                logger.debug(f"生成快照字典失败 [{type(value).__name__}]: {str(e)}")
+        return RowSnapshot(type(value).__name__, values, data)
+    if isinstance(value, list):
+        return [snapshot(item) for item in value]
+    if isinstance(value, tuple) and not hasattr(value, "_fields"):
+        return tuple(snapshot(item) for item in value)
+    if isinstance(value, dict):
+        return {key: snapshot(item) for key, item in value.items()}
+    return value
+
+class CachedResult(NamedTuple):
+    """@cached 存入缓存的结果
+    
+    fresh_until 之前为新鲜值；之后到缓存过期前为陈旧值，可以先返回再后台刷新。
+    """
+    value: Any
+    fresh_until: Optional[float]
+
+class _SyncCall:
+    """同步函数正在执行的调用，供并发的同键调用等待"""
+    
+    __slots__ = ("event", "result", "error")
+    
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+def _on_event_loop() -> bool:
+    """当前线程是否正在运行事件循环"""
+    try:
+        asyncio.get_running_loop()
+        return True
+    except RuntimeError:
+        return False
+
+# 后台刷新任务的引用，避免任务在完成前被回收
+_background_tasks: Set[asyncio.Task] = set()
+
+def _spawn(coro: Awaitable[Any]) -> asyncio.Task:
+    """在后台运行协程并保留引用"""
+    task = asyncio.ensure_future(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    task.add_done_callback(lambda t: t.cancelled() or t.exception())
+    return task
+
 def cached(
     prefix: str = "",
     ttl: Optional[int] = None,
     key_builder: Optional[Callable] = None,
     cache_instance: Optional[CacheManager] = None,
-    track_access: bool = True
+    track_access: bool = True,
+    stale_ttl: int = 0,
+    negative_ttl: Optional[int] = None,
+    key_args: Optional[Iterable[str]] = None,
+    serializer: Optional[Callable[[Any], Any]] = snapshot,
+    tags: Optional[Callable[..., Iterable[str]]] = None
 ):
     """缓存装饰器
     
+    同时支持同步和异步函数。同一个键的并发未命中只会执行一次原函数，
+    其余调用等待同一个结果（singleflight）。同步函数在事件循环线程中被调用时
+    不等待其他线程的执行结果，直接执行原函数，避免阻塞整个事件循环。
+    
     Args:
         prefix: 缓存键前缀
         ttl: 可选的过期时间（秒）
-        key_builder: 可选的缓存键生成函数
+        key_builder: 可选的缓存键生成函数（默认使用 make_key_builder）
         cache_instance: 可选的缓存实例（默认使用全局实例）
         track_access: 是否跟踪访问信息
+        stale_ttl: 过期后仍可返回陈旧值的时间（秒），期间由一个后台任务刷新；0 表示不启用
+        negative_ttl: 结果为 None 时的缓存时间（秒）；None 表示不缓存 None
+        key_args: 参与生成缓存键的参数名，None 表示除 self/cls 外的全部参数
+        serializer: 存入缓存前对结果的转换，默认把 ORM 记录转换为只读快照；
+            None 表示原样缓存。调用方拿到的也是转换后的结果
+        tags: 根据调用参数（与原函数相同）生成失效标签的函数，配合 CacheManager.invalidate_tags 使用
         
     Returns:
         装饰器函数
     """
     def decorator(func):
         cache_manager = cache_instance or default_cache
+        build_key = key_builder or make_key_builder(func, prefix, key_args)
         
-        @wraps(func)
-        async def wrapper(*args, **kwargs):
-            # 生成缓存键
-            if key_builder:
+        def store(cache_key: str, result: Any, entry_tags: Optional[Iterable[str]]):
+            now = time.time()
+            if result is None:
+                if negative_ttl:
+                    cache_manager.set(
+                        cache_key,
+                        CachedResult(None, now + negative_ttl),
+                        ttl=negative_ttl,
+                        track_access=track_access,
+                        tags=entry_tags
+                    )
+                return
+                
+            fresh_ttl = ttl
+            if fresh_ttl is None and cache_manager.strategy == CacheStrategy.TTL:
+                fresh_ttl = cache_manager.default_ttl
+            cache_manager.set(
+                cache_key,
+                CachedResult(result, now + fresh_ttl if fresh_ttl else None),
+                ttl=fresh_ttl + stale_ttl if fresh_ttl else None,
+                track_access=track_access,
+                tags=entry_tags
+            )
+            
+        def make_key(*args, **kwargs) -> Optional[str]:
+            try:
+                return build_key(*args, **kwargs)
+            except Exception as e:
+                logger.error(f"生成缓存键失败: {str(e)}")
+                return None
+                
+        def unwrap(cache_key: str, cached_value: Any) -> Tuple[Optional[str], Any, bool]:
+            if isinstance(cached_value, CachedResult):
+                stale = cached_value.fresh_until is not None and cached_value.fresh_until <= time.time()
+                return cache_key, cached_value.value, stale
+            return cache_key, cached_value, False
+            
+        def lookup(*args, **kwargs) -> Tuple[Optional[str], Any, bool]:
+            """查找缓存，返回 (缓存键, 缓存值或 _MISSING, 是否陈旧)"""
+            cache_key = make_key(*args, **kwargs)
+            if cache_key is None:
+                return None, _MISSING, False
+            return unwrap(cache_key, cache_manager.get(cache_key, _MISSING))
+            
+        async def alookup(*args, **kwargs) -> Tuple[Optional[str], Any, bool]:
+            """异步查找缓存，磁盘层在线程中读取"""
+            cache_key = make_key(*args, **kwargs)
+            if cache_key is None:
+                return None, _MISSING, False
+            return unwrap(cache_key, await cache_manager.aget(cache_key, _MISSING))
+            
+        def finish(cache_key: str, result: Any, epoch: int, args, kwargs) -> Any:
+            if serializer is not None:
+                result = serializer(result)
+            entry_tags = None
+            if tags is not None:
+                if cache_manager.epoch != epoch:
+                    # 执行期间发生过失效，结果可能基于旧数据，不写入缓存
+                    return result
                 try:
-                    cache_key = key_builder(*args, **kwargs)
+                    entry_tags = list(tags(*args, **kwargs))
                 except Exception as e:
-                    logger.error(f"生成缓存键失败: {str(e)}")
-                    return await func(*args, **kwargs)
-            else:
-                cache_key = f"{prefix}:{func.__name__}:{str(args)}:{str(kwargs)}"
+                    # 无法打标签的结果不缓存，避免之后无法失效
+                    logger.error(f"生成缓存标签失败 [{cache_key}]: {str(e)}")
+                    return result
+            store(cache_key, result, entry_tags)
+            return result
             
-            # 尝试从缓存获取
-            cached_value = cache_manager.get(cache_key)
-            if cached_value is not None:
-                return cached_value
+        if inspect.iscoroutinefunction(func):
+            inflight: Dict[str, asyncio.Future] = {}
+            
+            async def load(cache_key: str, future: asyncio.Future, args, kwargs):
+                """执行原函数并把结果交给所有等待者"""
+                try:
+                    epoch = cache_manager.epoch
+                    result = finish(cache_key, await func(*args, **kwargs), epoch, args, kwargs)
+                except asyncio.CancelledError:
+                    future.cancel()
+                    raise
+                except Exception as e:
+                    logger.error(f"执行函数失败 [{cache_key}]: {str(e)}")
+                    future.set_exception(e)
+                    # 异常由调用方处理，标记为已读取避免事件循环告警
+                    future.exception()
+                    raise
+                else:
+                    future.set_result(result)
+                    return result
+                finally:
+                    if inflight.get(cache_key) is future:
+                        del inflight[cache_key]
+                        
+            def start(cache_key: str) -> asyncio.Future:
+                future = asyncio.get_running_loop().create_future()
+                inflight[cache_key] = future
+                return future
+                
+            def refresh_in_background(cache_key: str, args, kwargs):
+                if cache_key in inflight:
+                    return
+                _spawn(load(cache_key, start(cache_key), args, kwargs))
+                
+            @wraps(func)
+            async def wrapper(*args, **kwargs):
+                cache_key, cached_value, stale = await alookup(*args, **kwargs)
+                if cache_key is None:
+                    return await func(*args, **kwargs)
+                if cached_value is not _MISSING:
+                    if stale:
+                        # 陈旧值：先返回，由一个后台任务刷新
+                        refresh_in_background(cache_key, args, kwargs)
+                    return cached_value
+                    
+                # 同一个键已有调用在执行，等待它的结果
+                future = inflight.get(cache_key)
+                if future is not None:
+                    try:
+                        return await asyncio.shield(future)
+                    except asyncio.CancelledError:
+                        # 执行者被取消时由当前调用重新执行，自身被取消则继续抛出
+                        if not future.cancelled():
+                            raise
+                            
+                return await load(cache_key, start(cache_key), args, kwargs)
+                
+            return wrapper
             
-            # 执行原函数
+        sync_inflight: Dict[str, _SyncCall] = {}
+        sync_lock = threading.Lock()
+        
+        def start_sync(cache_key: str) -> Tuple[_SyncCall, bool]:
+            """登记一次调用，返回 (调用, 是否由当前线程执行)"""
+            with sync_lock:
+                call = sync_inflight.get(cache_key)
+                if call is not None:
+                    return call, False
+                call = _SyncCall()
+                sync_inflight[cache_key] = call
+                return call, True
+                
+        def load_sync(cache_key: str, call: _SyncCall, args, kwargs):
             try:
-                result = await func(*args, **kwargs)
-            except Exception as e:
-                logger.error(f"执行函数失败 [{cache_key}]: {str(e)}")
+                epoch = cache_manager.epoch
+                call.result = finish(cache_key, func(*args, **kwargs), epoch, args, kwargs)
+                return call.result
+            except BaseException as e:
+                if isinstance(e, Exception):
+                    logger.error(f"执行函数失败 [{cache_key}]: {str(e)}")
+                call.error = e
                 raise
+            finally:
+                with sync_lock:
+                    if sync_inflight.get(cache_key) is call:
+                        del sync_inflight[cache_key]
+                call.event.set()
+                
+        def refresh_sync(cache_key: str, call: _SyncCall, args, kwargs):
+            try:
+                load_sync(cache_key, call, args, kwargs)
+            except Exception:
+                pass
+                
+        @wraps(func)
+        def sync_wrapper(*args, **kwargs):
+            cache_key, cached_value, stale = lookup(*args, **kwargs)
+            if cache_key is None:
+                return func(*args, **kwargs)
+            if cached_value is not _MISSING:
+                if stale:
+                    call, leader = start_sync(cache_key)
+                    if leader:
+                        threading.Thread(
+                            target=refresh_sync,
+                            args=(cache_key, call, args, kwargs),
+                            daemon=True
+                        ).start()
+                return cached_value
+                
+            call, leader = start_sync(cache_key)
+            if leader:
+                return load_sync(cache_key, call, args, kwargs)
+            if _on_event_loop():
+                # 在事件循环线程中等待会阻塞所有协程，直接执行（结果不写入缓存，由执行者写入），
+                # 与其他调用一样返回转换后的结果
+                result = func(*args, **kwargs)
+                return serializer(result) if serializer is not None else result
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
             
-            # 存入缓存
-            cache_manager.set(
-                cache_key,
-                result,
-                ttl=ttl,
-                track_access=track_access
-            )
-            return result
-            
-        return wrapper
-    return decorator 
\ No newline at end of file
+        return sync_wrapper
+    return decorator
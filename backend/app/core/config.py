@@ -31,16 +31,84 @@ class GoogleDriveSettings(BaseModel):
             v = "data/gdrive_token.json"
         return os.path.normpath(v)
 
+class EventSettings(BaseModel):
+    """变更事件处理配置"""
+    queue_size: int = Field(default=10000, description="事件队列最大长度，队列满时扫描器等待", ge=1)
+    batch_size: int = Field(default=100, description="每批最多事件数", ge=1)
+    batch_timeout: float = Field(default=1.0, description="批次从第一个事件起的最长等待时间（秒）", gt=0)
+    db_concurrency: int = Field(default=2, description="路径解析阶段的并发数", ge=1)
+    symlink_concurrency: int = Field(default=8, description="软链接阶段的并发数", ge=1)
+    emby_concurrency: int = Field(default=2, description="Emby 刷新阶段的并发数", ge=1)
+    lane_weights: Dict[str, int] = Field(
+        default={"live": 8, "scan": 4, "backfill": 1},
+        description="各优先级通道的调度权重（live: 本地监听, scan: 扫描差异, backfill: 回填/重放）"
+    )
+    
+    @validator('lane_weights')
+    def validate_lane_weights(cls, v):
+        weights = {"live": 8, "scan": 4, "backfill": 1}
+        weights.update({lane: weight for lane, weight in v.items() if lane in weights and weight > 0})
+        return weights
+
+class WatchPathSettings(BaseModel):
+    """监控根目录配置"""
+    path: str = Field(description="Google Drive 目录ID")
+    root_path: str = Field(default="", description="该目录在源目录中的相对路径，作为文件记录路径的前缀")
+    scan_interval: Optional[int] = Field(default=None, description="扫描间隔（秒），默认使用 monitor.scan_interval", ge=60)
+    jitter: Optional[float] = Field(default=None, description="扫描间隔的随机抖动比例，默认使用 monitor.scan_jitter", ge=0, le=0.5)
+
+class LocalWatchSettings(BaseModel):
+    """本地文件监控配置"""
+    enabled: bool = Field(default=False, description="监听本地源目录的变更")
+    paths: List[str] = Field(default_factory=list, description="监听的子目录（相对 symlink.source_dir），为空时监听整个源目录")
+    backend: str = Field(default="auto", description="监听方式: auto（FUSE 挂载自动轮询）, inotify, polling")
+    poll_interval: int = Field(default=30, description="轮询间隔（秒）", ge=1)
+    
+    @validator('backend')
+    def validate_backend(cls, v):
+        if v not in ('auto', 'inotify', 'polling'):
+            v = 'auto'
+        return v
+
+class RetentionSettings(BaseModel):
+    """记录保留配置"""
+    enabled: bool = Field(default=True, description="在低峰时段清理不再被任何监控根目录遍历到的记录")
+    max_age_days: int = Field(default=30, description="记录超过多少天没有被检查过才会清理", ge=1)
+    off_peak_start: int = Field(default=2, description="低峰时段开始（本地时间，小时）", ge=0, le=23)
+    off_peak_end: int = Field(default=6, description="低峰时段结束（本地时间，小时，可小于开始时间表示跨零点）", ge=0, le=23)
+    time_budget: int = Field(default=60, description="每次运行的时间预算（秒），用完后下次继续", ge=1)
+    batch_size: int = Field(default=500, description="每批删除的记录数量，每批单独提交", ge=1)
+    check_interval: int = Field(default=600, description="检查是否需要运行的间隔（秒）", ge=10)
+
 class MonitorSettings(BaseModel):
     """监控配置"""
     scan_interval: int = Field(default=300, description="扫描间隔（秒）", ge=60)
+    source_dir: str = Field(default="root", description="监控的 Google Drive 目录ID")
+    watch_paths: List[WatchPathSettings] = Field(default_factory=list, description="额外监控的根目录，与 source_dir 并发扫描")
+    scan_jitter: float = Field(default=0.1, description="扫描间隔的随机抖动比例，避免多个根目录同时扫描", ge=0, le=0.5)
+    max_concurrent_scans: int = Field(default=2, description="同时扫描的根目录数量", ge=1)
+    adaptive_interval: bool = Field(default=True, description="根据变更频率自动调整扫描间隔")
+    min_scan_interval: int = Field(default=30, description="自适应扫描的最短间隔（秒）", ge=5)
+    max_scan_interval: int = Field(default=3600, description="自适应扫描的最长间隔（秒）", ge=60)
+    scan_backoff: float = Field(default=2.0, description="没有变更时扫描间隔的放大倍数", gt=1)
+    scan_batch_size: int = Field(default=500, description="扫描时每批提交的写入数量，提交后立即发出这一批变更", ge=1)
+    list_concurrency: int = Field(default=4, description="扫描时并发列出目录的数量", ge=1)
+    checkpoint_max_age: int = Field(default=86400, description="扫描检查点的最长保留时间（秒），超过后从根目录重新扫描", ge=60)
     google_drive: GoogleDriveSettings = Field(default_factory=GoogleDriveSettings, description="Google Drive 配置")
+    events: EventSettings = Field(default_factory=EventSettings, description="变更事件处理配置")
+    local_watch: LocalWatchSettings = Field(default_factory=LocalWatchSettings, description="本地文件监控配置")
+    retention: RetentionSettings = Field(default_factory=RetentionSettings, description="记录保留配置")
     
     @validator('scan_interval')
     def validate_scan_interval(cls, v):
         if v < 60:
             v = 300
         return v
+        
+    @validator('watch_paths', pre=True)
+    def validate_watch_paths(cls, v):
+        # 允许直接写目录ID
+        return [{"path": item} if isinstance(item, str) else item for item in v or []]
 
 class SymlinkSettings(BaseModel):
     """符号链接配置"""
@@ -73,6 +141,13 @@ class EmbySettings(BaseModel):
     timeout: int = Field(default=30, description="请求超时时间（秒）", ge=1)
     max_retries: int = Field(default=3, description="最大重试次数", ge=0)
     retry_delay: int = Field(default=5, description="重试延迟（秒）", ge=1)
+    max_concurrency: int = Field(default=4, description="最大并发请求数", ge=1)
+    circuit_failure_threshold: int = Field(default=5, description="熔断器打开所需的连续失败次数", ge=1)
+    circuit_reset_timeout: int = Field(default=30, description="熔断器冷却时间（秒）", ge=1)
+    refresh_queue_file: str = Field(default="data/emby_refresh_queue.db", description="刷新队列数据库文件")
+    refresh_batch_size: int = Field(default=50, description="每次刷新请求包含的最大路径数", ge=1)
+    refresh_max_backoff: int = Field(default=600, description="刷新失败最大退避时间（秒）", ge=1)
+    reconcile_interval: int = Field(default=21600, description="媒体库对账间隔（秒），0 表示不定期对账", ge=0)
     
     @validator('server_url')
     def validate_server_url(cls, v):
@@ -120,7 +195,16 @@ class CacheSettings(BaseModel):
     strategy: str = Field(default="ttl", description="缓存策略（ttl 或 lru）")
     default_ttl: int = Field(default=300, description="默认过期时间（秒）", ge=1)
     maxsize: int = Field(default=1000, description="最大缓存条目数", ge=1)
+    max_memory_mb: int = Field(default=64, description="内存缓存最大占用（MB）", ge=1)
     cleanup_interval: int = Field(default=3600, description="清理间隔（秒）", ge=60)
+    disk_enabled: bool = Field(default=False, description="是否启用磁盘缓存")
+    disk_path: str = Field(default="data/cache.db", description="磁盘缓存文件路径")
+    disk_max_mb: int = Field(default=512, description="磁盘缓存最大占用（MB）", ge=1)
+    snapshot_enabled: bool = Field(default=True, description="关闭时保存缓存快照，启动时恢复")
+    snapshot_dir: str = Field(default="data/cache_snapshots", description="缓存快照目录")
+    snapshot_namespaces: List[str] = Field(default=["default"], description="保存快照的缓存命名空间")
+    warmup_enabled: bool = Field(default=True, description="启动时预热常用查询")
+    warmup_timeout: int = Field(default=30, description="单个预热钩子的超时时间（秒）", ge=1)
     
     @validator('strategy')
     def validate_strategy(cls, v):
@@ -3,8 +3,10 @@
 提供数据库连接和会话管理。
 """
 import logging
-from typing import AsyncGenerator
+from typing import AsyncGenerator, Dict, List
 
+from sqlalchemy import inspect, literal, text
+from sqlalchemy.engine import Connection
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 from sqlalchemy.pool import AsyncAdaptedQueuePool
@@ -61,11 +63,65 @@ async def init_db() -> None:
     from .base import Base  # 避免循环导入
     
     async with engine.begin() as conn:
-        # 创建所有表
+        # 创建所有表，已存在的表补齐新增的列和索引
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(migrate_schema)
         
     logger.info("数据库初始化完成")
 
+def _column_ddl(connection: Connection, column) -> str:
+    """ALTER TABLE ADD COLUMN 使用的列定义
+    
+    SQLite 新增的列只能使用常量默认值，非空列必须带默认值；
+    没有常量默认值的列按可空列添加。
+    """
+    dialect = connection.dialect
+    ddl = f"{dialect.identifier_preparer.quote(column.name)} {column.type.compile(dialect=dialect)}"
+    if column.server_default is not None and isinstance(column.server_default.arg, str):
+        value = column.server_default.arg
+    elif column.default is not None and column.default.is_scalar:
+        value = column.default.arg
+    else:
+        return ddl
+    ddl += " DEFAULT " + str(literal(value).compile(dialect=dialect, compile_kwargs={"literal_binds": True}))
+    if not column.nullable:
+        ddl += " NOT NULL"
+    return ddl
+
+def migrate_schema(connection: Connection) -> Dict[str, List[str]]:
+    """为已存在的表补齐模型中新增的列和索引
+    
+    create_all 只创建不存在的表，不会修改已有的表。这里按 PRAGMA table_info 找出
+    模型中有而表中没有的列逐个 ALTER TABLE ADD COLUMN，再补建缺少的索引。
+    主键和唯一列无法用 ADD COLUMN 添加，只记录警告。
+    
+    Args:
+        connection: 同步数据库连接（通过 run_sync 调用）
+        
+    Returns:
+        表名 -> 新增的列名
+    """
+    from .base import Base  # 避免循环导入
+    
+    existing_tables = set(inspect(connection).get_table_names())
+    added: Dict[str, List[str]] = {}
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        columns = {row[1] for row in connection.execute(text(f'PRAGMA table_info("{table.name}")'))}
+        for column in table.columns:
+            if column.name in columns:
+                continue
+            if column.primary_key or column.unique:
+                logger.warning(f"无法为已有的表添加列 [{table.name}.{column.name}]，需要手动迁移")
+                continue
+            connection.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN {_column_ddl(connection, column)}'))
+            added.setdefault(table.name, []).append(column.name)
+            logger.info(f"数据库升级: 为 {table.name} 添加列 {column.name}")
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+    return added
+
 async def get_db_stats() -> dict:
     """
     获取数据库统计信息
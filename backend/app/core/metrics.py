@@ -0,0 +1,135 @@
+"""性能指标模块
+
+提供低开销的统计工具：固定桶延迟直方图和热点键统计。
+"""
+from bisect import bisect_left
+from typing import Dict, List, Optional, Sequence
+
+class LatencyHistogram:
+    """固定桶延迟直方图
+    
+    记录一次耗时只需要一次二分查找和几次加法，分位数按桶上界估算。
+    """
+    
+    # 默认桶上界（秒），覆盖 1 微秒到 1 秒
+    DEFAULT_BOUNDS = (
+        0.000001, 0.0000025, 0.000005,
+        0.00001, 0.000025, 0.00005,
+        0.0001, 0.00025, 0.0005,
+        0.001, 0.0025, 0.005,
+        0.01, 0.025, 0.05,
+        0.1, 0.25, 0.5,
+        1.0
+    )
+    
+    def __init__(self, bounds: Optional[Sequence[float]] = None):
+        """初始化直方图
+        
+        Args:
+            bounds: 递增的桶上界（秒），超过最后一个上界的计入溢出桶
+        """
+        self.bounds = tuple(bounds or self.DEFAULT_BOUNDS)
+        self.reset()
+        
+    def reset(self):
+        """清空统计"""
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        
+    def record(self, seconds: float):
+        """记录一次耗时"""
+        self.counts[bisect_left(self.bounds, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+            
+    def percentile(self, q: float) -> float:
+        """估算分位数（返回所在桶的上界，溢出桶返回最大值）"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return self.bounds[index] if index < len(self.bounds) else self.max
+        return self.max
+        
+    @staticmethod
+    def _label(seconds: float) -> str:
+        if seconds < 0.001:
+            return f"{seconds * 1000000:g}us"
+        if seconds < 1:
+            return f"{seconds * 1000:g}ms"
+        return f"{seconds:g}s"
+        
+    def snapshot(self) -> Dict:
+        """导出统计（只包含非空桶）"""
+        buckets = {}
+        for index, count in enumerate(self.counts):
+            if not count:
+                continue
+            label = (
+                f"<={self._label(self.bounds[index])}"
+                if index < len(self.bounds)
+                else f">{self._label(self.bounds[-1])}"
+            )
+            buckets[label] = count
+        return {
+            "samples": self.count,
+            "avg": self.total / self.count if self.count else 0.0,
+            "max": self.max,
+            "p50": self.percentile(0.5),
+            "p90": self.percentile(0.9),
+            "p99": self.percentile(0.99),
+            "buckets": buckets
+        }
+
+class SpaceSaving:
+    """Space-Saving 热点统计
+    
+    只保留固定数量的计数器。已跟踪的键计数为 O(1)；新键在计数器满时
+    替换计数最小的键并继承它的计数（记为误差上界），从而近似真实的 top-K。
+    """
+    
+    def __init__(self, capacity: int = 64):
+        """初始化热点统计
+        
+        Args:
+            capacity: 计数器数量，应大于需要输出的 K
+        """
+        self.capacity = capacity
+        self._counts: Dict[str, int] = {}
+        self._errors: Dict[str, int] = {}
+        
+    def add(self, key: str, count: int = 1):
+        """记录一次访问"""
+        counts = self._counts
+        if key in counts:
+            counts[key] += count
+            return
+        if len(counts) < self.capacity:
+            counts[key] = count
+            self._errors[key] = 0
+            return
+        victim = min(counts, key=counts.__getitem__)
+        floor = counts.pop(victim)
+        del self._errors[victim]
+        counts[key] = floor + count
+        self._errors[key] = floor
+        
+    def top(self, n: int = 10) -> List[Dict]:
+        """返回计数最高的 n 个键"""
+        items = sorted(self._counts.items(), key=lambda item: item[1], reverse=True)[:n]
+        return [
+            {"key": key, "count": count, "error": self._errors[key]}
+            for key, count in items
+        ]
+        
+    def clear(self):
+        """清空统计"""
+        self._counts.clear()
+        self._errors.clear()
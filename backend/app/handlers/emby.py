@@ -1,8 +1,10 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query, Request
 from typing import List, Optional
 from pydantic import BaseModel
 from app.utils.emby import EmbyClient
-from app.utils.config import get_config
+from app.utils.http import encode_cursor, decode_cursor, etag_response
+from app.modules.emby.service import EmbyService
+from app.modules.emby.reconcile import LibraryReconciler
 
 router = APIRouter(tags=["emby"])
 
@@ -16,41 +18,120 @@ class EmbyLibrary(BaseModel):
     name: str
     path: str
 
-@router.get("/status")
+class RefreshParams(BaseModel):
+    paths: List[str]
+
+class TestParams(BaseModel):
+    server: str
+    api_key: str
+
+@router.get("/emby/status")
 async def check_status():
+    service = EmbyService.get_instance()
+    if not service.is_enabled:
+        return {
+            "code": 0,
+            "data": {"connected": False, "version": None, "server_name": None}
+        }
+        
+    info = await service.client.get_server_info()
     return {
         "code": 0,
         "data": {
-            "connected": True,
-            "version": "4.7.0.0",
-            "server_name": "Emby Server"
+            "connected": bool(info),
+            "version": info.get("Version") if info else None,
+            "server_name": info.get("ServerName") if info else None,
+            "stats": service.stats
         }
     }
 
-@router.get("/libraries")
-async def get_libraries():
+@router.get("/emby/libraries")
+async def get_libraries(request: Request):
+    libraries = await EmbyService.get_instance().get_libraries()
+    return etag_response(request, {
+        "code": 0,
+        "data": libraries
+    })
+
+@router.get("/emby/libraries/{library_id}/items")
+async def get_library_items(
+    request: Request,
+    library_id: str,
+    item_type: Optional[str] = None,
+    sort_by: str = "DateCreated",
+    sort_order: str = Query("Descending", pattern="^(Ascending|Descending)$"),
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000)
+):
+    try:
+        start_index = (decode_cursor(cursor) or [0])[0]
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+        
+    items = await EmbyService.get_instance().get_library_items(
+        library_id=library_id,
+        item_type=item_type,
+        sort_by=sort_by,
+        sort_order=sort_order,
+        limit=limit,
+        start_index=start_index
+    )
+    return etag_response(request, {
+        "code": 0,
+        "data": {
+            "items": items,
+            "next_cursor": encode_cursor([start_index + len(items)]) if len(items) == limit else None
+        }
+    })
+
+@router.post("/emby/refresh")
+async def refresh_by_paths(params: RefreshParams):
+    result = await EmbyService.get_instance().refresh_by_paths(params.paths)
     return {
         "code": 0,
-        "data": []
+        "data": result
     }
 
-@router.post("/refresh")
-async def refresh_by_paths(paths: List[str]):
+@router.post("/emby/refresh/root")
+async def refresh_root():
+    success = await EmbyService.get_instance().refresh_media()
+    if not success:
+        raise HTTPException(status_code=502, detail="刷新 Emby 媒体库失败")
     return {
         "code": 0,
         "data": None
     }
 
-@router.post("/refresh/root")
-async def refresh_root():
+@router.get("/emby/reconcile")
+async def get_reconcile_status():
     return {
         "code": 0,
-        "data": None
+        "data": LibraryReconciler.get_instance().stats
     }
 
-@router.post("/test")
-async def test_connection():
+@router.post("/emby/reconcile")
+async def reconcile(refresh: bool = True):
+    reconciler = LibraryReconciler.get_instance()
+    if reconciler.is_reconciling:
+        raise HTTPException(status_code=409, detail="对账正在进行中")
+    try:
+        result = await reconciler.run(refresh=refresh)
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"对账失败: {str(e)}")
     return {
         "code": 0,
-        "data": None
-    } 
\ No newline at end of file
+        "data": result
+    }
+
+@router.post("/emby/test")
+async def test_connection(params: TestParams):
+    client = EmbyClient(server_url=params.server, api_key=params.api_key, max_retries=1)
+    info = await client.get_server_info()
+    return {
+        "code": 0,
+        "data": {
+            "connected": bool(info),
+            "version": info.get("Version") if info else None,
+            "server_name": info.get("ServerName") if info else None
+        }
+    }
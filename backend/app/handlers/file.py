@@ -1,7 +1,13 @@
-from fastapi import APIRouter, HTTPException
+import asyncio
+from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from typing import List, Optional
 from pydantic import BaseModel
-from app.utils.file import get_file_info, list_directory, batch_operation
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.database import get_db
+from app.modules.database.manager import DatabaseManager
+from app.utils.file import get_file_info, list_directory, batch_operation as run_batch_operation
+from app.utils.http import encode_cursor, decode_cursor, etag_response
 
 router = APIRouter(tags=["files"])
 
@@ -15,39 +21,110 @@ class FileItem(BaseModel):
 class BatchOperationParams(BaseModel):
     operation: str
     paths: List[str]
+    target_path: Optional[str] = None
 
-@router.get("/list")
-async def get_files(path: str):
-    return {
+@router.get("/files")
+async def get_files(
+    request: Request,
+    path: str = "",
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    sort: str = Query("path", pattern="^(path|modified_time|size)$"),
+    order: str = Query("asc", pattern="^(asc|desc)$"),
+    is_directory: Optional[bool] = None,
+    name: Optional[str] = None,
+    file_type: Optional[str] = None,
+    min_size: Optional[int] = Query(None, ge=0),
+    max_size: Optional[int] = Query(None, ge=0),
+    modified_after: Optional[datetime] = None,
+    modified_before: Optional[datetime] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    try:
+        records, next_cursor = await DatabaseManager(db).query_files(
+            path=path,
+            cursor=decode_cursor(cursor),
+            limit=limit,
+            sort=sort,
+            order=order,
+            is_directory=is_directory,
+            name=name,
+            file_type=file_type,
+            min_size=min_size,
+            max_size=max_size,
+            modified_after=modified_after,
+            modified_before=modified_before
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+        
+    return etag_response(request, {
         "code": 0,
         "data": {
-            "files": [],
-            "total": 0
+            "files": [record.to_dict() for record in records],
+            "next_cursor": encode_cursor(next_cursor) if next_cursor else None
         }
-    }
+    })
 
-@router.post("/batch")
+@router.post("/files/batch")
 async def batch_operation(params: BatchOperationParams):
+    result = await asyncio.to_thread(
+        run_batch_operation,
+        params.operation.upper(),
+        params.paths,
+        params.target_path
+    )
     return {
         "code": 0,
-        "data": None
+        "data": result
     }
 
-@router.get("/stats")
-async def get_stats():
+@router.get("/files/stats")
+async def get_stats(db: AsyncSession = Depends(get_db)):
+    summary = await DatabaseManager(db).get_summary()
     return {
         "code": 0,
         "data": {
-            "total": 0,
-            "size": 0
+            "total": summary["total_records"],
+            "size": summary["total_size"],
+            "directories": summary["directories"],
+            "newest_mtime": summary["newest_mtime"]
         }
     }
 
-@router.get("/tree")
-async def get_directory_tree():
-    return {
+@router.get("/files/tree")
+async def get_directory_tree(
+    request: Request,
+    path: str = "",
+    cursor: Optional[str] = None,
+    limit: int = Query(200, ge=1, le=1000),
+    db: AsyncSession = Depends(get_db)
+):
+    manager = DatabaseManager(db)
+    try:
+        records, next_cursor = await manager.list_children(
+            path=path,
+            cursor=decode_cursor(cursor),
+            limit=limit
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+        
+    aggregates = await manager.get_directory_stats([record.path for record in records])
+    tree = []
+    for record in records:
+        item = record.to_dict()
+        stats = aggregates.get(record.path)
+        item["file_count"] = stats.file_count if stats else 0
+        item["dir_count"] = stats.dir_count if stats else 0
+        item["total_size"] = stats.total_size if stats else 0
+        item["newest_mtime"] = stats.newest_mtime.isoformat() if stats and stats.newest_mtime else None
+        tree.append(item)
+        
+    return etag_response(request, {
         "code": 0,
         "data": {
-            "tree": []
+            "tree": tree,
+            "next_cursor": encode_cursor(next_cursor) if next_cursor else None
         }
-    } 
\ No newline at end of file
+    })
@@ -1,7 +1,12 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from typing import List, Optional
 from pydantic import BaseModel
-from app.utils.config import get_config
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.core.database import get_db
+from app.modules.database.manager import DatabaseManager
+from app.utils.http import etag_response
+from app.modules.monitor.service import MonitorService
 
 router = APIRouter(tags=["monitor"])
 
@@ -12,35 +17,61 @@ class MonitorState(BaseModel):
     monitored_paths: List[str] = []
 
 @router.get("/monitor/status")
-async def get_status():
+async def get_status(db: AsyncSession = Depends(get_db)):
+    service = MonitorService.get_instance()
+    stats = service.stats
+    summary = await DatabaseManager(db).get_summary()
     return {
         "code": 0,
         "data": {
-            "is_running": True,
-            "last_check": None,
-            "total_files": 0,
-            "monitored_paths": []
+            "is_running": stats["is_running"],
+            "last_check": stats["last_scan_time"],
+            "total_files": summary["total_records"],
+            "monitored_paths": list(service.roots),
+            "roots": stats["roots"],
+            "last_error": stats["last_error"]
         }
     }
 
 @router.get("/monitor/logs")
-async def get_logs(limit: int = 100):
-    return {
+async def get_logs(request: Request, limit: int = Query(100, ge=1, le=1000)):
+    return etag_response(request, {
         "code": 0,
         "data": {
-            "logs": []
+            "logs": MonitorService.get_instance().get_logs(limit)
         }
-    }
+    })
 
 @router.post("/monitor/start")
 async def start_monitor():
+    try:
+        await MonitorService.get_instance().start()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"启动监控失败: {str(e)}")
     return {
         "code": 0,
         "data": None
     }
 
+@router.post("/monitor/scan")
+async def request_scan(root: Optional[str] = None):
+    service = MonitorService.get_instance()
+    if not service.is_running:
+        raise HTTPException(status_code=400, detail="监控服务未运行")
+    try:
+        roots = service.request_scan(root)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"根目录不存在: {root}")
+    return {
+        "code": 0,
+        "data": {
+            "roots": roots
+        }
+    }
+
 @router.post("/monitor/stop")
 async def stop_monitor():
+    await MonitorService.get_instance().stop()
     return {
         "code": 0,
         "data": None
@@ -48,6 +79,7 @@ async def stop_monitor():
 
 @router.post("/monitor/logs/clear")
 async def clear_logs():
+    MonitorService.get_instance().clear_logs()
     return {
         "code": 0,
         "data": None
@@ -55,11 +87,14 @@ async def clear_logs():
 
 @router.get("/monitor/stats")
 async def get_stats():
+    stats = MonitorService.get_instance().stats
     return {
         "code": 0,
         "data": {
-            "total_checks": 0,
-            "total_changes": 0,
-            "last_check_duration": 0
+            "total_checks": stats["total_scans"],
+            "total_changes": stats["total_changes"],
+            "last_check_duration": stats["last_scan_duration"] or 0,
+            "failed_checks": stats["failed_scans"],
+            "events": stats["event_stats"]
         }
-    } 
\ No newline at end of file
+    }
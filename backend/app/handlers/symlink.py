@@ -1,7 +1,9 @@
-from fastapi import APIRouter, HTTPException
+import asyncio
+from fastapi import APIRouter, HTTPException, Query, Request
 from typing import List, Optional
 from pydantic import BaseModel
-from app.utils.symlink import create_symlink
+from app.modules.symlink.manager import SymlinkManager
+from app.utils.http import encode_cursor, decode_cursor, etag_response
 
 router = APIRouter(tags=["symlink"])
 
@@ -10,41 +12,79 @@ class SymlinkState(BaseModel):
     valid: int
     invalid: int
 
-@router.get("/verify")
-async def verify_symlinks():
-    return {
+class SymlinkCreate(BaseModel):
+    source: str
+    target: str
+
+@router.get("/symlink")
+async def list_symlinks(
+    request: Request,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    valid: Optional[bool] = None,
+    keyword: Optional[str] = None
+):
+    try:
+        after = (decode_cursor(cursor) or [None])[0]
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+        
+    items, next_cursor = SymlinkManager.get_instance().list_page(
+        after=after,
+        limit=limit,
+        valid=valid,
+        keyword=keyword
+    )
+    return etag_response(request, {
         "code": 0,
         "data": {
-            "total": 0,
-            "valid": 0,
-            "invalid": 0
+            "items": items,
+            "next_cursor": encode_cursor([next_cursor]) if next_cursor else None
         }
+    })
+
+@router.get("/symlink/verify")
+async def verify_symlinks():
+    result = await asyncio.to_thread(SymlinkManager.get_instance().verify)
+    return {
+        "code": 0,
+        "data": result
     }
 
-@router.post("/")
-async def create_symlink(data: dict):
+@router.post("/symlink")
+async def create_symlink(data: SymlinkCreate):
+    manager = SymlinkManager.get_instance()
+    if not await asyncio.to_thread(manager.create, data.source, data.target):
+        raise HTTPException(status_code=400, detail="创建软链接失败")
     return {
         "code": 0,
         "data": None
     }
 
-@router.delete("/{id}")
-async def remove_symlink(id: str):
+@router.delete("/symlink/{target:path}")
+async def remove_symlink(target: str):
+    manager = SymlinkManager.get_instance()
+    if not await asyncio.to_thread(manager.remove, f"/{target.lstrip('/')}"):
+        raise HTTPException(status_code=404, detail="软链接不存在")
     return {
         "code": 0,
         "data": None
     }
 
-@router.delete("/")
+@router.delete("/symlink")
 async def clear_symlinks():
+    await asyncio.to_thread(SymlinkManager.get_instance().clear)
     return {
         "code": 0,
         "data": None
     }
 
-@router.post("/rebuild")
+@router.post("/symlink/rebuild")
 async def rebuild_symlinks():
+    success = await SymlinkManager.get_instance().rebuild()
+    if not success:
+        raise HTTPException(status_code=500, detail="部分软链接重建失败")
     return {
         "code": 0,
         "data": None
-    } 
\ No newline at end of file
+    }
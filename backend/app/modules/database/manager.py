@@ -3,17 +3,19 @@
 提供数据库操作的高级接口
 """
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, event
+from sqlalchemy import select, func, event, and_, or_
 from sqlalchemy.sql import text
-from typing import List, Optional, Dict, Type, TypeVar
+from typing import List, Optional, Dict, Tuple, Type, TypeVar
 from datetime import datetime, timedelta
 from loguru import logger
 from contextlib import asynccontextmanager
 import time
-from ...core.cache import cached, cache
+from ...core.cache import cached, default_cache as cache, path_tag, path_tags, file_tag, register_warmup
+from ...core.database import AsyncSessionLocal
 from ...core.base import BaseModel
 from ...core.session import session_manager
-from ..monitor.models import FileRecord
+from ..monitor.models import FileRecord, DirectoryStats, PATH_RANGE_END
+from ..monitor.aggregates import DirectoryAggregates, ROOT_PATH
 from ...core.config import settings
 
 T = TypeVar('T', bound=BaseModel)
@@ -67,9 +69,14 @@ class DatabaseManager:
             logger.error(f"获取记录失败: {str(e)}")
             raise
 
-    @cached(prefix="file", ttl=300)
+    @cached(
+        prefix="file",
+        ttl=3600,
+        negative_ttl=30,
+        tags=lambda self, file_id: [file_tag(file_id)]
+    )
     async def get_file_by_id(self, file_id: str) -> Optional[FileRecord]:
-        """获取单个文件记录（使用缓存）"""
+        """获取单个文件记录（使用缓存，返回只读快照）"""
         try:
             start_time = time.time()
             self.stats["queries"] += 1
@@ -84,39 +91,216 @@ class DatabaseManager:
             logger.error(f"获取文件记录失败: {str(e)}")
             raise
 
-    @cached(prefix="files", ttl=60)
-    async def get_files_by_path(self, path: str) -> List[FileRecord]:
-        """获取指定路径下的文件记录（优化查询）"""
+    @cached(
+        prefix="files",
+        ttl=600,
+        tags=lambda self, path, *args, **kwargs: [path_tag(path)]
+    )
+    async def get_files_by_path(
+        self,
+        path: str,
+        after_path: Optional[str] = None,
+        limit: int = 1000
+    ) -> List[FileRecord]:
+        """获取指定路径下的一页文件记录（按路径排序，after_path 为上一页最后一条的路径）
+        
+        结果经过缓存，记录为只读快照，不能用于修改。
+        """
+        records, _ = await self.query_files(
+            path=path,
+            cursor=[after_path, None] if after_path else None,
+            limit=limit
+        )
+        return records
+        
+    @cached(
+        prefix="tree",
+        ttl=600,
+        tags=lambda self, path="", *args, **kwargs: [path_tag(path)]
+    )
+    async def list_children(
+        self,
+        path: str = "",
+        cursor: Optional[List] = None,
+        limit: int = 200
+    ) -> Tuple[List[FileRecord], Optional[List]]:
+        """获取目录的直接子目录（一页）
+        
+        结果经过缓存，记录为只读快照，不能用于修改。
+        """
+        return await self.query_files(
+            path=path,
+            cursor=cursor,
+            limit=limit,
+            is_directory=True,
+            children_only=True
+        )
+        
+    @staticmethod
+    def _prefix_range(path: str) -> Optional[Tuple[str, str]]:
+        """把路径前缀转换为可以走索引的区间 [prefix, prefix + 最大字符)"""
+        if not path:
+            return None
+        prefix = f"{path.rstrip('/')}/"
+        return prefix, prefix + PATH_RANGE_END
+        
+    @staticmethod
+    def _escape_like(value: str) -> str:
+        """转义 LIKE 通配符，配合 escape='\\' 使用"""
+        return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+    async def query_files(
+        self,
+        path: str = "",
+        cursor: Optional[List] = None,
+        limit: int = 100,
+        sort: str = "path",
+        order: str = "asc",
+        is_directory: Optional[bool] = None,
+        name: Optional[str] = None,
+        children_only: bool = False,
+        file_type: Optional[str] = None,
+        min_size: Optional[int] = None,
+        max_size: Optional[int] = None,
+        modified_after: Optional[datetime] = None,
+        modified_before: Optional[datetime] = None
+    ) -> Tuple[List[FileRecord], Optional[List]]:
+        """游标分页查询文件记录
+        
+        排序、过滤和分页全部在 SQL 中完成，按 (排序字段, id) 做键集分页。
+        路径前缀使用 path >= x AND path < x + 最大字符 的区间条件，
+        配合 (is_directory, path)、(file_type, path) 等组合索引，任意一页都只扫描 limit 行左右。
+        
+        Args:
+            path: 路径前缀
+            cursor: 上一页最后一条记录的 [排序值, id]；按路径排序时 id 可以为空
+            limit: 每页数量
+            sort: 排序字段（path、modified_time、size）
+            order: 排序方向（asc、desc）
+            is_directory: 只返回目录或文件
+            name: 路径包含的关键字
+            children_only: 只返回 path 的直接子项
+            file_type: 文件类型（video、audio、image、document、archive、directory 等）
+            min_size: 最小文件大小（含）
+            max_size: 最大文件大小（含）
+            modified_after: 修改时间下限（含）
+            modified_before: 修改时间上限（不含）
+            
+        Returns:
+            (记录列表, 下一页游标)
+        """
         try:
             start_time = time.time()
             self.stats["queries"] += 1
             
-            stmt = (
-                select(FileRecord)
-                .where(FileRecord.path.like(f"{path}%"))
-                .order_by(FileRecord.path)
-            )
+            sort_column = {
+                "path": FileRecord.path,
+                "modified_time": FileRecord.modified_time,
+                "size": FileRecord.size
+            }.get(sort)
+            if sort_column is None:
+                raise ValueError(f"不支持的排序字段: {sort}")
+            descending = order == "desc"
+            
+            stmt = select(FileRecord)
+            prefix_range = self._prefix_range(path)
+            if prefix_range:
+                lower, upper = prefix_range
+                stmt = stmt.where(FileRecord.path >= lower, FileRecord.path < upper)
+                if children_only:
+                    stmt = stmt.where(FileRecord.path.notlike(f"{self._escape_like(lower)}%/%", escape='\\'))
+            elif children_only:
+                stmt = stmt.where(FileRecord.path.notlike("%/%"))
+            if is_directory is not None:
+                stmt = stmt.where(FileRecord.is_directory == is_directory)
+            if file_type:
+                stmt = stmt.where(FileRecord.file_type == file_type)
+            if min_size is not None:
+                stmt = stmt.where(FileRecord.size >= min_size)
+            if max_size is not None:
+                stmt = stmt.where(FileRecord.size <= max_size)
+            if modified_after is not None:
+                stmt = stmt.where(FileRecord.modified_time >= modified_after)
+            if modified_before is not None:
+                stmt = stmt.where(FileRecord.modified_time < modified_before)
+            if name:
+                stmt = stmt.where(FileRecord.path.contains(name, autoescape=True))
+                
+            if cursor:
+                last_value, last_id = cursor
+                if sort == "modified_time" and last_value is not None:
+                    last_value = datetime.fromisoformat(last_value)
+                if sort == "path":
+                    # 路径唯一，单列比较即可直接定位到索引位置
+                    stmt = stmt.where(sort_column < last_value if descending else sort_column > last_value)
+                elif descending:
+                    stmt = stmt.where(or_(
+                        sort_column < last_value,
+                        and_(sort_column == last_value, FileRecord.id < last_id)
+                    ))
+                else:
+                    stmt = stmt.where(or_(
+                        sort_column > last_value,
+                        and_(sort_column == last_value, FileRecord.id > last_id)
+                    ))
+                    
+            if sort == "path":
+                stmt = stmt.order_by(sort_column.desc() if descending else sort_column.asc())
+            elif descending:
+                stmt = stmt.order_by(sort_column.desc(), FileRecord.id.desc())
+            else:
+                stmt = stmt.order_by(sort_column.asc(), FileRecord.id.asc())
+            stmt = stmt.limit(limit + 1)
+            
             result = await self.session.execute(stmt)
             records = result.scalars().all()
             
+            next_cursor = None
+            if len(records) > limit:
+                records = records[:limit]
+                last = records[-1]
+                last_value = getattr(last, sort)
+                if isinstance(last_value, datetime):
+                    last_value = last_value.isoformat()
+                next_cursor = [last_value, last.id]
+                
             await self._record_query_time("select", start_time, str(stmt))
-            return records
+            return records, next_cursor
         except Exception as e:
-            logger.error(f"获取路径下的文件记录失败: {str(e)}")
+            logger.error(f"分页查询文件记录失败: {str(e)}")
             raise
 
+    async def get_summary(self) -> Dict:
+        """获取文件记录汇总（读取根目录聚合行，不扫描 file_records）"""
+        root = await self.session.get(DirectoryStats, ROOT_PATH)
+        if root is None:
+            has_records = await self.session.scalar(select(FileRecord.id).limit(1))
+            if has_records is None:
+                return {"total_records": 0, "total_size": 0, "directories": 0, "newest_mtime": None}
+            # 已有数据但还没有聚合（升级前写入的记录），全量重建一次
+            await DirectoryAggregates.rebuild(self.session)
+            await self.session.commit()
+            root = await self.session.get(DirectoryStats, ROOT_PATH)
+        return {
+            "total_records": root.file_count + root.dir_count,
+            "total_size": root.total_size,
+            "directories": root.dir_count,
+            "newest_mtime": root.newest_mtime.isoformat() if root.newest_mtime else None
+        }
+        
+    async def get_directory_stats(self, paths: List[str]) -> Dict[str, DirectoryStats]:
+        """批量获取目录聚合统计，没有后代的目录不会出现在结果中"""
+        if not paths:
+            return {}
+        result = await self.session.execute(
+            select(DirectoryStats).where(DirectoryStats.path.in_(paths))
+        )
+        return {row.path: row for row in result.scalars().all()}
+        
     async def get_database_stats(self) -> Dict:
         """获取数据库统计信息"""
         try:
-            # 基本统计
-            result = await self.session.execute(
-                select(
-                    func.count(FileRecord.id).label('total_records'),
-                    func.sum(FileRecord.size).label('total_size'),
-                    func.count(FileRecord.id).filter(FileRecord.is_directory).label('directories')
-                )
-            )
-            stats = result.first()
+            summary = await self.get_summary()
             
             # 性能统计
             performance_stats = {
@@ -130,11 +314,7 @@ class DatabaseManager:
             }
             
             return {
-                "database": {
-                    "total_records": stats.total_records or 0,
-                    "total_size": stats.total_size or 0,
-                    "directories": stats.directories or 0
-                },
+                "database": summary,
                 "performance": performance_stats
             }
         except Exception as e:
@@ -146,6 +326,8 @@ class DatabaseManager:
         try:
             updated = 0
             inserted = 0
+            aggregates = DirectoryAggregates()
+            changed_tags = set()
             
             # 分批处理更新
             for i in range(0, len(records), self.batch_size):
@@ -163,20 +345,30 @@ class DatabaseManager:
                 
                 # 更新或插入记录
                 for record in batch:
+                    changed_tags.add(file_tag(record['file_id']))
+                    if record.get('path'):
+                        changed_tags.update(path_tags(record['path']))
                     if record['file_id'] in existing_map:
                         # 更新现有记录
                         existing_record = existing_map[record['file_id']]
+                        changed_tags.update(path_tags(existing_record.path))
+                        aggregates.remove_record(existing_record)
                         for key, value in record.items():
                             setattr(existing_record, key, value)
+                        aggregates.add_record(existing_record)
                         updated += 1
                     else:
                         # 插入新记录
-                        self.session.add(FileRecord(**record))
+                        new_record = FileRecord(**record)
+                        self.session.add(new_record)
+                        aggregates.add_record(new_record)
                         inserted += 1
                 
                 await self.session.flush()
             
+            await aggregates.flush(self.session)
             await self.session.commit()
+            await cache.ainvalidate_tags(*changed_tags)
             return {"updated": updated, "inserted": inserted}
             
         except Exception as e:
@@ -201,4 +393,11 @@ class DatabaseManager:
             logger.info("数据库优化完成")
         except Exception as e:
             logger.error(f"数据库优化失败: {str(e)}")
-            raise 
\ No newline at end of file
+            raise
+
+async def _warm_top_level():
+    """预热顶层目录列表"""
+    async with AsyncSessionLocal() as session:
+        await DatabaseManager(session).list_children()
+
+register_warmup("top_level_directories", _warm_top_level)
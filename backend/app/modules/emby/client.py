@@ -6,7 +6,7 @@ from typing import Optional, Dict, List
 from loguru import logger
 
 from app.utils.emby import EmbyClient, EmbyError
-from app.core.config import EmbyConfig
+from app.core.config import EmbySettings
 
 class EmbyServiceClient(EmbyClient):
     """Emby 服务客户端
@@ -14,7 +14,7 @@ class EmbyServiceClient(EmbyClient):
     扩展基础客户端，提供更多业务相关的功能。
     """
     
-    def __init__(self, config: EmbyConfig):
+    def __init__(self, config: EmbySettings):
         """初始化客户端
         
         Args:
@@ -31,7 +31,10 @@ class EmbyServiceClient(EmbyClient):
             api_key=config.api_key,
             timeout=config.timeout or 30,
             max_retries=config.max_retries or 3,
-            retry_delay=config.retry_delay or 5
+            retry_delay=config.retry_delay or 5,
+            max_concurrency=config.max_concurrency or 4,
+            failure_threshold=config.circuit_failure_threshold or 5,
+            reset_timeout=config.circuit_reset_timeout or 30
         )
         self.config = config
         
@@ -49,9 +52,51 @@ class EmbyServiceClient(EmbyClient):
             "last_error": str(self._last_error) if self._last_error else None,
             "server_url": self.server_url,
             "timeout": self.timeout,
-            "max_retries": self.max_retries
+            "max_retries": self.max_retries,
+            "max_concurrency": self.max_concurrency,
+            "circuit_breaker": self.breaker.stats
         }
         
+    def is_library_path(self, path: str) -> bool:
+        """检查路径是否在配置的媒体库路径中
+        
+        Args:
+            path: 媒体路径
+            
+        Returns:
+            是否属于已配置的媒体库
+        """
+        path = path.replace('\\', '/')
+        return any(
+            path.startswith(lib_path.replace('\\', '/'))
+            for lib_path in self.config.library_paths
+        )
+        
+    async def fetch_libraries(self) -> List[Dict]:
+        """获取所有媒体库
+        
+        与 get_libraries 不同，请求失败时直接抛出异常，避免把失败结果当作空列表缓存。
+        
+        Returns:
+            媒体库列表
+            
+        Raises:
+            EmbyError: 请求失败
+        """
+        self._request_count += 1
+        result = await self._make_request(
+            'GET',
+            '/Items',
+            params={'IncludeItemTypes': 'CollectionFolder', 'Recursive': 'false'}
+        )
+        return [{
+            'id': item['Id'],
+            'name': item['Name'],
+            'type': item.get('CollectionType', 'unknown'),
+            'path': item.get('Path', ''),
+            'item_count': item.get('ChildCount', 0)
+        } for item in result.get('Items', [])]
+        
     async def get_libraries(self) -> List[Dict]:
         """获取所有媒体库
         
@@ -59,18 +104,7 @@ class EmbyServiceClient(EmbyClient):
             媒体库列表
         """
         try:
-            self._request_count += 1
-            items = await self.get_items(
-                include_item_types=['CollectionFolder']
-            )
-            return [{
-                'id': item['Id'],
-                'name': item['Name'],
-                'type': item.get('CollectionType', 'unknown'),
-                'path': item.get('Path', ''),
-                'item_count': item.get('ChildCount', 0)
-            } for item in items]
-            
+            return await self.fetch_libraries()
         except Exception as e:
             self._error_count += 1
             self._last_error = str(e)
@@ -90,11 +124,7 @@ class EmbyServiceClient(EmbyClient):
             self._request_count += 1
             # 检查路径是否在配置的媒体库路径中
             path = path.replace('\\', '/')
-            valid = any(
-                path.startswith(lib_path.replace('\\', '/'))
-                for lib_path in self.config.library_paths
-            )
-            if not valid:
+            if not self.is_library_path(path):
                 logger.warning(f"路径不在配置的媒体库中: {path}")
                 return False
                 
@@ -143,7 +173,8 @@ class EmbyServiceClient(EmbyClient):
         item_type: Optional[str] = None,
         sort_by: str = 'DateCreated',
         sort_order: str = 'Descending',
-        limit: Optional[int] = None
+        limit: Optional[int] = None,
+        start_index: Optional[int] = None
     ) -> List[Dict]:
         """获取媒体库中的项目
         
@@ -153,6 +184,7 @@ class EmbyServiceClient(EmbyClient):
             sort_by: 排序字段
             sort_order: 排序顺序
             limit: 限制数量
+            start_index: 起始位置
             
         Returns:
             媒体项列表
@@ -164,7 +196,8 @@ class EmbyServiceClient(EmbyClient):
                 recursive=True,
                 sort_by=sort_by,
                 sort_order=sort_order,
-                limit=limit
+                limit=limit,
+                start_index=start_index
             )
             return [{
                 'id': item['Id'],
@@ -0,0 +1,194 @@
+"""Emby 刷新队列模块
+
+提供基于 SQLite 的持久化刷新队列，保证 Emby 不可用期间的刷新请求不会丢失。
+"""
+import asyncio
+import os
+import random
+import sqlite3
+import threading
+import time
+from typing import Dict, List
+
+from loguru import logger
+
+class RefreshQueue:
+    """持久化刷新队列
+    
+    以路径为主键保存待刷新的媒体路径，重复入队自动合并。
+    失败的路径按指数退避重新调度，直到刷新成功为止。
+    """
+    
+    def __init__(
+        self,
+        db_file: str = "data/emby_refresh_queue.db",
+        base_delay: float = 5,
+        max_delay: float = 600
+    ):
+        """初始化刷新队列
+        
+        Args:
+            db_file: 队列数据库文件路径
+            base_delay: 首次重试延迟（秒）
+            max_delay: 最大重试延迟（秒）
+        """
+        self.db_file = db_file
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._lock = threading.Lock()
+        
+        directory = os.path.dirname(db_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            
+        self._conn = sqlite3.connect(db_file, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS refresh_queue (
+                path TEXT PRIMARY KEY,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt REAL NOT NULL,
+                enqueued_at REAL NOT NULL,
+                last_error TEXT
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_refresh_next_attempt ON refresh_queue (next_attempt)"
+        )
+        
+        # 统计信息
+        self._enqueued = 0
+        self._completed = 0
+        self._retried = 0
+        
+    @property
+    def stats(self) -> Dict:
+        """获取队列统计信息"""
+        return {
+            "pending": self.size(),
+            "enqueued": self._enqueued,
+            "completed": self._completed,
+            "retried": self._retried
+        }
+        
+    def size(self) -> int:
+        """获取队列中待刷新的路径数量"""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM refresh_queue").fetchone()[0]
+            
+    def _enqueue(self, paths: List[str]) -> int:
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                # 已在队列中的路径立即可刷新，但保留其重试次数
+                self._conn.executemany(
+                    """
+                    INSERT INTO refresh_queue (path, attempts, next_attempt, enqueued_at)
+                    VALUES (?, 0, ?, ?)
+                    ON CONFLICT(path) DO UPDATE SET next_attempt = MIN(next_attempt, excluded.next_attempt)
+                    """,
+                    [(path, now, now) for path in paths]
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        self._enqueued += len(paths)
+        return len(paths)
+        
+    def _due(self, limit: int) -> List[str]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path FROM refresh_queue WHERE next_attempt <= ? ORDER BY next_attempt LIMIT ?",
+                (time.time(), limit)
+            ).fetchall()
+        return [row[0] for row in rows]
+        
+    def _complete(self, paths: List[str]):
+        with self._lock:
+            self._conn.executemany(
+                "DELETE FROM refresh_queue WHERE path = ?",
+                [(path,) for path in paths]
+            )
+        self._completed += len(paths)
+        
+    def _retry(self, paths: List[str], error: str):
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                for path in paths:
+                    row = self._conn.execute(
+                        "SELECT attempts FROM refresh_queue WHERE path = ?", (path,)
+                    ).fetchone()
+                    if row is None:
+                        continue
+                    attempts = row[0] + 1
+                    delay = min(self.max_delay, self.base_delay * (2 ** (attempts - 1)))
+                    # 加入抖动，避免恢复时所有路径同时重试
+                    delay *= random.uniform(0.8, 1.2)
+                    self._conn.execute(
+                        "UPDATE refresh_queue SET attempts = ?, next_attempt = ?, last_error = ? WHERE path = ?",
+                        (attempts, now + delay, error, path)
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        self._retried += len(paths)
+        
+    def _next_due_in(self) -> float:
+        with self._lock:
+            row = self._conn.execute("SELECT MIN(next_attempt) FROM refresh_queue").fetchone()
+        if row[0] is None:
+            return float("inf")
+        return max(0.0, row[0] - time.time())
+        
+    async def enqueue(self, paths: List[str]) -> int:
+        """加入待刷新路径
+        
+        Args:
+            paths: 媒体路径列表
+            
+        Returns:
+            入队的路径数量
+        """
+        paths = list(dict.fromkeys(p for p in paths if p))
+        if not paths:
+            return 0
+        return await asyncio.to_thread(self._enqueue, paths)
+        
+    async def due(self, limit: int = 50) -> List[str]:
+        """获取已到重试时间的路径
+        
+        Args:
+            limit: 最大返回数量
+            
+        Returns:
+            路径列表
+        """
+        return await asyncio.to_thread(self._due, limit)
+        
+    async def complete(self, paths: List[str]):
+        """标记路径刷新成功并移出队列"""
+        if paths:
+            await asyncio.to_thread(self._complete, paths)
+            
+    async def retry(self, paths: List[str], error: str):
+        """标记路径刷新失败，按指数退避重新调度"""
+        if paths:
+            await asyncio.to_thread(self._retry, paths, error)
+            logger.debug(f"{len(paths)} 个路径刷新失败，已重新调度: {error}")
+            
+    async def next_due_in(self) -> float:
+        """距离下一个路径可刷新的时间（秒），队列为空时返回 inf"""
+        return await asyncio.to_thread(self._next_due_in)
+        
+    def close(self):
+        """关闭队列数据库"""
+        with self._lock:
+            self._conn.close()
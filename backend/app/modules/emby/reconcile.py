@@ -0,0 +1,249 @@
+"""Emby 对账模块
+
+比对 Emby 中的媒体项路径与本地软链接，只针对差异路径发起刷新。
+"""
+import asyncio
+import os
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from loguru import logger
+
+from app.core.config import settings
+from app.modules.emby.service import EmbyService
+from app.modules.symlink.manager import SymlinkManager
+from app.utils.path import normalize_path
+
+def _sort_key(path: str) -> str:
+    """排序键：让 '/' 排在所有字符之前，保证目录紧跟其子路径"""
+    return path.replace('/', '\0')
+
+class LibraryReconciler:
+    """媒体库对账器
+    
+    分页拉取 Emby 全部媒体项路径，与软链接目标按相同顺序归并比对：
+    - missing: 存在软链接但 Emby 中没有对应媒体项
+    - stale: Emby 中存在但软链接已不存在的媒体项
+    只对这两类路径发送定向刷新，避免触发整库刷新。
+    
+    按 emby.reconcile_interval 在后台定期执行，也可以通过接口手动触发；
+    同一时间只执行一次对账。
+    """
+    
+    _instance = None
+    
+    @classmethod
+    def get_instance(cls) -> 'LibraryReconciler':
+        """获取对账器实例（单例）"""
+        if cls._instance is None:
+            cls._instance = cls(EmbyService.get_instance(), SymlinkManager.get_instance())
+        return cls._instance
+        
+    def __init__(
+        self,
+        emby_service: EmbyService,
+        symlink_manager: SymlinkManager,
+        page_size: int = 1000
+    ):
+        """初始化对账器
+        
+        Args:
+            emby_service: Emby 服务
+            symlink_manager: 软链接管理器
+            page_size: 拉取 Emby 媒体项的分页大小
+        """
+        self.emby_service = emby_service
+        self.symlink_manager = symlink_manager
+        self.page_size = page_size
+        
+        # 本地路径前缀 -> Emby 路径前缀
+        self.path_mapping = {
+            normalize_path(local).rstrip('/'): normalize_path(remote).rstrip('/')
+            for local, remote in settings.emby.path_mapping.items()
+        }
+        self.target_root = normalize_path(os.path.abspath(settings.symlink.target_dir)).rstrip('/')
+        
+        self._task: Optional[asyncio.Task] = None
+        self._running = False
+        self._run_lock = asyncio.Lock()
+        
+        # 统计信息
+        self._run_count = 0
+        self._last_run_time = None
+        self._last_result = None
+        self._last_error = None
+        
+    @property
+    def is_reconciling(self) -> bool:
+        """是否正在对账"""
+        return self._run_lock.locked()
+        
+    @property
+    def stats(self) -> Dict:
+        """获取对账统计信息"""
+        result = self._last_result or {}
+        return {
+            "is_running": self._running,
+            "is_reconciling": self.is_reconciling,
+            "run_count": self._run_count,
+            "last_run_time": self._last_run_time.isoformat() if self._last_run_time else None,
+            "last_duration": result.get("duration"),
+            "last_missing": len(result.get("missing", [])),
+            "last_stale": len(result.get("stale", [])),
+            "last_error": str(self._last_error) if self._last_error else None
+        }
+        
+    async def start(self):
+        """启动定期对账"""
+        if self._running:
+            return
+        self._running = True
+        self._task = asyncio.create_task(self._loop())
+        logger.info("Emby 定期对账已启动")
+        
+    async def stop(self):
+        """停止定期对账"""
+        if not self._running:
+            return
+        self._running = False
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        logger.info("Emby 定期对账已停止")
+        
+    async def _loop(self):
+        interval = settings.emby.reconcile_interval
+        while self._running:
+            await asyncio.sleep(interval)
+            try:
+                if await self.emby_service.ensure_ready():
+                    await self.run()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Emby 定期对账出错: {str(e)}")
+                
+                
+    def _to_local(self, path: str) -> str:
+        """将 Emby 路径转换为本地路径"""
+        path = normalize_path(path)
+        for local, remote in self.path_mapping.items():
+            if path == remote or path.startswith(remote + '/'):
+                return local + path[len(remote):]
+        return path
+        
+    def _to_emby(self, path: str) -> str:
+        """将本地路径转换为 Emby 路径"""
+        for local, remote in self.path_mapping.items():
+            if path == local or path.startswith(local + '/'):
+                return remote + path[len(local):]
+        return path
+        
+    def _is_managed(self, path: str) -> bool:
+        """是否位于软链接目标目录下"""
+        return path.startswith(self.target_root + '/')
+        
+    async def _collect_emby_paths(self) -> List[str]:
+        """分页拉取 Emby 媒体项路径，只保留软链接目标目录下的路径"""
+        paths = []
+        async for path in self.emby_service.client.iter_item_paths(self.page_size):
+            local = self._to_local(path)
+            if self._is_managed(local):
+                paths.append(local)
+        paths.sort(key=_sort_key)
+        return paths
+        
+    def _merge(self, emby_paths: List[str], link_paths: List[str]) -> Dict[str, List[str]]:
+        """归并比对两个已排序的路径列表"""
+        missing = []
+        stale = []
+        i = j = 0
+        while i < len(emby_paths) or j < len(link_paths):
+            if i >= len(emby_paths):
+                missing.append(link_paths[j])
+                j += 1
+                continue
+            if j >= len(link_paths):
+                stale.append(emby_paths[i])
+                i += 1
+                continue
+                
+            emby_path = emby_paths[i]
+            link_path = link_paths[j]
+            if emby_path == link_path:
+                i += 1
+                j += 1
+            elif _sort_key(emby_path) < _sort_key(link_path):
+                # 剧集、季等目录型媒体项，只要其下仍有软链接就视为有效
+                if not link_path.startswith(emby_path + '/'):
+                    stale.append(emby_path)
+                i += 1
+            else:
+                missing.append(link_path)
+                j += 1
+                
+        return {"missing": missing, "stale": stale}
+        
+    async def run(self, refresh: bool = True) -> Optional[Dict]:
+        """执行一次对账
+        
+        Args:
+            refresh: 是否对差异路径发起定向刷新
+            
+        Returns:
+            对账结果；Emby 未启用时返回 None
+        """
+        if not self.emby_service.is_enabled:
+            logger.info("Emby 服务未启用，跳过对账")
+            return None
+            
+        async with self._run_lock:
+            return await self._run(refresh)
+            
+    async def _run(self, refresh: bool) -> Dict:
+        start_time = time.monotonic()
+        self._run_count += 1
+        self._last_run_time = datetime.now()
+        
+        try:
+            emby_paths = await self._collect_emby_paths()
+        except Exception as e:
+            self._last_error = e
+            logger.error(f"拉取 Emby 媒体项失败，放弃本次对账: {str(e)}")
+            raise
+            
+        # 检查软链接源文件需要逐个 stat，放到线程中执行
+        targets = await asyncio.to_thread(self.symlink_manager.sorted_targets)
+        link_paths = sorted(
+            (p for p in map(normalize_path, targets) if self._is_managed(p)),
+            key=_sort_key
+        )
+        diff = self._merge(emby_paths, link_paths)
+        
+        refreshed = 0
+        if refresh and (diff["missing"] or diff["stale"]):
+            # 缺失的媒体项直接刷新其路径；失效的媒体项刷新父目录让 Emby 移除
+            refresh_paths = [self._to_emby(p) for p in diff["missing"]]
+            refresh_paths.extend(
+                self._to_emby(os.path.dirname(p)) for p in diff["stale"]
+            )
+            result = await self.emby_service.refresh_by_paths(list(dict.fromkeys(refresh_paths)))
+            refreshed = result["success"]
+            
+        result = {
+            "emby_items": len(emby_paths),
+            "symlinks": len(link_paths),
+            "missing": diff["missing"],
+            "stale": diff["stale"],
+            "refreshed": refreshed,
+            "duration": round(time.monotonic() - start_time, 3)
+        }
+        self._last_result = result
+        self._last_error = None
+        logger.info(
+            f"Emby 对账完成: 媒体项 {result['emby_items']} 个，软链接 {result['symlinks']} 个，"
+            f"缺失 {len(diff['missing'])} 个，失效 {len(diff['stale'])} 个，耗时 {result['duration']}s"
+        )
+        return result
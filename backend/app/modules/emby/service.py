@@ -2,12 +2,22 @@
 
 提供 Emby 服务相关功能。
 """
+import asyncio
 from typing import Optional, Dict, List
 from datetime import datetime
 from loguru import logger
 
-from app.core.config import EmbyConfig
+from app.core.cache import cached, register_warmup
+from app.core.config import EmbySettings, settings
 from app.modules.emby.client import EmbyServiceClient
+from app.modules.emby.queue import RefreshQueue
+from app.utils.emby import CircuitOpenError
+
+# 媒体库列表的缓存标签
+LIBRARIES_CACHE_TAG = "emby:libraries"
+
+# 未就绪时两次重新初始化之间的最短间隔（秒），避免服务器不可达时每个请求都去连接
+REINITIALIZE_INTERVAL = 30
 
 class EmbyService:
     """Emby 服务
@@ -15,7 +25,16 @@ class EmbyService:
     提供 Emby 服务相关功能的实现。
     """
     
-    def __init__(self, config: EmbyConfig):
+    _instance = None
+    
+    @classmethod
+    def get_instance(cls) -> 'EmbyService':
+        """获取 Emby 服务实例（单例）"""
+        if cls._instance is None:
+            cls._instance = cls(settings.emby)
+        return cls._instance
+        
+    def __init__(self, config: EmbySettings):
         """初始化服务
         
         Args:
@@ -24,8 +43,18 @@ class EmbyService:
         self.config = config
         self.client = EmbyServiceClient(config) if config.api_key else None
         
+        # 持久化刷新队列
+        self.refresh_queue = RefreshQueue(
+            db_file=config.refresh_queue_file,
+            base_delay=config.retry_delay,
+            max_delay=config.refresh_max_backoff
+        ) if self.client else None
+        self._refresh_task = None
+        self._refresh_wakeup = asyncio.Event()
+        
         # 服务状态
         self._is_ready = False
+        self._init_lock = asyncio.Lock()
         self._last_check = None
         self._error_count = 0
         self._last_error = None
@@ -49,7 +78,8 @@ class EmbyService:
             "last_check": self._last_check.isoformat() if self._last_check else None,
             "error_count": self._error_count,
             "last_error": str(self._last_error) if self._last_error else None,
-            "client_stats": self.client.stats if self.client else None
+            "client_stats": self.client.stats if self.client else None,
+            "refresh_queue": self.refresh_queue.stats if self.refresh_queue else None
         }
         
     async def initialize(self) -> bool:
@@ -75,7 +105,7 @@ class EmbyService:
                 return False
                 
             # 获取媒体库列表
-            libraries = await self.client.get_libraries()
+            libraries = await self._load_libraries()
             if not libraries:
                 self._error_count += 1
                 self._last_error = "获取媒体库列表失败"
@@ -95,6 +125,7 @@ class EmbyService:
                     
             self._is_ready = True
             self._last_error = None
+            self.start_refresh_worker()
             return True
             
         except Exception as e:
@@ -130,18 +161,152 @@ class EmbyService:
             logger.error(f"刷新媒体失败: {str(e)}")
             return False
             
+    async def refresh_by_paths(self, paths: List[str]) -> Dict:
+        """批量刷新媒体路径
+        
+        路径写入持久化队列后立即返回，由后台任务合并发送；
+        Emby 不可用时路径保留在队列中，恢复后按指数退避补发。
+        
+        Args:
+            paths: 媒体路径列表
+            
+        Returns:
+            入队结果，包含成功、失败数量和已入队的路径；写入队列失败时 error 为错误信息
+        """
+        if not self.is_enabled:
+            logger.info("Emby 服务未启用，跳过媒体刷新")
+            return {"success": 0, "failed": 0, "processed": []}
+            
+        valid_paths = []
+        for path in dict.fromkeys(paths):
+            path = path.replace('\\', '/')
+            if self.client.is_library_path(path):
+                valid_paths.append(path)
+            else:
+                logger.warning(f"路径不在配置的媒体库中: {path}")
+                
+        try:
+            await self.refresh_queue.enqueue(valid_paths)
+            self.start_refresh_worker()
+            self._refresh_wakeup.set()
+        except Exception as e:
+            self._error_count += 1
+            self._last_error = str(e)
+            logger.error(f"写入刷新队列失败: {str(e)}")
+            return {"success": 0, "failed": len(paths), "processed": [], "error": str(e)}
+            
+        return {
+            "success": len(valid_paths),
+            "failed": len(paths) - len(valid_paths),
+            "processed": valid_paths
+        }
+        
+    def start_refresh_worker(self):
+        """启动刷新队列后台任务"""
+        if not self.refresh_queue:
+            return
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._drain_refresh_queue())
+            
+    async def stop_refresh_worker(self):
+        """停止刷新队列后台任务，未完成的路径保留在队列中"""
+        if self._refresh_task:
+            self._refresh_task.cancel()
+            try:
+                await self._refresh_task
+            except asyncio.CancelledError:
+                pass
+            self._refresh_task = None
+            
+    async def close(self):
+        """停止刷新任务并关闭刷新队列（应用关闭时调用）"""
+        await self.stop_refresh_worker()
+        if self.refresh_queue:
+            self.refresh_queue.close()
+            
+    async def _wait_for_refresh(self, timeout: float):
+        """等待新路径入队或超时"""
+        try:
+            await asyncio.wait_for(self._refresh_wakeup.wait(), timeout=max(timeout, 0.1))
+        except asyncio.TimeoutError:
+            pass
+        self._refresh_wakeup.clear()
+        
+    async def _drain_refresh_queue(self):
+        """持续消费刷新队列"""
+        while True:
+            try:
+                # 熔断期间不发请求，等待冷却结束
+                if self.client.breaker.is_open:
+                    await asyncio.sleep(self.client.breaker.retry_after)
+                    continue
+                    
+                paths = await self.refresh_queue.due(self.config.refresh_batch_size)
+                if not paths:
+                    next_due = await self.refresh_queue.next_due_in()
+                    await self._wait_for_refresh(min(next_due, self.config.refresh_delay))
+                    continue
+                    
+                try:
+                    await self.client.notify_media_updated(paths)
+                    await self.refresh_queue.complete(paths)
+                    logger.info(f"Emby 刷新成功: {len(paths)} 个路径")
+                except CircuitOpenError:
+                    # 路径不计入重试次数。半开状态下探测请求还没返回时熔断器既不是打开状态
+                    # 也不放行请求，先等待再重试，避免反复查询队列空转
+                    await asyncio.sleep(max(self.client.breaker.retry_after, 1))
+                    continue
+                except Exception as e:
+                    self._error_count += 1
+                    self._last_error = str(e)
+                    await self.refresh_queue.retry(paths, str(e))
+                    
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"处理刷新队列出错: {str(e)}")
+                self._last_error = str(e)
+                await asyncio.sleep(self.config.refresh_delay)
+                
+    async def ensure_ready(self) -> bool:
+        """服务未就绪时重新初始化（启动时服务器不可达、或未启用缓存预热时）
+        
+        并发调用只初始化一次，两次尝试之间至少间隔 REINITIALIZE_INTERVAL 秒。
+        
+        Returns:
+            服务是否就绪
+        """
+        if self._is_ready:
+            return True
+        async with self._init_lock:
+            if self._is_ready:
+                return True
+            if self._last_check and (datetime.now() - self._last_check).total_seconds() < REINITIALIZE_INTERVAL:
+                return False
+            return await self.initialize()
+            
+    @cached(
+        prefix="emby",
+        ttl=300,
+        stale_ttl=600,
+        tags=lambda self: [LIBRARIES_CACHE_TAG]
+    )
+    async def _load_libraries(self) -> List[Dict]:
+        """从服务器加载媒体库列表（缓存，失败时抛出异常且不缓存）"""
+        return await self.client.fetch_libraries()
+        
     async def get_libraries(self) -> List[Dict]:
         """获取媒体库列表
         
         Returns:
             媒体库列表
         """
-        if not self._is_ready:
+        if not await self.ensure_ready():
             logger.warning("Emby 服务未就绪")
             return []
             
         try:
-            return await self.client.get_libraries()
+            return await self._load_libraries()
         except Exception as e:
             self._error_count += 1
             self._last_error = str(e)
@@ -154,7 +319,8 @@ class EmbyService:
         item_type: Optional[str] = None,
         sort_by: str = 'DateCreated',
         sort_order: str = 'Descending',
-        limit: Optional[int] = None
+        limit: Optional[int] = None,
+        start_index: Optional[int] = None
     ) -> List[Dict]:
         """获取媒体库中的项目
         
@@ -164,11 +330,12 @@ class EmbyService:
             sort_by: 排序字段
             sort_order: 排序顺序
             limit: 限制数量
+            start_index: 起始位置
             
         Returns:
             媒体项列表
         """
-        if not self._is_ready:
+        if not await self.ensure_ready():
             logger.warning("Emby 服务未就绪")
             return []
             
@@ -178,7 +345,8 @@ class EmbyService:
                 item_type=item_type,
                 sort_by=sort_by,
                 sort_order=sort_order,
-                limit=limit
+                limit=limit,
+                start_index=start_index
             )
         except Exception as e:
             self._error_count += 1
@@ -195,7 +363,7 @@ class EmbyService:
         Returns:
             媒体项详细信息
         """
-        if not self._is_ready:
+        if not await self.ensure_ready():
             logger.warning("Emby 服务未就绪")
             return None
             
@@ -205,4 +373,14 @@ class EmbyService:
             self._error_count += 1
             self._last_error = str(e)
             logger.error(f"获取媒体项详情失败: {str(e)}")
-            return None 
\ No newline at end of file
+            return None
+
+async def _warm_libraries():
+    """预热媒体库列表（服务未就绪时顺带重新初始化）"""
+    service = EmbyService.get_instance()
+    if not service.is_enabled:
+        return
+    if await service.ensure_ready():
+        await service.get_libraries()
+
+register_warmup("emby_libraries", _warm_libraries)
@@ -0,0 +1,173 @@
+"""目录聚合统计模块
+
+按增量维护每个目录下的文件数量、总大小和最新修改时间。
+"""
+from datetime import datetime
+from typing import Dict, List, Optional, Set
+from loguru import logger
+from sqlalchemy import select, update, delete, func, and_
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .models import FileRecord, DirectoryStats, PATH_RANGE_END
+
+ROOT_PATH = ""
+
+def ancestor_paths(path: str) -> List[str]:
+    """获取路径的所有祖先目录（包含根目录）"""
+    parts = path.split('/')[:-1]
+    return [ROOT_PATH] + ['/'.join(parts[:i]) for i in range(1, len(parts) + 1)]
+
+class DirectoryAggregates:
+    """目录聚合增量
+    
+    扫描过程中在内存里累积每个祖先目录的增量，提交前一次性 upsert 到
+    directory_stats 表，与文件记录的写入处于同一事务。
+    """
+    
+    # 每条 upsert 语句包含的行数，避免超过 SQLite 的参数上限
+    BATCH_SIZE = 500
+    
+    def __init__(self):
+        self._deltas: Dict[str, List] = {}  # path -> [文件数, 目录数, 大小, 最新修改时间]
+        self._stale: Set[str] = set()       # 最新修改时间需要重新计算的目录
+        
+    def __len__(self) -> int:
+        return len(self._deltas)
+        
+    def _apply(
+        self,
+        path: str,
+        size: Optional[int],
+        is_directory: Optional[bool],
+        modified_time: Optional[datetime],
+        sign: int
+    ):
+        size = size or 0
+        for ancestor in ancestor_paths(path):
+            delta = self._deltas.setdefault(ancestor, [0, 0, 0, None])
+            if is_directory:
+                delta[1] += sign
+            else:
+                delta[0] += sign
+            delta[2] += sign * size
+            if modified_time is None:
+                continue
+            if sign > 0:
+                if delta[3] is None or modified_time > delta[3]:
+                    delta[3] = modified_time
+            else:
+                # 删除的记录可能正是目录下最新的那个，刷新时重新计算
+                self._stale.add(ancestor)
+                
+    def add(self, path: str, size: Optional[int], is_directory: Optional[bool], modified_time: Optional[datetime]):
+        """记录一条新增的文件记录"""
+        self._apply(path, size, is_directory, modified_time, 1)
+        
+    def remove(self, path: str, size: Optional[int], is_directory: Optional[bool], modified_time: Optional[datetime]):
+        """记录一条删除的文件记录"""
+        self._apply(path, size, is_directory, modified_time, -1)
+        
+    def add_record(self, record: FileRecord):
+        self.add(record.path, record.size, record.is_directory, record.modified_time)
+        
+    def remove_record(self, record: FileRecord):
+        self.remove(record.path, record.size, record.is_directory, record.modified_time)
+        
+    def clear(self):
+        """丢弃未刷新的增量（事务回滚时调用）"""
+        self._deltas.clear()
+        self._stale.clear()
+        
+    async def flush(self, session: AsyncSession):
+        """把累积的增量写入 directory_stats，调用方负责提交事务"""
+        if not self._deltas:
+            return
+            
+        # 先把待删除/修改的文件记录写入，重新计算最新修改时间时才能看到
+        await session.flush()
+        
+        rows = [
+            {
+                "path": path,
+                "file_count": files,
+                "dir_count": dirs,
+                "total_size": size,
+                "newest_mtime": newest
+            }
+            for path, (files, dirs, size, newest) in self._deltas.items()
+        ]
+        for i in range(0, len(rows), self.BATCH_SIZE):
+            stmt = insert(DirectoryStats).values(rows[i:i + self.BATCH_SIZE])
+            excluded = stmt.excluded
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[DirectoryStats.path],
+                set_={
+                    "file_count": DirectoryStats.file_count + excluded.file_count,
+                    "dir_count": DirectoryStats.dir_count + excluded.dir_count,
+                    "total_size": DirectoryStats.total_size + excluded.total_size,
+                    # SQLite 的多参数 max 遇到 NULL 会返回 NULL，先用 coalesce 兜底
+                    "newest_mtime": func.max(
+                        func.coalesce(DirectoryStats.newest_mtime, excluded.newest_mtime),
+                        func.coalesce(excluded.newest_mtime, DirectoryStats.newest_mtime)
+                    ),
+                    "updated_at": func.now()
+                }
+            )
+            await session.execute(stmt)
+            
+        for path in self._stale:
+            await session.execute(
+                update(DirectoryStats)
+                .where(DirectoryStats.path == path)
+                .values(newest_mtime=self._newest_mtime_query(path))
+            )
+            
+        # 已经没有任何后代的目录不再保留统计行
+        touched = list(self._deltas)
+        for i in range(0, len(touched), self.BATCH_SIZE):
+            await session.execute(
+                delete(DirectoryStats).where(and_(
+                    DirectoryStats.path.in_(touched[i:i + self.BATCH_SIZE]),
+                    DirectoryStats.path != ROOT_PATH,
+                    DirectoryStats.file_count <= 0,
+                    DirectoryStats.dir_count <= 0
+                ))
+            )
+            
+        logger.debug(f"目录聚合已更新: {len(self._deltas)} 个目录")
+        self.clear()
+        
+    @staticmethod
+    def _newest_mtime_query(path: str):
+        """目录下最新修改时间的标量子查询（沿修改时间索引倒序查找第一条）"""
+        stmt = select(FileRecord.modified_time)
+        if path:
+            prefix = f"{path}/"
+            stmt = stmt.where(FileRecord.path >= prefix, FileRecord.path < prefix + PATH_RANGE_END)
+        return (
+            stmt.order_by(FileRecord.modified_time.desc())
+            .limit(1)
+            .scalar_subquery()
+        )
+        
+    @classmethod
+    async def rebuild(cls, session: AsyncSession):
+        """根据 file_records 全量重建目录聚合（用于初始化已有数据），调用方负责提交事务"""
+        await session.execute(delete(DirectoryStats))
+        aggregates = cls()
+        result = await session.stream(
+            select(
+                FileRecord.path,
+                FileRecord.size,
+                FileRecord.is_directory,
+                FileRecord.modified_time
+            ).execution_options(yield_per=10000)
+        )
+        async for path, size, is_directory, modified_time in result:
+            aggregates.add(path, size, is_directory, modified_time)
+        if ROOT_PATH not in aggregates._deltas:
+            aggregates._deltas[ROOT_PATH] = [0, 0, 0, None]
+        directories = len(aggregates)
+        await aggregates.flush(session)
+        logger.info(f"目录聚合重建完成: {directories} 个目录")
@@ -2,50 +2,305 @@
 
 提供文件变更事件的处理和分发功能。
 """
-from typing import List, Dict, Optional
+from typing import Awaitable, Callable, List, Dict, Optional
 from datetime import datetime
 import asyncio
-from collections import defaultdict
+import os
+import time
+from collections import OrderedDict
 from loguru import logger
+from sqlalchemy import select
 
-from ..symlink.manager import SymlinkManager
+from ..symlink.manager import SymlinkManager, SymlinkError
 from ..emby.service import EmbyService
+from .models import FileRecord
+from .journal import EventJournal
 from app.core.config import settings
-from app.core.cache import cached
+from app.core.database import AsyncSessionLocal
+from app.core.metrics import LatencyHistogram
+
+# 阶段之间的队列长度：每个阶段最多积压这么多批次，再多时上游阶段等待
+STAGE_QUEUE_SIZE = 2
+
+# 路径解析阶段每条查询包含的文件ID数量
+RESOLVE_CHUNK_SIZE = 500
+
+# Emby 阶段每次提交的路径数量
+EMBY_CHUNK_SIZE = 50
+
+# 检查到期的失败事件并重试的间隔（秒）
+RETRY_INTERVAL = 60
+
+# 优先级通道：实时变更（本地监听）、扫描差异、回填（全量同步和日志重放）
+LANE_LIVE = "live"
+LANE_SCAN = "scan"
+LANE_BACKFILL = "backfill"
+
+class ChangeEvent:
+    """流水线中的单个变更事件
+    
+    type 为 added / modified / moved（old_path 为原路径）/ deleted；
+    合并后还可能是 noop（窗口内新增又删除，只需在事件日志中标记完成）。
+    """
+    
+    __slots__ = ("type", "file", "path", "old_path", "journal_ids", "lane", "enqueued_at", "failed")
+    
+    def __init__(self, change: Dict, lane: str = LANE_SCAN):
+        self.type = change['type']
+        self.lane = lane
+        self.file = change['file']
+        self.path: Optional[str] = self.file.get('path')  # 相对路径，由路径解析阶段补全
+        self.old_path: Optional[str] = change.get('old_path')
+        self.journal_ids: List[int] = [change['journal_id']] if change.get('journal_id') else []
+        self.enqueued_at = time.monotonic()
+        self.failed = False
+        
+    @property
+    def file_id(self) -> Optional[str]:
+        # Drive 返回的文件信息用 id，数据库记录（删除事件）用 file_id
+        return self.file.get('file_id') or self.file.get('id')
+        
+    @property
+    def is_directory(self) -> bool:
+        return bool(
+            self.file.get('is_directory')
+            or self.file.get('mimeType') == 'application/vnd.google-apps.folder'
+        )
+        
+    @property
+    def is_linkable(self) -> bool:
+        """是否需要软链接和 Emby 处理"""
+        return self.type != 'noop' and bool(self.path) and not self.is_directory
+
+def _fold(events: List[ChangeEvent]) -> ChangeEvent:
+    """把同一文件的事件序列折叠为净效果
+    
+    第一个事件决定窗口开始前文件是否存在，最后一个事件决定窗口结束后是否存在：
+    新增后删除为 noop；新增后修改为 added；期间移动过或删除后重新出现为 moved，
+    old_path 为窗口开始前的路径（路径相同时在路径解析阶段降级为 modified）；
+    只有修改为 modified。
+    """
+    first, last = events[0], events[-1]
+    existed = first.type != 'added'
+    exists = last.type != 'deleted'
+    deleted = next((event for event in events if event.type == 'deleted'), None)
+    # 窗口开始前的路径：第一个移动事件的原路径或第一个删除事件的路径
+    origin = next((
+        event.old_path if event.type == 'moved' else event.path
+        for event in events if event.type in ('moved', 'deleted')
+    ), None)
+    
+    merged = last
+    merged.journal_ids = [journal_id for event in events for journal_id in event.journal_ids]
+    merged.enqueued_at = min(event.enqueued_at for event in events)
+    merged.old_path = None
+    if not existed and not exists:
+        merged.type = 'noop'
+    elif not existed:
+        merged.type = 'added'
+    elif not exists:
+        # 软链接仍在窗口开始前的路径上
+        merged.type = 'deleted'
+        merged.file = deleted.file
+        merged.path = origin
+    elif origin is not None:
+        merged.type = 'moved'
+        merged.old_path = origin
+        merged.path = last.file.get('path')
+    else:
+        merged.type = 'modified'
+    return merged
+
+def coalesce(events: List[ChangeEvent]) -> List[ChangeEvent]:
+    """按 file_id 合并一个批次内的事件
+    
+    合并后的事件排在该文件最后一个事件的位置，不同文件之间的相对顺序不变。
+    没有 file_id 的事件原样保留。
+    
+    Args:
+        events: 按到达顺序排列的事件
+        
+    Returns:
+        合并后的事件
+    """
+    groups: Dict[str, List[ChangeEvent]] = {}
+    positions: Dict[str, int] = {}
+    ordered = []
+    for index, event in enumerate(events):
+        file_id = event.file_id
+        if file_id is None:
+            ordered.append((index, event))
+            continue
+        groups.setdefault(file_id, []).append(event)
+        positions[file_id] = index
+        
+    for file_id, group in groups.items():
+        ordered.append((positions[file_id], _fold(group) if len(group) > 1 else group[0]))
+    ordered.sort(key=lambda item: item[0])
+    return [event for _, event in ordered]
+
+class PriorityLanes:
+    """按权重公平调度的多条有界事件队列
+    
+    使用步幅调度：每取出一个事件，所在通道的虚拟时间增加 1/权重，
+    总是从虚拟时间最小的非空通道取事件。各通道都有积压时按权重比例出队，
+    只有一个通道有事件时独占全部吞吐。空闲通道重新有事件时虚拟时间追平当前值，
+    不会因为之前空闲而长期独占。
+    """
+    
+    def __init__(self, weights: Dict[str, int], maxsize: int):
+        """初始化通道
+        
+        Args:
+            weights: 通道名称 -> 权重
+            maxsize: 每条通道的最大长度
+        """
+        self.weights = dict(weights)
+        self._queues = {lane: asyncio.Queue(maxsize=maxsize) for lane in self.weights}
+        self._pass = {lane: 0.0 for lane in self.weights}
+        self._vtime = 0.0
+        self._ready = asyncio.Event()
+        
+    def full(self, lane: str) -> bool:
+        return self._queues[lane].full()
+        
+    def qsize(self, lane: Optional[str] = None) -> int:
+        if lane is not None:
+            return self._queues[lane].qsize()
+        return sum(queue.qsize() for queue in self._queues.values())
+        
+    async def put(self, lane: str, item):
+        """放入事件，通道满时等待"""
+        queue = self._queues[lane]
+        if queue.empty():
+            self._pass[lane] = max(self._pass[lane], self._vtime)
+        await queue.put(item)
+        self._ready.set()
+        
+    def get_nowait(self):
+        """按权重取出一个事件，所有通道都为空时抛出 QueueEmpty"""
+        lanes = [lane for lane, queue in self._queues.items() if not queue.empty()]
+        if not lanes:
+            self._ready.clear()
+            raise asyncio.QueueEmpty
+        lane = min(lanes, key=lambda lane: (self._pass[lane], -self.weights[lane]))
+        self._vtime = self._pass[lane]
+        self._pass[lane] += 1 / self.weights[lane]
+        return self._queues[lane].get_nowait()
+        
+    async def get(self):
+        """取出一个事件，所有通道都为空时等待"""
+        while True:
+            try:
+                return self.get_nowait()
+            except asyncio.QueueEmpty:
+                await self._ready.wait()
+
+class PipelineStage:
+    """流水线阶段
+    
+    每个阶段有自己的有界输入队列、并发上限和延迟统计。
+    阶段按批次顺序处理，批次内互不相关的工作单元并发执行。
+    """
+    
+    def __init__(self, name: str, concurrency: int):
+        self.name = name
+        self.concurrency = concurrency
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=STAGE_QUEUE_SIZE)
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.latency = LatencyHistogram()
+        self.batches = 0
+        self.failed = 0
+        
+    async def run_all(self, units: List[Callable[[], Awaitable]]) -> List:
+        """在并发上限内执行一组工作单元，返回各自的结果或异常"""
+        async def run(unit):
+            async with self.semaphore:
+                return await unit()
+        return await asyncio.gather(*(run(unit) for unit in units), return_exceptions=True)
+        
+    @property
+    def stats(self) -> Dict:
+        return {
+            "pending_batches": self.queue.qsize(),
+            "concurrency": self.concurrency,
+            "batches": self.batches,
+            "failed": self.failed,
+            "latency": self.latency.snapshot()
+        }
 
 class FileChangeHandler:
     """文件变更处理器
     
-    处理文件系统变更事件，包括创建、修改和删除。
+    扫描器提交的变更进入有界队列，队列满时 handle_changes 等待，从而把压力传回扫描器。
+    队列分为实时变更、扫描差异、回填三个优先级通道，按权重公平调度，
+    大批量回填期间新的变更仍能在几秒内处理。
+    收集器按数量或从第一个事件起的截止时间组批，批次依次经过
+    路径解析（数据库）、软链接、Emby 刷新三个阶段，各阶段独立并发、流水线执行。
+    批次走完全部阶段后在事件日志中标记完成，未完成的事件在重启后重放；
+    处理失败的事件不标记完成，按退避时间重试，因此各阶段的操作都必须幂等。
     """
     
-    def __init__(self, batch_size: int = 10, batch_interval: float = 1.0):
+    _instance = None
+    
+    @classmethod
+    def get_instance(cls) -> 'FileChangeHandler':
+        """获取变更处理器实例（单例）"""
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+        
+    def __init__(
+        self,
+        batch_size: Optional[int] = None,
+        batch_timeout: Optional[float] = None,
+        queue_size: Optional[int] = None
+    ):
         """初始化变更处理器
         
         Args:
-            batch_size: 批处理大小
-            batch_interval: 批处理间隔（秒）
+            batch_size: 每批最多事件数，默认读取配置
+            batch_timeout: 批次从第一个事件起的最长等待时间（秒），默认读取配置
+            queue_size: 每个优先级通道的最大长度，默认读取配置
         """
-        self.symlink_manager = SymlinkManager()
-        self.emby_service = EmbyService()
-        self.changed_paths = []  # 记录变更的路径
+        config = settings.monitor.events
+        self.symlink_manager = SymlinkManager.get_instance()
+        self.emby_service = EmbyService.get_instance()
+        self.journal = EventJournal()
         
         # 批处理配置
-        self.batch_size = batch_size
-        self.batch_interval = batch_interval
+        self.batch_size = batch_size or config.batch_size
+        self.batch_timeout = batch_timeout or config.batch_timeout
+        self.queue_size = queue_size or config.queue_size
         
-        # 事件队列
-        self._event_queue = asyncio.Queue()
-        self._is_processing = False
-        self._current_batch = defaultdict(list)
+        # 事件队列与处理阶段
+        self._lanes = PriorityLanes(config.lane_weights, self.queue_size)
+        self._backfill_task: Optional[asyncio.Task] = None
+        self._stages = {
+            "resolve": PipelineStage("resolve", config.db_concurrency),
+            "symlink": PipelineStage("symlink", config.symlink_concurrency),
+            "emby": PipelineStage("emby", config.emby_concurrency)
+        }
+        self._tasks: List[asyncio.Task] = []
         
         # 统计信息
         self._total_events = 0
         self._processed_events = 0
         self._failed_events = 0
+        self._backpressure_waits = 0
+        self._coalesced_events = 0
+        self._event_latency = LatencyHistogram()
+        self._lane_stats = {
+            lane: {"enqueued": 0, "latency": LatencyHistogram()}
+            for lane in self._lanes.weights
+        }
         self._last_batch_time = None
         self._last_error = None
         
+    @property
+    def is_running(self) -> bool:
+        return any(not task.done() for task in self._tasks)
+        
     @property
     def stats(self) -> Dict:
         """获取处理器统计信息"""
@@ -54,140 +309,334 @@ class FileChangeHandler:
             "processed_events": self._processed_events,
             "failed_events": self._failed_events,
             "success_rate": self._processed_events / self._total_events if self._total_events > 0 else 0,
-            "pending_events": self._event_queue.qsize(),
+            "pending_events": self._lanes.qsize(),
+            "queue_capacity": self.queue_size,
+            "backpressure_waits": self._backpressure_waits,
+            "coalesced_events": self._coalesced_events,
+            "event_latency": self._event_latency.snapshot(),
+            "lanes": {
+                lane: {
+                    "weight": self._lanes.weights[lane],
+                    "pending": self._lanes.qsize(lane),
+                    "enqueued": stats["enqueued"],
+                    "latency": stats["latency"].snapshot()
+                }
+                for lane, stats in self._lane_stats.items()
+            },
+            "stages": {name: stage.stats for name, stage in self._stages.items()},
+            "journal": self.journal.stats,
             "last_batch_time": self._last_batch_time.isoformat() if self._last_batch_time else None,
             "last_error": str(self._last_error) if self._last_error else None
         }
-
-    async def handle_changes(self, changes: List[Dict]):
-        """处理文件变更事件
+        
+    def start(self):
+        """启动收集器和各阶段的工作任务"""
+        if self.is_running:
+            return
+        self._tasks = [
+            asyncio.create_task(self._collect_loop()),
+            asyncio.create_task(self._stage_loop(self._stages["resolve"], self._resolve_batch, self._stages["symlink"])),
+            asyncio.create_task(self._stage_loop(self._stages["symlink"], self._link_batch, self._stages["emby"])),
+            asyncio.create_task(self._stage_loop(self._stages["emby"], self._refresh_batch, None)),
+            asyncio.create_task(self._retry_loop())
+        ]
+        
+    async def stop(self):
+        """停止处理（未处理的事件留在队列中）
+        
+        正在处理和尚未入队的批次随任务取消而丢弃，停止后不再认为任何事件在流水线中，
+        它们在占用到期后由重试或下次启动的重放重新处理。
+        """
+        tasks = self._tasks + ([self._backfill_task] if self._backfill_task else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks = []
+        self._backfill_task = None
+        self.journal.untrack_all()
+        
+    async def handle_changes(self, changes: List[Dict], lane: str = LANE_SCAN):
+        """接收变更
+        
+        通道由调用方决定：完整同步和日志重放走回填通道，增量扫描走扫描通道。
+        回填由后台任务逐个入队，调用方只在上一批回填尚未入队完时等待，
+        这样全量同步期间扫描仍能继续，新的变更走扫描通道优先处理；
+        其他通道满时在这里等待，直到处理器腾出空间。
         
         Args:
             changes: 变更列表
+            lane: 优先级通道（live / scan / backfill）
         """
+        self.start()
         self._total_events += len(changes)
+        self._lane_stats[lane]["enqueued"] += len(changes)
+        # 从这里起事件由本进程负责，标记结果之前重试不会再次读取
+        self.journal.track(change['journal_id'] for change in changes if change.get('journal_id'))
+        
+        if lane != LANE_BACKFILL:
+            await self._enqueue(changes, lane)
+            return
+            
+        # 同一时间只有一批回填在排队
+        if self._backfill_task and not self._backfill_task.done():
+            self._backpressure_waits += 1
+            await self._backfill_task
+        self._backfill_task = asyncio.create_task(self._enqueue(changes, lane))
         
-        # 将变更事件加入队列
+    async def _enqueue(self, changes: List[Dict], lane: str):
         for change in changes:
-            await self._event_queue.put(change)
+            if self._lanes.full(lane):
+                self._backpressure_waits += 1
+            await self._lanes.put(lane, ChangeEvent(change, lane))
+            
+    async def replay(self, retry_only: bool = False) -> int:
+        """重放事件日志中到期的未完成事件
         
-        # 如果处理器未运行，启动它
-        if not self._is_processing:
-            self._is_processing = True
-            asyncio.create_task(self._process_events())
-
-    async def _process_events(self):
-        """处理事件队列"""
-        while self._is_processing:
+        启动时重放全部未完成的事件；运行期间只重试处理失败过或者占用已到期的事件，
+        仍在流水线中的事件（包括在通道中排队超过占用时间的）不会被重复读取。只重放调用时已存在的事件，
+        之后追加的事件由扫描器正常提交。
+        
+        Args:
+            retry_only: 只重放处理失败过或者占用已到期的事件
+            
+        Returns:
+            重放的事件数量
+        """
+        upto_id = await self.journal.last_id()
+        after_id = 0
+        total = 0
+        while True:
+            changes = await self.journal.load_pending(
+                after_id, upto_id, EventJournal.REPLAY_PAGE_SIZE, retry_only=retry_only
+            )
+            if not changes:
+                break
+            after_id = changes[-1]['journal_id']
+            total += len(changes)
+            await self.handle_changes(changes, lane=LANE_BACKFILL)
+        if total:
+            logger.info(f"已{'重试' if retry_only else '重放'} {total} 个未完成的变更事件")
+        return total
+        
+    async def _retry_loop(self):
+        """定期重试到期的失败事件"""
+        while True:
+            await asyncio.sleep(RETRY_INTERVAL)
             try:
-                # 收集一批事件
-                batch = await self._collect_batch()
-                if not batch:
-                    continue
-                
-                self._last_batch_time = datetime.now()
-                
-                # 按类型分组处理
-                for event_type, events in batch.items():
-                    try:
-                        if event_type == 'added':
-                            await self._handle_batch_add(events)
-                        elif event_type == 'modified':
-                            await self._handle_batch_modify(events)
-                        elif event_type == 'deleted':
-                            await self._handle_batch_delete(events)
-                    except Exception as e:
-                        logger.error(f"批处理事件失败 [{event_type}]: {str(e)}")
-                        self._failed_events += len(events)
-                        self._last_error = e
-                        continue
-                
-                # 批量刷新 Emby
-                if self.changed_paths:
-                    await self._refresh_emby()
-                    self.changed_paths = []  # 清空变更路径列表
-                
+                await self.replay(retry_only=True)
             except Exception as e:
-                logger.error(f"处理事件队列出错: {str(e)}")
+                logger.error(f"重试失败的变更事件出错: {str(e)}")
                 self._last_error = e
-                await asyncio.sleep(1)  # 发生错误时短暂等待
-
-    async def _collect_batch(self) -> Dict[str, List[Dict]]:
+                
+    async def _collect_batch(self) -> List[ChangeEvent]:
         """收集一批事件
         
+        阻塞等待第一个事件，之后批次在达到 batch_size 或从第一个事件起
+        超过 batch_timeout 时关闭。
+        
         Returns:
-            按类型分组的事件批次
+            事件批次
         """
-        batch = defaultdict(list)
+        loop = asyncio.get_running_loop()
+        batch = [await self._lanes.get()]
+        deadline = loop.time() + self.batch_timeout
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._lanes.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._lanes.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+        
+    async def _collect_loop(self):
+        """收集事件批次并送入第一个阶段"""
+        first_stage = self._stages["resolve"]
+        while True:
+            batch = await self._collect_batch()
+            self._last_batch_time = datetime.now()
+            
+            # 在任何文件系统和 Emby 操作之前合并同一文件的事件
+            merged = coalesce(batch)
+            self._coalesced_events += len(batch) - sum(1 for event in merged if event.type != 'noop')
+            await first_stage.queue.put(merged)
+            
+    async def _stage_loop(
+        self,
+        stage: PipelineStage,
+        handler: Callable[[List[ChangeEvent]], Awaitable[List[ChangeEvent]]],
+        next_stage: Optional[PipelineStage]
+    ):
+        """阶段工作循环：处理一个批次后交给下一个阶段"""
+        while True:
+            batch = await stage.queue.get()
+            start_time = time.perf_counter()
+            try:
+                batch = await handler(batch)
+            except Exception as e:
+                logger.error(f"事件处理阶段出错 [{stage.name}]: {str(e)}")
+                stage.failed += 1
+                self._failed_events += len(batch)
+                self._last_error = e
+                # 整批记为失败，按退避时间重试
+                for event in batch:
+                    event.failed = True
+                await self._finish(batch)
+                continue
+            finally:
+                stage.batches += 1
+                stage.latency.record(time.perf_counter() - start_time)
+                
+            if next_stage is not None:
+                await next_stage.queue.put(batch)
+            else:
+                await self._finish(batch)
+                
+    async def _finish(self, batch: List[ChangeEvent]):
+        """在事件日志中标记成功的事件完成、失败的事件待重试，并记录统计"""
         try:
-            for _ in range(self.batch_size):
-                try:
-                    event = await asyncio.wait_for(
-                        self._event_queue.get(),
-                        timeout=self.batch_interval
-                    )
-                    batch[event['type']].append(event['file'])
-                    self._event_queue.task_done()
-                except asyncio.TimeoutError:
-                    break
+            await self.journal.mark_done([
+                journal_id for event in batch if not event.failed for journal_id in event.journal_ids
+            ])
+            await self.journal.mark_failed([
+                journal_id for event in batch if event.failed for journal_id in event.journal_ids
+            ])
         except Exception as e:
-            logger.error(f"收集事件批次失败: {str(e)}")
+            # 标记失败时事件会在占用到期后重试，处理是幂等的
+            logger.error(f"标记变更事件状态失败: {str(e)}")
+            self._last_error = e
+            
+        now = time.monotonic()
+        for event in batch:
+            if not event.failed:
+                self._processed_events += 1
+            self._event_latency.record(now - event.enqueued_at)
+            self._lane_stats[event.lane]["latency"].record(now - event.enqueued_at)
+            
+    def _fail(self, event: ChangeEvent, error: Exception):
+        logger.error(f"处理文件变更失败 [{event.type}] [{event.path or event.file_id}]: {str(error)}")
+        event.failed = True
+        self._failed_events += 1
+        self._last_error = error
+        
+    async def _resolve_batch(self, batch: List[ChangeEvent]) -> List[ChangeEvent]:
+        """路径解析阶段：从文件记录中查出新增/修改文件的相对路径"""
+        pending = [
+            event for event in batch
+            if event.type != 'noop' and event.path is None and event.file_id
+        ]
+        file_ids = list({event.file_id for event in pending})
         
+        async def lookup(chunk: List[str]) -> Dict[str, str]:
+            async with AsyncSessionLocal() as session:
+                result = await session.execute(
+                    select(FileRecord.file_id, FileRecord.path).where(FileRecord.file_id.in_(chunk))
+                )
+                return dict(result.all())
+                
+        paths: Dict[str, str] = {}
+        results = await self._stages["resolve"].run_all([
+            lambda chunk=file_ids[i:i + RESOLVE_CHUNK_SIZE]: lookup(chunk)
+            for i in range(0, len(file_ids), RESOLVE_CHUNK_SIZE)
+        ])
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+            paths.update(result)
+            
+        for event in pending:
+            event.path = paths.get(event.file_id) or event.file.get('name')
+            if event.type == 'moved' and event.path == event.old_path:
+                # 删除后在原路径重新出现：替换而不是移动
+                event.type = 'modified'
+                event.old_path = None
         return batch
-
-    @cached(prefix="event_handler", ttl=60)
-    async def _handle_batch_add(self, files: List[Dict]):
-        """批量处理添加事件
         
-        Args:
-            files: 文件信息列表
-        """
-        for file in files:
-            try:
-                if await self.symlink_manager.create_symlink(file['name']):
-                    self.changed_paths.append(file['name'])
-                    self._processed_events += 1
-            except Exception as e:
-                logger.error(f"处理文件添加失败 [{file['name']}]: {str(e)}")
-                self._failed_events += 1
-
-    async def _handle_batch_modify(self, files: List[Dict]):
-        """批量处理修改事件
+    @staticmethod
+    def _link_paths(path: str):
+        """相对路径对应的源文件和软链接路径"""
+        relative = path.lstrip('/')
+        return (
+            os.path.join(settings.symlink.source_dir, relative),
+            os.path.join(settings.symlink.target_dir, relative)
+        )
         
-        Args:
-            files: 文件信息列表
-        """
-        for file in files:
+    def _apply_change(self, event: ChangeEvent):
+        """对单个事件执行软链接操作（在线程中运行）"""
+        source, target = self._link_paths(event.path)
+        if event.type == 'deleted':
+            # 没有对应的软链接时无需处理
+            self.symlink_manager.remove(target)
+        elif not self.symlink_manager.create(source, target):
+            # 新增和修改都确保软链接存在，已存在且正确时不会重复创建
+            raise SymlinkError(f"创建软链接失败: {target}")
+            
+    async def _link_batch(self, batch: List[ChangeEvent]) -> List[ChangeEvent]:
+        """软链接阶段：同一路径的事件按顺序执行，不同路径并发执行"""
+        groups: Dict[str, List[ChangeEvent]] = OrderedDict()
+        moved = []
+        for event in batch:
+            if event.is_linkable:
+                groups.setdefault(event.path, []).append(event)
+                if event.type == 'moved':
+                    moved.append(event)
+                    
+        # 移走的原路径可能被批次内的其他文件占用，先删除原路径上的软链接
+        async def unlink(event: ChangeEvent):
             try:
-                # 软链接不需要特殊处理，但需要刷新 Emby
-                self.changed_paths.append(file['name'])
-                self._processed_events += 1
+                await asyncio.to_thread(self.symlink_manager.remove, self._link_paths(event.old_path)[1])
             except Exception as e:
-                logger.error(f"处理文件修改失败 [{file['name']}]: {str(e)}")
-                self._failed_events += 1
-
-    async def _handle_batch_delete(self, files: List[Dict]):
-        """批量处理删除事件
+                self._fail(event, e)
+                
+        await self._stages["symlink"].run_all([lambda event=event: unlink(event) for event in moved])
+                
+        async def apply(events: List[ChangeEvent]):
+            for event in events:
+                try:
+                    await asyncio.to_thread(self._apply_change, event)
+                except Exception as e:
+                    self._fail(event, e)
+                    
+        await self._stages["symlink"].run_all([
+            lambda events=events: apply(events) for events in groups.values()
+        ])
+        return batch
         
-        Args:
-            files: 文件信息列表
+    async def _refresh_batch(self, batch: List[ChangeEvent]) -> List[ChangeEvent]:
+        """Emby 阶段：把变更的软链接路径提交到刷新队列
+        
+        某一组路径提交出错或者写入刷新队列失败时，涉及的事件记为失败，按退避时间重试。
         """
-        for file in files:
-            try:
-                if await self.symlink_manager.remove_symlink(file['path']):
-                    self.changed_paths.append(file['path'])
-                    self._processed_events += 1
-            except Exception as e:
-                logger.error(f"处理文件删除失败 [{file['path']}]: {str(e)}")
-                self._failed_events += 1
-
-    async def _refresh_emby(self):
-        """刷新 Emby 媒体库"""
-        try:
-            result = await self.emby_service.refresh_by_paths(self.changed_paths)
-            logger.info(f"Emby刷新结果：成功{result['success']}个，失败{result['failed']}个")
-            if result['processed']:
-                logger.info(f"处理的媒体库路径：{', '.join(result['processed'])}")
-        except Exception as e:
-            logger.error(f"刷新Emby出错: {str(e)}")
-            self._last_error = e 
\ No newline at end of file
+        events_by_path: Dict[str, List[ChangeEvent]] = OrderedDict()
+        for event in batch:
+            if event.is_linkable:
+                events_by_path.setdefault(self._link_paths(event.path)[1], []).append(event)
+                if event.old_path:
+                    events_by_path.setdefault(self._link_paths(event.old_path)[1], []).append(event)
+        paths = list(events_by_path)
+        
+        async def refresh(chunk: List[str]):
+            result = await self.emby_service.refresh_by_paths(chunk)
+            if result.get('error'):
+                raise RuntimeError(f"写入Emby刷新队列失败: {result['error']}")
+            logger.info(f"Emby刷新已入队：{result['success']}个，忽略{result['failed']}个")
+            
+        chunks = [paths[i:i + EMBY_CHUNK_SIZE] for i in range(0, len(paths), EMBY_CHUNK_SIZE)]
+        results = await self._stages["emby"].run_all([
+            lambda chunk=chunk: refresh(chunk) for chunk in chunks
+        ])
+        for chunk, result in zip(chunks, results):
+            if isinstance(result, Exception):
+                logger.error(f"刷新Emby出错: {str(result)}")
+                self._last_error = result
+                for path in chunk:
+                    for event in events_by_path[path]:
+                        if not event.failed:
+                            self._fail(event, result)
+        return batch
@@ -4,7 +4,93 @@ from loguru import logger
 import asyncio
 from app.utils.gdrive import GoogleDriveAPI
 from app.utils.config import get_config
-from .events import DriveChangeEvent
+from app.core.config import settings
+
+class GoogleDriveClient:
+    """Google Drive 异步客户端
+    
+    在线程池中执行同步的 GoogleDriveAPI 调用，避免阻塞事件循环。
+    """
+    
+    def __init__(self, api: Optional[GoogleDriveAPI] = None):
+        """初始化客户端
+        
+        Args:
+            api: 可选的 GoogleDriveAPI 实例，默认按全局配置创建
+        """
+        if api is None:
+            drive_settings = settings.monitor.google_drive
+            api = GoogleDriveAPI(
+                client_id=drive_settings.client_id,
+                client_secret=drive_settings.client_secret,
+                token_file=drive_settings.token_file
+            )
+        self.api = api
+        
+        # 统计信息
+        self._request_count = 0
+        self._error_count = 0
+        self._last_request_time = None
+        self._last_error = None
+        
+    @property
+    def stats(self) -> Dict:
+        """获取客户端统计信息"""
+        return {
+            "authenticated": self.api.creds is not None,
+            "request_count": self._request_count,
+            "error_count": self._error_count,
+            "last_request_time": self._last_request_time.isoformat() if self._last_request_time else None,
+            "last_error": str(self._last_error) if self._last_error else None
+        }
+        
+    async def authenticate(self):
+        """确认凭证可用
+        
+        Raises:
+            Exception: 未授权
+        """
+        if not self.api.creds:
+            await asyncio.to_thread(self.api._load_credentials)
+        if not self.api.creds:
+            raise Exception("Google Drive 未授权")
+            
+    async def list_files(self, folder_id: Optional[str] = None) -> List[Dict]:
+        """列出目录下的文件
+        
+        Args:
+            folder_id: 目录ID
+            
+        Returns:
+            文件列表
+        """
+        self._request_count += 1
+        self._last_request_time = datetime.now()
+        try:
+            return await asyncio.to_thread(self.api.list_files, folder_id)
+        except Exception as e:
+            self._error_count += 1
+            self._last_error = e
+            raise
+            
+    async def list_page(self, folder_id: Optional[str] = None, page_token: Optional[str] = None) -> Dict:
+        """列出目录下的一页文件，失败时抛出异常
+        
+        Args:
+            folder_id: 目录ID
+            page_token: 上一页返回的 nextPageToken
+            
+        Returns:
+            包含 files 和 nextPageToken 的字典
+        """
+        self._request_count += 1
+        self._last_request_time = datetime.now()
+        try:
+            return await asyncio.to_thread(self.api.list_page, folder_id, page_token)
+        except Exception as e:
+            self._error_count += 1
+            self._last_error = e
+            raise
 
 class GoogleDriveMonitor:
     def __init__(self):
@@ -20,7 +106,7 @@ class GoogleDriveMonitor:
         self._change_callbacks = []
 
     def add_change_callback(self, callback):
-        """添加变更回调函数"""
+        """添加变更回调函数（参数为 Drive 返回的文件信息）"""
         self._change_callbacks.append(callback)
 
     async def start(self):
@@ -47,16 +133,10 @@ class GoogleDriveMonitor:
             changes = self.api.get_changes(self.last_check_time)
             if changes:
                 for change in changes:
-                    event = DriveChangeEvent(
-                        file_id=change.get('id'),
-                        file_name=change.get('name'),
-                        mime_type=change.get('mimeType'),
-                        modified_time=change.get('modifiedTime')
-                    )
                     # 触发所有回调
                     for callback in self._change_callbacks:
                         try:
-                            await callback(event)
+                            await callback(change)
                         except Exception as e:
                             logger.error(f"处理变更回调时出错: {str(e)}")
 
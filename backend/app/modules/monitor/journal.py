@@ -0,0 +1,265 @@
+"""变更事件日志模块
+
+扫描器把变更事件和文件记录写在同一个事务里，事件处理完成后标记完成；
+进程异常退出后，启动时重放未完成的事件，保证至少处理一次。
+处理失败的事件保持未完成，按指数退避重试，超过最大次数后不再重试。
+"""
+import json
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Set
+from loguru import logger
+from sqlalchemy import select, update, delete, func, or_, bindparam
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .models import ChangeJournal
+from app.core.database import AsyncSessionLocal
+
+class EventJournal:
+    """变更事件日志
+    
+    事件处理必须是幂等的：标记完成前进程退出时，同一事件会在重启后再处理一次。
+    """
+    
+    # 每次重放读取的事件数量
+    REPLAY_PAGE_SIZE = 1000
+    
+    # 每条更新语句包含的事件数量，避免超过 SQLite 的参数上限
+    CHUNK_SIZE = 500
+    
+    # 每标记这么多事件清理一次已完成的记录
+    COMPACT_INTERVAL = 10000
+    
+    # 已完成的记录保留时间
+    RETENTION = timedelta(hours=1)
+    
+    # 失败事件的最大处理次数，超过后留在日志中不再重试
+    MAX_ATTEMPTS = 8
+    
+    # 失败重试的退避时间：第 n 次失败后等待 RETRY_BACKOFF * 2^(n-1)，不超过 RETRY_BACKOFF_MAX
+    RETRY_BACKOFF = timedelta(minutes=1)
+    RETRY_BACKOFF_MAX = timedelta(hours=6)
+    
+    # 读取后占用事件的时间，避免处理期间被再次读取；进程退出后占用到期即可重试
+    CLAIM_TIMEOUT = timedelta(minutes=10)
+    
+    def __init__(self):
+        # 已交给本进程流水线、尚未标记结果的事件，占用到期后也不重复读取
+        self._in_flight: Set[int] = set()
+        self._completed = 0
+        self._replayed = 0
+        self._failed = 0
+        self._abandoned = 0
+        self._since_compact = 0
+        
+    @property
+    def stats(self) -> Dict:
+        """获取日志统计信息"""
+        return {
+            "completed": self._completed,
+            "replayed": self._replayed,
+            "failed": self._failed,
+            "abandoned": self._abandoned,
+            "in_flight": len(self._in_flight)
+        }
+        
+    @classmethod
+    def backoff(cls, attempts: int) -> timedelta:
+        """第 attempts 次失败后的重试等待时间"""
+        # 限制指数，避免失败次数很大时 timedelta 溢出
+        exponent = min(max(attempts - 1, 0), 32)
+        return min(cls.RETRY_BACKOFF * 2 ** exponent, cls.RETRY_BACKOFF_MAX)
+        
+    @staticmethod
+    async def append(session: AsyncSession, changes: List[Dict]):
+        """在调用方的事务中追加变更事件，并把日志ID写回变更的 journal_id
+        
+        Args:
+            session: 与文件记录相同的数据库会话，调用方负责提交事务
+            changes: 变更列表
+        """
+        if not changes:
+            return
+        entries = [
+            ChangeJournal(
+                event_type=change['type'],
+                file_id=change['file'].get('file_id') or change['file'].get('id'),
+                payload=json.dumps(change['file'], ensure_ascii=False, default=str),
+                old_path=change.get('old_path')
+            )
+            for change in changes
+        ]
+        session.add_all(entries)
+        await session.flush()
+        for change, entry in zip(changes, entries):
+            change['journal_id'] = entry.id
+            
+    def track(self, journal_ids: Iterable[int]):
+        """记录事件已进入本进程的流水线
+        
+        大量回填时事件可能在通道中排队超过 CLAIM_TIMEOUT，运行期间的重试不能再次读取它们，
+        否则同一批积压会在每轮重试中重复入队。
+        """
+        self._in_flight.update(journal_ids)
+        
+    def untrack(self, journal_ids: Iterable[int]):
+        """事件已标记结果，离开流水线"""
+        self._in_flight.difference_update(journal_ids)
+        
+    def untrack_all(self):
+        """流水线停止时清空处理中的事件"""
+        self._in_flight.clear()
+        
+    async def mark_done(self, journal_ids: List[int]):
+        """标记事件处理完成
+        
+        Args:
+            journal_ids: 日志ID列表
+        """
+        self.untrack(journal_ids)
+        if not journal_ids:
+            return
+        now = datetime.utcnow()
+        async with AsyncSessionLocal() as session:
+            for i in range(0, len(journal_ids), self.CHUNK_SIZE):
+                await session.execute(
+                    update(ChangeJournal)
+                    .where(ChangeJournal.id.in_(journal_ids[i:i + self.CHUNK_SIZE]))
+                    .values(processed_at=now)
+                )
+            await session.commit()
+            
+        self._completed += len(journal_ids)
+        self._since_compact += len(journal_ids)
+        if self._since_compact >= self.COMPACT_INTERVAL:
+            self._since_compact = 0
+            await self.compact()
+            
+    async def mark_failed(self, journal_ids: List[int]):
+        """记录事件处理失败：增加失败次数并设置下一次重试时间
+        
+        超过 MAX_ATTEMPTS 的事件不再重试，保持未完成状态留在日志中供排查。
+        
+        Args:
+            journal_ids: 日志ID列表
+        """
+        self.untrack(journal_ids)
+        if not journal_ids:
+            return
+        now = datetime.utcnow()
+        async with AsyncSessionLocal() as session:
+            rows = []
+            for i in range(0, len(journal_ids), self.CHUNK_SIZE):
+                result = await session.execute(
+                    select(ChangeJournal.id, ChangeJournal.attempts)
+                    .where(ChangeJournal.id.in_(journal_ids[i:i + self.CHUNK_SIZE]))
+                )
+                rows.extend(result.all())
+            if not rows:
+                return
+            params = [
+                {
+                    "journal_id": journal_id,
+                    "failures": attempts + 1,
+                    "retry_at": now + self.backoff(attempts + 1)
+                }
+                for journal_id, attempts in rows
+            ]
+            await session.execute(
+                update(ChangeJournal.__table__)
+                .where(ChangeJournal.__table__.c.id == bindparam("journal_id"))
+                .values(attempts=bindparam("failures"), next_attempt_at=bindparam("retry_at")),
+                params
+            )
+            await session.commit()
+            
+        abandoned = sum(1 for row in params if row["failures"] >= self.MAX_ATTEMPTS)
+        self._failed += len(params)
+        self._abandoned += abandoned
+        if abandoned:
+            logger.error(f"{abandoned} 个变更事件失败次数达到上限 ({self.MAX_ATTEMPTS})，不再重试")
+            
+    async def compact(self) -> int:
+        """删除超过保留时间的已完成记录
+        
+        Returns:
+            删除的记录数量
+        """
+        cutoff = datetime.utcnow() - self.RETENTION
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(
+                delete(ChangeJournal).where(ChangeJournal.processed_at < cutoff)
+            )
+            await session.commit()
+        if result.rowcount:
+            logger.debug(f"已清理 {result.rowcount} 条已完成的变更事件")
+        return result.rowcount
+        
+    async def last_id(self) -> int:
+        """获取当前最大的日志ID"""
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(select(func.max(ChangeJournal.id)))
+            return result.scalar() or 0
+            
+    async def load_pending(
+        self,
+        after_id: int,
+        upto_id: int,
+        limit: int,
+        retry_only: bool = False
+    ) -> List[Dict]:
+        """按ID顺序读取一页到期的未完成事件，并在 CLAIM_TIMEOUT 内占用它们
+        
+        跳过还在退避中、失败次数达到上限和仍在本进程流水线中的事件。
+        
+        Args:
+            after_id: 只读取ID大于该值的事件
+            upto_id: 只读取ID不大于该值的事件
+            limit: 最大数量
+            retry_only: 只读取处理失败过或者占用已到期的事件（运行期间重试用，
+                不会读到扫描器刚提交、正在处理的新事件）
+            
+        Returns:
+            变更列表（包含 journal_id）
+        """
+        now = datetime.utcnow()
+        async with AsyncSessionLocal() as session:
+            changes = []
+            # 整页都在流水线中时继续读下一页，调用方按返回的最后一个ID翻页
+            while not changes:
+                stmt = (
+                    select(ChangeJournal.id, ChangeJournal.event_type, ChangeJournal.payload, ChangeJournal.old_path)
+                    .where(
+                        ChangeJournal.processed_at.is_(None),
+                        ChangeJournal.id > after_id,
+                        ChangeJournal.id <= upto_id,
+                        ChangeJournal.attempts < self.MAX_ATTEMPTS,
+                        or_(ChangeJournal.next_attempt_at.is_(None), ChangeJournal.next_attempt_at <= now)
+                    )
+                    .order_by(ChangeJournal.id)
+                    .limit(limit)
+                )
+                if retry_only:
+                    stmt = stmt.where(ChangeJournal.next_attempt_at.isnot(None))
+                rows = (await session.execute(stmt)).all()
+                if not rows:
+                    break
+                after_id = rows[-1][0]
+                changes = [
+                    {
+                        'type': event_type,
+                        'file': json.loads(payload),
+                        'old_path': old_path,
+                        'journal_id': journal_id
+                    }
+                    for journal_id, event_type, payload, old_path in rows
+                    if journal_id not in self._in_flight
+                ]
+            if changes:
+                await session.execute(
+                    update(ChangeJournal)
+                    .where(ChangeJournal.id.in_([change['journal_id'] for change in changes]))
+                    .values(next_attempt_at=now + self.CLAIM_TIMEOUT)
+                )
+                await session.commit()
+        self._replayed += len(changes)
+        return changes
@@ -3,12 +3,39 @@
 
 提供文件监控相关的数据模型。
 """
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, Index, event
+from sqlalchemy import (
+    Column, Integer, String, Text, DateTime, Boolean, Index, UniqueConstraint, event,
+    select, update, delete, bindparam
+)
 from sqlalchemy.orm import validates
 from datetime import datetime
-from typing import Dict, Optional
+from typing import Dict, List, Optional
+from loguru import logger
 from app.core.base import BaseModel
-from app.core.cache import cached
+
+# 路径区间上界使用的最大码位，保证前缀下的所有路径都落在区间内
+PATH_RANGE_END = '\U0010ffff'
+
+# 文件类型与扩展名的对应关系
+FILE_TYPE_EXTENSIONS = {
+    'video': ['mp4', 'mkv', 'avi', 'mov'],
+    'audio': ['mp3', 'wav', 'flac'],
+    'image': ['jpg', 'jpeg', 'png', 'gif'],
+    'document': ['pdf', 'doc', 'docx', 'txt'],
+    'archive': ['zip', 'rar', '7z']
+}
+
+def detect_file_type(path: str, is_directory: bool = False) -> str:
+    """根据扩展名判断文件类型"""
+    if is_directory:
+        return 'directory'
+    ext = path.split('.')[-1].lower() if '.' in path else ''
+    if not ext:
+        return 'unknown'
+    for file_type, extensions in FILE_TYPE_EXTENSIONS.items():
+        if ext in extensions:
+            return file_type
+    return 'other'
 
 class FileRecord(BaseModel):
     """
@@ -20,18 +47,26 @@ class FileRecord(BaseModel):
     id = Column(Integer, primary_key=True, index=True)
     path = Column(String, unique=True, index=True, nullable=False)
     file_id = Column(String, index=True, nullable=False)  # Google Drive file ID
+    parent_id = Column(String, index=True)  # 所在目录的 Google Drive ID
+    root_id = Column(String)  # 最近一次遍历到该记录的监控根目录ID
+    scan_generation = Column(Integer, default=0, nullable=False)  # 最近一次遍历到该记录的扫描代数
     modified_time = Column(DateTime, nullable=False)
     size = Column(Integer, default=0)
     is_directory = Column(Boolean, default=False)
     last_checked = Column(DateTime, default=datetime.utcnow)
     mime_type = Column(String)  # 文件MIME类型
+    file_type = Column(String(16))  # 文件类型，写入时根据扩展名计算
     
     # 添加索引以优化查询性能
     __table_args__ = (
         Index('idx_file_id', 'file_id'),  # 文件ID索引
         Index('idx_path', 'path'),        # 路径索引
         Index('idx_last_checked', 'last_checked'),  # 最后检查时间索引
-        Index('idx_modified', 'modified_time'),     # 修改时间索引
+        Index('idx_modified_id', 'modified_time', 'id'),  # 按修改时间分页
+        Index('idx_size_id', 'size', 'id'),               # 按大小分页
+        Index('idx_dir_path', 'is_directory', 'path'),    # 目录/文件过滤 + 路径分页
+        Index('idx_type_path', 'file_type', 'path'),      # 类型过滤 + 路径分页
+        Index('idx_root_generation', 'root_id', 'scan_generation'),  # 按扫描代数检测删除
         {"extend_existing": True}  # 允许模型更新
     )
     
@@ -61,28 +96,6 @@ class FileRecord(BaseModel):
         ext = self.path.split('.')[-1].lower() if '.' in self.path else ''
         return any(ext in types for types in media_types.values())
     
-    @property
-    def file_type(self) -> str:
-        """获取文件类型"""
-        if self.is_directory:
-            return 'directory'
-        ext = self.path.split('.')[-1].lower() if '.' in self.path else ''
-        if not ext:
-            return 'unknown'
-        # 根据扩展名判断文件类型
-        type_map = {
-            'video': ['mp4', 'mkv', 'avi', 'mov'],
-            'audio': ['mp3', 'wav', 'flac'],
-            'image': ['jpg', 'jpeg', 'png', 'gif'],
-            'document': ['pdf', 'doc', 'docx', 'txt'],
-            'archive': ['zip', 'rar', '7z']
-        }
-        for file_type, extensions in type_map.items():
-            if ext in extensions:
-                return file_type
-        return 'other'
-    
-    @cached(prefix="file_record", ttl=300)
     async def get_parent_path(self) -> Optional[str]:
         """获取父目录路径"""
         if '/' not in self.path:
@@ -100,11 +113,144 @@ class FileRecord(BaseModel):
             "is_directory": self.is_directory,
             "last_checked": self.last_checked.isoformat() if self.last_checked else None,
             "mime_type": self.mime_type,
-            "file_type": self.file_type,
+            "file_type": self.file_type or detect_file_type(self.path, self.is_directory),
             "is_media_file": self.is_media_file
         }
 
+class DirectoryStats(BaseModel):
+    """
+    目录聚合统计模型
+    保存每个目录下全部后代的文件数量、目录数量、总大小和最新修改时间，
+    由扫描器在写入文件记录的同一事务中按增量维护。
+    """
+    __tablename__ = "directory_stats"
+    
+    path = Column(String, primary_key=True)  # 空字符串表示根目录
+    file_count = Column(Integer, default=0, nullable=False)
+    dir_count = Column(Integer, default=0, nullable=False)
+    total_size = Column(Integer, default=0, nullable=False)
+    newest_mtime = Column(DateTime)
+    
+    __table_args__ = (
+        {"extend_existing": True},
+    )
+
+class ChangeJournal(BaseModel):
+    """
+    变更事件日志模型
+    扫描器在提交文件记录的同一事务中追加变更事件，事件处理完成后写入完成时间，
+    进程异常退出时未完成的事件在启动后重放，处理失败的事件按退避时间重试。
+    """
+    __tablename__ = "change_journal"
+    
+    id = Column(Integer, primary_key=True)
+    event_type = Column(String(16), nullable=False)  # added / modified / moved / deleted
+    file_id = Column(String, nullable=False)
+    payload = Column(Text, nullable=False)  # 文件信息（JSON）
+    old_path = Column(String)  # moved 事件的原路径
+    processed_at = Column(DateTime)  # 处理完成时间，为空表示未完成
+    attempts = Column(Integer, default=0, nullable=False)  # 处理失败的次数
+    next_attempt_at = Column(DateTime)  # 失败后下一次重试的时间
+    
+    __table_args__ = (
+        Index('idx_journal_processed_id', 'processed_at', 'id'),  # 查找未完成事件
+        {"extend_existing": True},
+    )
+
+class DirectoryFingerprint(BaseModel):
+    """
+    目录指纹模型
+    保存每个 Google Drive 目录直接子项 (ID, 名称, 修改时间, 大小) 的哈希，
+    扫描时指纹和路径都没有变化的目录跳过比对和写入。
+    """
+    __tablename__ = "directory_fingerprints"
+    
+    folder_id = Column(String, primary_key=True)
+    path = Column(String, nullable=False)  # 目录的相对路径，根目录为空字符串
+    fingerprint = Column(String(32), nullable=False)
+    child_count = Column(Integer, default=0, nullable=False)
+    
+    __table_args__ = (
+        {"extend_existing": True},
+    )
+
+class ScanCheckpoint(BaseModel):
+    """
+    扫描检查点模型
+    每个正在进行的完整扫描一行，扫描完成后删除。进程重启或扫描出错后，
+    下一次扫描从检查点继续，而不是从根目录重新开始。
+    """
+    __tablename__ = "scan_checkpoints"
+    
+    root_id = Column(String, primary_key=True)  # 根目录的 Google Drive ID
+    root_path = Column(String, nullable=False)
+    checked_at = Column(DateTime, nullable=False)  # 扫描开始时间
+    generation = Column(Integer, nullable=False)  # 本轮扫描代数
+    
+    __table_args__ = (
+        {"extend_existing": True},
+    )
+
+class ScanFrontier(BaseModel):
+    """
+    扫描前沿模型
+    保存已经发现但还没有处理完的目录，以及已提交到的分页位置。
+    """
+    __tablename__ = "scan_frontier"
+    
+    id = Column(Integer, primary_key=True)
+    root_id = Column(String, nullable=False)
+    folder_id = Column(String, nullable=False)
+    path = Column(String, nullable=False)
+    page_token = Column(String)  # 下一页的 pageToken，为空表示从第一页开始
+    
+    __table_args__ = (
+        UniqueConstraint('root_id', 'folder_id', name='uq_frontier_root_folder'),
+        {"extend_existing": True},
+    )
+
+@event.listens_for(FileRecord, 'before_insert')
+def set_file_type(mapper, connection, target):
+    """插入记录时计算文件类型"""
+    target.file_type = detect_file_type(target.path, target.is_directory)
+
 @event.listens_for(FileRecord, 'before_update')
 def update_last_checked(mapper, connection, target):
     """更新记录时自动更新最后检查时间"""
-    target.last_checked = datetime.utcnow() 
\ No newline at end of file
+    target.last_checked = datetime.utcnow()
+    target.file_type = detect_file_type(target.path, target.is_directory)
+
+# 升级后需要重新完整比对一次才能补齐的列
+SCAN_BACKFILL_COLUMNS = {'parent_id', 'root_id', 'scan_generation'}
+
+def upgrade_file_records(connection, added_columns: List[str]) -> None:
+    """为升级前写入的文件记录补齐新增的列（通过 run_sync 调用）
+    
+    file_type 按路径直接计算。所在目录、根目录和扫描代数只能由扫描写入，
+    清空目录指纹和扫描检查点，让下一次扫描完整比对所有目录并写入这些列；
+    在那之前根目录为空的旧记录仍按路径区间检测删除。
+    
+    Args:
+        connection: 同步数据库连接
+        added_columns: migrate_schema 为 file_records 新增的列
+    """
+    if 'file_type' in added_columns:
+        table = FileRecord.__table__
+        while True:
+            rows = connection.execute(
+                select(table.c.id, table.c.path, table.c.is_directory)
+                .where(table.c.file_type.is_(None))
+                .limit(1000)
+            ).all()
+            if not rows:
+                break
+            connection.execute(
+                update(table).where(table.c.id == bindparam('record_id')).values(file_type=bindparam('value')),
+                [{'record_id': id, 'value': detect_file_type(path, is_directory)} for id, path, is_directory in rows]
+            )
+            
+    if SCAN_BACKFILL_COLUMNS & set(added_columns):
+        for model in (DirectoryFingerprint, ScanCheckpoint, ScanFrontier):
+            connection.execute(delete(model.__table__))
+        logger.info("数据库升级: 已清空目录指纹和扫描检查点，下一次扫描将完整比对所有目录")
+
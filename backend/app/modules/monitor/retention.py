@@ -0,0 +1,224 @@
+"""记录保留模块
+
+后台按批清理不再被任何监控根目录遍历到的文件记录和失效的目录指纹。
+"""
+from datetime import datetime, timedelta
+import asyncio
+import time
+from typing import Dict, List, Optional, Set, Tuple
+from loguru import logger
+from sqlalchemy import select, delete, and_, or_, exists
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.cache import default_cache, path_tags, file_tag
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from .models import FileRecord, DirectoryFingerprint
+from .aggregates import DirectoryAggregates
+
+def monitored_root_ids() -> Set[str]:
+    """当前配置的监控根目录ID"""
+    config = settings.monitor
+    return {config.source_dir} | {watch.path for watch in config.watch_paths}
+
+class RetentionJob:
+    """记录保留任务
+    
+    扫描已经按代数删除了根目录下消失的文件，这里只处理扫描管不到的记录：
+    根目录已经从配置中移除、或者从未写入根目录的旧记录，并且超过保留天数
+    没有被检查过。仍在监控的根目录的记录即使扫描持续失败也不会删除。
+    
+    只在低峰时段运行，沿检查时间索引按 (last_checked, id) 分批删除，每批独立提交，
+    超过时间预算就停下，下次从上次的位置继续。
+    """
+    
+    _instance = None
+    # 两次完整清理的最短间隔，保证每个低峰时段最多完整清理一次
+    MIN_PASS_INTERVAL = timedelta(hours=12)
+    
+    @classmethod
+    def get_instance(cls) -> 'RetentionJob':
+        """获取记录保留任务实例（单例）"""
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+        
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self._running = False
+        self._cursor: Optional[Tuple[datetime, int]] = None      # 文件记录的 (last_checked, id)
+        self._fingerprint_cursor: Optional[str] = None            # 目录指纹的 folder_id
+        self._last_completed: Optional[datetime] = None
+        
+        # 统计信息
+        self._runs = 0
+        self._deleted_records = 0
+        self._deleted_fingerprints = 0
+        self._last_run_time: Optional[datetime] = None
+        self._last_run_duration: Optional[float] = None
+        self._last_error = None
+        
+    @property
+    def is_running(self) -> bool:
+        return self._running
+        
+    @property
+    def stats(self) -> Dict:
+        """获取保留任务统计信息"""
+        return {
+            "is_running": self._running,
+            "runs": self._runs,
+            "deleted_records": self._deleted_records,
+            "deleted_fingerprints": self._deleted_fingerprints,
+            "in_progress": self._cursor is not None or self._fingerprint_cursor is not None,
+            "last_run_time": self._last_run_time.isoformat() if self._last_run_time else None,
+            "last_run_duration": self._last_run_duration,
+            "last_completed": self._last_completed.isoformat() if self._last_completed else None,
+            "last_error": str(self._last_error) if self._last_error else None
+        }
+        
+    async def start(self):
+        """启动后台任务"""
+        if self._running:
+            return
+        self._running = True
+        self._task = asyncio.create_task(self._loop())
+        logger.info("记录保留任务已启动")
+        
+    async def stop(self):
+        """停止后台任务（当前批次回滚，下次从上次提交的位置继续）"""
+        if not self._running:
+            return
+        self._running = False
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        logger.info("记录保留任务已停止")
+        
+    @staticmethod
+    def in_off_peak(now: Optional[datetime] = None) -> bool:
+        """当前是否处于低峰时段（按本地时间，支持跨零点）"""
+        config = settings.monitor.retention
+        hour = (now or datetime.now()).hour
+        if config.off_peak_start <= config.off_peak_end:
+            return config.off_peak_start <= hour < config.off_peak_end
+        return hour >= config.off_peak_start or hour < config.off_peak_end
+        
+    def _due(self) -> bool:
+        """本时段的清理是否还没有完成"""
+        if self._last_completed is None:
+            return True
+        return datetime.now() - self._last_completed >= self.MIN_PASS_INTERVAL
+        
+    async def _loop(self):
+        config = settings.monitor.retention
+        while self._running:
+            try:
+                if self.in_off_peak() and self._due():
+                    await self.run_once(config.time_budget)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._last_error = e
+                logger.error(f"记录保留任务出错: {str(e)}")
+            await asyncio.sleep(config.check_interval)
+            
+    async def run_once(self, time_budget: float) -> bool:
+        """在时间预算内清理一轮
+        
+        Args:
+            time_budget: 时间预算（秒）
+            
+        Returns:
+            是否已经清理完（False 表示预算用完，下次继续）
+        """
+        start = time.monotonic()
+        deadline = start + time_budget
+        self._runs += 1
+        self._last_run_time = datetime.now()
+        try:
+            completed = await self._purge_records(deadline) and await self._purge_fingerprints(deadline)
+        finally:
+            self._last_run_duration = time.monotonic() - start
+        if completed:
+            self._last_completed = datetime.now()
+            logger.info(
+                f"记录保留清理完成: 累计删除 {self._deleted_records} 条记录，"
+                f"{self._deleted_fingerprints} 个目录指纹"
+            )
+        return completed
+        
+    async def _purge_records(self, deadline: float) -> bool:
+        """按 (last_checked, id) 分批删除过期且不属于任何监控根目录的记录"""
+        config = settings.monitor.retention
+        cutoff = datetime.utcnow() - timedelta(days=config.max_age_days)
+        roots = list(monitored_root_ids())
+        while time.monotonic() < deadline:
+            async with AsyncSessionLocal() as session:
+                stmt = (
+                    select(FileRecord)
+                    .where(
+                        FileRecord.last_checked < cutoff,
+                        or_(FileRecord.root_id.is_(None), FileRecord.root_id.notin_(roots))
+                    )
+                    .order_by(FileRecord.last_checked, FileRecord.id)
+                    .limit(config.batch_size)
+                )
+                if self._cursor is not None:
+                    checked, record_id = self._cursor
+                    stmt = stmt.where(or_(
+                        FileRecord.last_checked > checked,
+                        and_(FileRecord.last_checked == checked, FileRecord.id > record_id)
+                    ))
+                records = (await session.execute(stmt)).scalars().all()
+                if not records:
+                    self._cursor = None
+                    return True
+                await self._delete_records(session, records)
+                self._cursor = (records[-1].last_checked, records[-1].id)
+        return False
+        
+    async def _delete_records(self, session: AsyncSession, records: List[FileRecord]):
+        """删除一批记录，同一事务中更新目录聚合，提交后失效缓存"""
+        aggregates = DirectoryAggregates()
+        tags: Set[str] = set()
+        for record in records:
+            aggregates.remove_record(record)
+            tags.update(path_tags(record.path))
+            tags.add(file_tag(record.file_id))
+            await session.delete(record)
+        await aggregates.flush(session)
+        await session.commit()
+        await default_cache.ainvalidate_tags(*tags)
+        self._deleted_records += len(records)
+        logger.debug(f"记录保留: 删除 {len(records)} 条过期记录")
+        
+    async def _purge_fingerprints(self, deadline: float) -> bool:
+        """按 folder_id 分批删除目录记录已经不存在的目录指纹（监控根目录除外）"""
+        config = settings.monitor.retention
+        roots = list(monitored_root_ids())
+        while time.monotonic() < deadline:
+            async with AsyncSessionLocal() as session:
+                stmt = (
+                    select(DirectoryFingerprint.folder_id)
+                    .order_by(DirectoryFingerprint.folder_id)
+                    .limit(config.batch_size)
+                )
+                if self._fingerprint_cursor is not None:
+                    stmt = stmt.where(DirectoryFingerprint.folder_id > self._fingerprint_cursor)
+                folder_ids = (await session.execute(stmt)).scalars().all()
+                if not folder_ids:
+                    self._fingerprint_cursor = None
+                    return True
+                result = await session.execute(
+                    delete(DirectoryFingerprint).where(
+                        DirectoryFingerprint.folder_id.in_(folder_ids),
+                        DirectoryFingerprint.folder_id.notin_(roots),
+                        ~exists().where(FileRecord.file_id == DirectoryFingerprint.folder_id)
+                    )
+                )
+                await session.commit()
+                self._deleted_fingerprints += result.rowcount or 0
+                self._fingerprint_cursor = folder_ids[-1]
+        return False
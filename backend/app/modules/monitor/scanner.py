@@ -2,18 +2,54 @@
 
 提供文件系统扫描和变更检测功能。
 """
-from datetime import datetime, timedelta
-import os
-from typing import List, Dict, Optional, Set
+from datetime import datetime, timezone
+import asyncio
+import hashlib
+from typing import Awaitable, Callable, List, Dict, Optional, Sequence, Set, Tuple
 from loguru import logger
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, and_
-from sqlalchemy.future import select as future_select
-from app.core.cache import cached
+from sqlalchemy import select, update, delete, func, or_
+from sqlalchemy.dialects.sqlite import insert
+from app.core.cache import default_cache, path_tags, file_tag
 from app.core.config import settings
 
-from .models import FileRecord
+from .models import FileRecord, DirectoryFingerprint, ScanCheckpoint, ScanFrontier, PATH_RANGE_END
 from .gdrive import GoogleDriveClient
+from .aggregates import DirectoryAggregates
+from .journal import EventJournal
+
+FOLDER_MIME_TYPE = 'application/vnd.google-apps.folder'
+
+def join_path(parent: str, name: str) -> str:
+    """拼接相对路径（根目录为空字符串）"""
+    return f"{parent}/{name}" if parent else name
+
+def parse_drive_time(value: str) -> datetime:
+    """解析 Drive 的 RFC 3339 时间，转换为与数据库一致的 UTC 时间（不带时区）"""
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def directory_fingerprint(children: List[Dict]) -> str:
+    """计算目录指纹：按ID排序后对直接子项的 (ID, 名称, 修改时间, 大小) 取哈希"""
+    digest = hashlib.md5()
+    for child in sorted(children, key=lambda item: item['id']):
+        digest.update(
+            f"{child['id']}\t{child['name']}\t{child.get('modifiedTime', '')}\t{child.get('size', '')}\n".encode()
+        )
+    return digest.hexdigest()
+
+class FolderListing:
+    """一个目录在本次扫描中的列出进度"""
+    
+    __slots__ = ('path', 'eager', 'children', 'complete')
+    
+    def __init__(self, path: str, eager: bool):
+        self.path = path
+        self.eager = eager      # 是否逐页比对（没有可用的指纹）
+        self.children: List[Dict] = []
+        self.complete = True    # 所有子项是否都处理成功
 
 class FileScanner:
     """文件扫描器
@@ -21,6 +57,11 @@ class FileScanner:
     负责扫描目录并检测文件变更。
     """
     
+    # IN 查询每批的ID数量，避免超过 SQLite 的参数上限
+    QUERY_CHUNK_SIZE = 500
+    # 列出阶段与比对阶段之间缓冲的页数
+    PAGE_QUEUE_SIZE = 16
+    
     def __init__(self, db_session: AsyncSession, gdrive_client: GoogleDriveClient):
         """初始化扫描器
         
@@ -30,9 +71,15 @@ class FileScanner:
         """
         self.db_session = db_session
         self.gdrive_client = gdrive_client
+        self._aggregates = DirectoryAggregates()
+        self._changed_tags: Set[str] = set()
         self._scan_count = 0
         self._last_scan_time = None
         self._last_scan_duration = None
+        self._skipped_folders = 0
+        # 当前扫描是否为完整同步（强制扫描、根目录首次扫描或从检查点继续），
+        # 完整同步的变更按回填处理，不挤占增量扫描
+        self.full_sync = False
         
     @property
     def stats(self) -> Dict:
@@ -40,175 +87,639 @@ class FileScanner:
         return {
             "total_scans": self._scan_count,
             "last_scan_time": self._last_scan_time.isoformat() if self._last_scan_time else None,
-            "last_scan_duration": self._last_scan_duration
+            "last_scan_duration": self._last_scan_duration,
+            "skipped_folders": self._skipped_folders
         }
         
-    async def scan_directory(self, directory: str) -> List[Dict]:
-        """扫描目录并返回变更
+    async def scan_directory(
+        self,
+        directory: str,
+        root_path: str = "",
+        force: bool = False,
+        on_changes: Optional[Callable[[List[Dict]], Awaitable[None]]] = None,
+        exclude_paths: Sequence[str] = ()
+    ) -> int:
+        """扫描目录树，按批提交并发出变更
+        
+        列出、比对和写入以流水线方式重叠执行：列出任务把每一页子项放入有界队列，
+        比对阶段逐页处理并累积写入，每攒满一批（或队列暂时为空）就提交事务，
+        提交后立即把这一批变更交给 on_changes，不必等整棵目录树扫描完成。
+        
+        每个目录对直接子项计算指纹，指纹和路径都与上次扫描相同的目录跳过逐个文件的
+        比对和写入，只批量刷新检查时间。Drive 目录的修改时间不反映子项变化，
+        所以子目录仍然需要逐个列出。
+        
+        扫描前沿（未处理完的目录和分页位置）随每批写入一起提交到检查点，
+        扫描中断后下一次从检查点继续。每轮扫描有递增的代数，遍历到的记录按目录
+        批量写入当前代数；只有完整遍历之后才检测删除：属于该根目录、代数小于
+        本轮的记录视为已删除。
         
         Args:
-            directory: 要扫描的目录路径
+            directory: 根目录的 Google Drive ID
+            root_path: 根目录在源目录中的相对路径，作为文件记录路径的前缀
+            force: 忽略目录指纹，比对所有目录
+            on_changes: 每批变更提交后调用的回调
+            exclude_paths: 由其他根目录负责的子路径，删除检测时跳过
             
         Returns:
-            变更列表，每个变更包含类型和文件信息
+            变更数量
         """
         start_time = datetime.now()
         self._scan_count += 1
         self._last_scan_time = start_time
+        root_path = root_path.strip('/')
+        lister = None
         
         try:
-            changes = []
+            checked_at, generation, frontier, resumed_scan = await self._load_checkpoint(directory, root_path)
+            # 本轮遍历到的记录都批量写入根目录和扫描代数
+            stamp = {"root_id": directory, "scan_generation": generation, "last_checked": checked_at}
+            total = 0
+            skipped = 0
+            batch: List[Dict] = []
+            pending = 0
+            fingerprints = await self._load_fingerprints()
+            self.full_sync = force or resumed_scan or directory not in fingerprints
+            listings: Dict[str, FolderListing] = {}
+            batch_size = settings.monitor.scan_batch_size
             
-            # 获取目录下所有文件
-            files = await self.gdrive_client.list_files(directory)
-            current_file_ids = {f['id'] for f in files}
+            pages: asyncio.Queue = asyncio.Queue(self.PAGE_QUEUE_SIZE)
+            lister = asyncio.create_task(self._list_tree(frontier, pages))
+            resumed = {folder_id for folder_id, _, page_token in frontier if page_token}
             
-            # 批量检查现有记录
-            existing_records = await self._get_existing_records(current_file_ids)
-            existing_file_ids = {record.file_id for record in existing_records}
-            
-            # 处理新文件和修改的文件
-            for file in files:
-                try:
-                    modified_time = datetime.fromisoformat(
-                        file['modifiedTime'].replace('Z', '+00:00')
-                    )
+            while True:
+                item = await pages.get()
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise item
                     
-                    existing_record = next(
-                        (r for r in existing_records if r.file_id == file['id']),
-                        None
-                    )
+                folder_id, folder_path, files, next_token = item
+                listing = listings.get(folder_id)
+                if listing is None:
+                    # 没有指纹的目录（例如新增的目录）逐页比对，尽早发出变更
+                    eager = force or folder_id not in fingerprints or folder_id in resumed
+                    listing = listings[folder_id] = FolderListing(folder_path, eager)
+                    # 从中间分页继续的目录缺少前面的子项，不能计算指纹
+                    listing.complete = folder_id not in resumed
+                listing.children.extend(files)
+                await self._add_frontier(directory, folder_path, files)
+                if listing.eager:
+                    pending += len(files)
+                    await self._diff_page(listing, folder_id, files, stamp, batch)
                     
-                    if not existing_record:
-                        # 新文件
-                        changes.append({
-                            'type': 'added',
-                            'file': file
-                        })
-                        await self._create_file_record(file, modified_time)
-                    elif existing_record.modified_time < modified_time:
-                        # 文件已修改
-                        changes.append({
-                            'type': 'modified',
-                            'file': file
-                        })
-                        await self._update_file_record(existing_record, file, modified_time)
+                if next_token is None:
+                    del listings[folder_id]
+                    fingerprint = directory_fingerprint(listing.children)
+                    if listing.eager:
+                        if listing.complete:
+                            await self._save_fingerprint(folder_id, folder_path, fingerprint, len(listing.children))
+                    elif fingerprints[folder_id] == (folder_path, fingerprint):
+                        # 子项集合与上次完全相同，按目录整体写入
+                        await self._touch_folder(folder_id, stamp)
+                        skipped += 1
+                    else:
+                        pending += len(listing.children)
+                        await self._diff_page(listing, folder_id, listing.children, stamp, batch)
+                        # 有文件处理失败时不保存指纹，下次扫描重新比对该目录
+                        if listing.complete:
+                            await self._save_fingerprint(folder_id, folder_path, fingerprint, len(listing.children))
+                    await self._finish_frontier(directory, folder_id)
+                    pending += 1
+                elif listing.eager:
+                    # 逐页比对的目录记录已提交到的分页位置
+                    await self._advance_frontier(directory, folder_id, next_token)
                     
-                except Exception as e:
-                    logger.error(f"处理文件出错 [{file.get('name', 'unknown')}]: {str(e)}")
-                    continue
-            
-            # 检查删除的文件
-            deleted_files = await self._find_deleted_files(directory, current_file_ids)
-            changes.extend(deleted_files)
-            
-            # 提交更改
-            await self.db_session.commit()
-            
-            # 更新统计信息
-            self._last_scan_duration = (datetime.now() - start_time).total_seconds()
+                # 攒满一批，或者下一页还没到（马上要等待网络）时提交
+                if pending >= batch_size or (batch and pages.empty()):
+                    total += await self._commit_batch(batch, on_changes)
+                    batch = []
+                    pending = 0
+                    
+            # 完整遍历后才检测删除，并在同一事务中删除检查点
+            batch.extend(await self._find_deleted_files(directory, generation, root_path, exclude_paths))
+            await self._clear_checkpoint(directory)
+            total += await self._commit_batch(batch, on_changes)
             
-            return changes
+        except asyncio.CancelledError:
+            # 服务停止：丢弃未提交批次的聚合和缓存标签，会话由调用方关闭，下次从检查点继续
+            self._aggregates.clear()
+            self._changed_tags.clear()
+            raise
             
         except Exception as e:
             logger.error(f"扫描目录出错 [{directory}]: {str(e)}")
+            self._aggregates.clear()
+            self._changed_tags.clear()
             await self.db_session.rollback()
             raise
             
         finally:
-            # 清理过期的缓存记录
-            await self._cleanup_expired_records()
+            if lister is not None:
+                lister.cancel()
+                await asyncio.gather(lister, return_exceptions=True)
+                
+        # 更新统计信息
+        self._last_scan_duration = (datetime.now() - start_time).total_seconds()
+        self._skipped_folders += skipped
+        logger.debug(
+            f"扫描完成 [{directory}]: {len(fingerprints)} 个已知目录，跳过 {skipped} 个未变化目录，"
+            f"{total} 个变更"
+        )
+        
+        return total
+        
+    async def _list_tree(self, frontier: List[Tuple[str, str, Optional[str]]], pages: asyncio.Queue):
+        """列出目录树（生产者）
+        
+        从扫描前沿开始，多个任务并发列出目录，每一页子项按
+        (目录ID, 目录路径, 子项, 下一页的 pageToken) 放入 pages 队列，最后一页的
+        pageToken 为 None。全部列出后放入 None；出错时把异常放入队列交给比对阶段抛出。
+        
+        Drive 允许同一目录下有同名子项，它们对应同一个相对路径：只保留先列出的一个，
+        其余的记录日志后丢弃（同名目录也不再列出），每次扫描的结果一致。
+        
+        Args:
+            frontier: (目录ID, 目录路径, 起始 pageToken) 列表
+            pages: 输出队列
+        """
+        folders: asyncio.Queue = asyncio.Queue()
+        queued: Set[str] = set()
+        for folder_id, folder_path, page_token in frontier:
+            folders.put_nowait((folder_id, folder_path, page_token))
+            queued.add(folder_id)
+            
+        async def worker():
+            while True:
+                folder_id, folder_path, page_token = await folders.get()
+                names: Set[str] = set()
+                try:
+                    while True:
+                        page = await self.gdrive_client.list_page(folder_id, page_token)
+                        files = []
+                        for file in page.get('files', []):
+                            if file['name'] in names:
+                                logger.warning(
+                                    f"同一目录下有同名文件，只保留先列出的一个 "
+                                    f"[{join_path(folder_path, file['name'])}]: 忽略 {file['id']}"
+                                )
+                                continue
+                            names.add(file['name'])
+                            files.append(file)
+                        # 子目录先入队，保证 folders.join() 不会提前结束；
+                        # 从检查点继续时前沿里可能已经有这个子目录
+                        for file in files:
+                            if file['mimeType'] == FOLDER_MIME_TYPE and file['id'] not in queued:
+                                queued.add(file['id'])
+                                folders.put_nowait((file['id'], join_path(folder_path, file['name']), None))
+                        page_token = page.get('nextPageToken') or None
+                        await pages.put((folder_id, folder_path, files, page_token))
+                        if not page_token:
+                            break
+                finally:
+                    folders.task_done()
+                    
+        workers = [
+            asyncio.create_task(worker())
+            for _ in range(settings.monitor.list_concurrency)
+        ]
+        join = asyncio.create_task(folders.join())
+        try:
+            done, _ = await asyncio.wait([join, *workers], return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task is not join:
+                    # 列出任务只会因为异常结束
+                    task.result()
+            await pages.put(None)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            await pages.put(e)
+        finally:
+            for task in [join, *workers]:
+                task.cancel()
+            await asyncio.gather(join, *workers, return_exceptions=True)
+            
+    async def _load_checkpoint(
+        self,
+        directory: str,
+        root_path: str
+    ) -> Tuple[datetime, int, List[Tuple[str, str, Optional[str]]], bool]:
+        """加载或创建扫描检查点
+        
+        存在可用的检查点时沿用它的扫描开始时间、代数和前沿；检查点过期或根路径
+        已改变时丢弃，从根目录重新开始。新一轮扫描的代数是该根目录记录的最大代数加一。
+        
+        Returns:
+            (扫描开始时间, 扫描代数, [(目录ID, 目录路径, 起始 pageToken)], 是否从检查点继续)
+        """
+        checkpoint = await self.db_session.get(ScanCheckpoint, directory)
+        if checkpoint is not None:
+            age = (datetime.utcnow() - checkpoint.checked_at).total_seconds()
+            if checkpoint.root_path == root_path and age <= settings.monitor.checkpoint_max_age:
+                result = await self.db_session.execute(
+                    select(ScanFrontier.folder_id, ScanFrontier.path, ScanFrontier.page_token)
+                    .where(ScanFrontier.root_id == directory)
+                    .order_by(ScanFrontier.id)
+                )
+                # 前沿为空说明遍历已经完成、只差删除检测
+                frontier = [tuple(row) for row in result]
+                logger.info(f"从检查点继续扫描 [{directory}]: {len(frontier)} 个未完成目录")
+                return checkpoint.checked_at, checkpoint.generation, frontier, True
+            await self._clear_checkpoint(directory)
+            
+        checked_at = datetime.utcnow()
+        # 沿 (root_id, scan_generation) 索引取最大代数
+        latest = await self.db_session.scalar(
+            select(func.max(FileRecord.scan_generation)).where(FileRecord.root_id == directory)
+        )
+        generation = (latest or 0) + 1
+        self.db_session.add(ScanCheckpoint(
+            root_id=directory,
+            root_path=root_path,
+            checked_at=checked_at,
+            generation=generation
+        ))
+        self.db_session.add(ScanFrontier(root_id=directory, folder_id=directory, path=root_path))
+        await self.db_session.commit()
+        return checked_at, generation, [(directory, root_path, None)], False
+        
+    async def _add_frontier(self, directory: str, folder_path: str, files: List[Dict]):
+        """把一页中的子目录加入扫描前沿"""
+        rows = [
+            {"root_id": directory, "folder_id": f['id'], "path": join_path(folder_path, f['name'])}
+            for f in files
+            if f['mimeType'] == FOLDER_MIME_TYPE
+        ]
+        for i in range(0, len(rows), self.QUERY_CHUNK_SIZE):
+            await self.db_session.execute(
+                insert(ScanFrontier).values(rows[i:i + self.QUERY_CHUNK_SIZE]).on_conflict_do_nothing()
+            )
+            
+    async def _advance_frontier(self, directory: str, folder_id: str, page_token: str):
+        """记录目录已处理到的分页位置"""
+        await self.db_session.execute(
+            update(ScanFrontier)
+            .where(ScanFrontier.root_id == directory, ScanFrontier.folder_id == folder_id)
+            .values(page_token=page_token)
+        )
+        
+    async def _finish_frontier(self, directory: str, folder_id: str):
+        """目录处理完成，从扫描前沿移除"""
+        await self.db_session.execute(
+            delete(ScanFrontier)
+            .where(ScanFrontier.root_id == directory, ScanFrontier.folder_id == folder_id)
+        )
+        
+    async def _clear_checkpoint(self, directory: str):
+        """删除根目录的检查点和扫描前沿"""
+        await self.db_session.execute(delete(ScanFrontier).where(ScanFrontier.root_id == directory))
+        await self.db_session.execute(delete(ScanCheckpoint).where(ScanCheckpoint.root_id == directory))
+        
+    async def _commit_batch(
+        self,
+        changes: List[Dict],
+        on_changes: Optional[Callable[[List[Dict]], Awaitable[None]]]
+    ) -> int:
+        """提交一批写入并发出变更
+        
+        Returns:
+            本批变更数量
+        """
+        # 变更事件日志、目录聚合与文件记录在同一事务中提交
+        await EventJournal.append(self.db_session, changes)
+        await self._aggregates.flush(self.db_session)
+        await self.db_session.commit()
+        await self._invalidate_cache()
+        if changes and on_changes:
+            await on_changes(changes)
+        return len(changes)
+        
+    async def _load_fingerprints(self) -> Dict[str, Tuple[str, str]]:
+        """加载上次扫描保存的目录指纹: folder_id -> (路径, 指纹)"""
+        result = await self.db_session.execute(
+            select(
+                DirectoryFingerprint.folder_id,
+                DirectoryFingerprint.path,
+                DirectoryFingerprint.fingerprint
+            )
+        )
+        return {folder_id: (path, fingerprint) for folder_id, path, fingerprint in result}
+        
+    async def _save_fingerprint(self, folder_id: str, path: str, fingerprint: str, child_count: int):
+        """保存目录指纹，与文件记录处于同一事务"""
+        stmt = insert(DirectoryFingerprint).values(
+            folder_id=folder_id,
+            path=path,
+            fingerprint=fingerprint,
+            child_count=child_count
+        )
+        await self.db_session.execute(stmt.on_conflict_do_update(
+            index_elements=[DirectoryFingerprint.folder_id],
+            set_={
+                "path": stmt.excluded.path,
+                "fingerprint": stmt.excluded.fingerprint,
+                "child_count": stmt.excluded.child_count,
+                "updated_at": func.now()
+            }
+        ))
+        
+    async def _touch_folder(self, folder_id: str, stamp: Dict, file_ids: Optional[List[str]] = None):
+        """把本轮的根目录、代数和检查时间批量写入目录下的记录
+        
+        Args:
+            folder_id: 目录ID
+            stamp: 本轮的根目录、代数和检查时间
+            file_ids: 只写入这些文件；为空时写入目录下的所有记录（只用于子项未变化的目录，
+                否则已经消失的文件也会被写入，无法检测删除）
+        """
+        stmt = FileRecord.__table__.update().where(FileRecord.parent_id == folder_id).values(**stamp)
+        if file_ids is None:
+            await self.db_session.execute(stmt)
+            return
+        for i in range(0, len(file_ids), self.QUERY_CHUNK_SIZE):
+            await self.db_session.execute(
+                stmt.where(FileRecord.file_id.in_(file_ids[i:i + self.QUERY_CHUNK_SIZE]))
+            )
+        
+    async def _diff_page(
+        self,
+        listing: "FolderListing",
+        folder_id: str,
+        files: List[Dict],
+        stamp: Dict,
+        changes: List[Dict]
+    ):
+        """比对目录的一页子项与数据库记录
+        
+        新增或移动的文件要写入的路径可能仍被另一个文件ID的记录占用（删除后重新上传、
+        两个文件交换名称等），旧记录要到完整遍历后才按代数删除。写入前先释放路径：
+        删除占用的记录并发出 deleted 变更，如果那个文件仍然存在，会在遍历到时重新新增。
+        
+        Args:
+            listing: 目录的列出进度，有文件处理失败时标记为不完整
+            folder_id: 目录ID
+            files: 本页子项
+            stamp: 本轮的根目录、代数和检查时间
+            changes: 变更追加到这个列表
+        """
+        existing_records = await self._get_existing_records({f['id'] for f in files})
+        records_by_id = {record.file_id: record for record in existing_records}
+        
+        # 需要写入新路径的文件：没有记录或者路径改变
+        targets = [
+            join_path(listing.path, f['name']) for f in files
+            if f['id'] not in records_by_id
+            or records_by_id[f['id']].path != join_path(listing.path, f['name'])
+        ]
+        holders = await self._get_path_holders(targets)
+        
+        for file in files:
+            try:
+                modified_time = parse_drive_time(file['modifiedTime'])
+                path = join_path(listing.path, file['name'])
+                existing_record = records_by_id.get(file['id'])
+                
+                holder = holders.pop(path, None)
+                if holder is not None and holder.file_id != file['id']:
+                    await self._release_path(holder, path, records_by_id, changes)
+                    
+                if not existing_record:
+                    # 新文件
+                    changes.append({
+                        'type': 'added',
+                        'file': file
+                    })
+                    await self._create_file_record(file, modified_time, path, folder_id, stamp)
+                elif existing_record.path != path:
+                    # 文件重命名或移动：带上原路径，事件处理时删除原路径上的软链接
+                    changes.append({
+                        'type': 'moved',
+                        'file': file,
+                        'old_path': existing_record.path
+                    })
+                    await self._update_file_record(existing_record, file, modified_time, path, folder_id, stamp)
+                elif existing_record.modified_time < modified_time:
+                    # 文件已修改
+                    changes.append({
+                        'type': 'modified',
+                        'file': file
+                    })
+                    await self._update_file_record(existing_record, file, modified_time, path, folder_id, stamp)
+                elif existing_record.parent_id != folder_id:
+                    # 升级前写入的记录没有所在目录，只补齐记录，不发出变更
+                    await self._update_file_record(existing_record, file, modified_time, path, folder_id, stamp)
+                    
+            except Exception as e:
+                logger.error(f"处理文件出错 [{file.get('name', 'unknown')}]: {str(e)}")
+                listing.complete = False
+                continue
+                
+        # 未变化的子项只批量写入本轮代数
+        await self._touch_folder(folder_id, stamp, [f['id'] for f in files])
 
-    @cached(prefix="file_scanner", ttl=60)
     async def _get_existing_records(self, file_ids: Set[str]) -> List[FileRecord]:
         """获取现有文件记录
         
+        返回会话中的记录而不是缓存快照，扫描时需要直接修改或删除它们。
+        
         Args:
             file_ids: 文件ID集合
             
         Returns:
             文件记录列表
         """
-        result = await self.db_session.execute(
-            select(FileRecord).where(FileRecord.file_id.in_(file_ids))
-        )
-        return result.scalars().all()
+        file_ids = list(file_ids)
+        records = []
+        for i in range(0, len(file_ids), self.QUERY_CHUNK_SIZE):
+            result = await self.db_session.execute(
+                select(FileRecord).where(FileRecord.file_id.in_(file_ids[i:i + self.QUERY_CHUNK_SIZE]))
+            )
+            records.extend(result.scalars().all())
+        return records
 
-    async def _create_file_record(self, file: Dict, modified_time: datetime):
+    async def _get_path_holders(self, paths: List[str]) -> Dict[str, FileRecord]:
+        """获取占用这些路径的现有记录
+        
+        会话不自动 flush，先写入之前各页尚未提交的记录更新，查询结果才与本次扫描一致。
+        
+        Args:
+            paths: 相对路径列表
+            
+        Returns:
+            路径 -> 记录
+        """
+        if not paths:
+            return {}
+        await self.db_session.flush()
+        holders = {}
+        for i in range(0, len(paths), self.QUERY_CHUNK_SIZE):
+            result = await self.db_session.execute(
+                select(FileRecord).where(FileRecord.path.in_(paths[i:i + self.QUERY_CHUNK_SIZE]))
+            )
+            holders.update((record.path, record) for record in result.scalars())
+        return holders
+        
+    async def _release_path(
+        self,
+        holder: FileRecord,
+        path: str,
+        records_by_id: Dict[str, FileRecord],
+        changes: List[Dict]
+    ):
+        """释放被另一个文件的记录占用的路径
+        
+        占用的记录在本页中已经移走时只需写入它的新路径；否则删除该记录并发出 deleted 变更，
+        它如果在本页中还没处理到，从 records_by_id 中移除，稍后按新增处理。
+        新记录写入之前立即 flush：同一批中的删除在更新和插入之后才执行，会违反路径唯一约束。
+        
+        Args:
+            holder: 占用路径的记录
+            path: 要写入的路径
+            records_by_id: 本页的现有记录
+            changes: 变更追加到这个列表
+        """
+        if holder.path == path:
+            logger.info(f"路径被另一个文件的记录占用，删除旧记录 [{path}]: {holder.file_id}")
+            changes.append({
+                'type': 'deleted',
+                'file': holder.to_dict()
+            })
+            self._aggregates.remove_record(holder)
+            self._mark_changed(holder.path, holder.file_id)
+            records_by_id.pop(holder.file_id, None)
+            await self.db_session.delete(holder)
+        await self.db_session.flush()
+        
+    async def _create_file_record(
+        self,
+        file: Dict,
+        modified_time: datetime,
+        path: str,
+        parent_id: str,
+        stamp: Dict
+    ):
         """创建新的文件记录
         
         Args:
             file: 文件信息
             modified_time: 修改时间
+            path: 相对路径
+            parent_id: 所在目录ID
+            stamp: 本轮的根目录、代数和检查时间
         """
-        # 构建相对路径
-        relative_path = file['name']  # Google Drive API 返回的路径
-        
         record = FileRecord(
             file_id=file['id'],
-            path=relative_path,
+            parent_id=parent_id,
+            path=path,
             modified_time=modified_time,
             size=int(file.get('size', 0)),
-            is_directory=file['mimeType'] == 'application/vnd.google-apps.folder',
-            mime_type=file['mimeType']
+            is_directory=file['mimeType'] == FOLDER_MIME_TYPE,
+            mime_type=file['mimeType'],
+            **stamp
         )
         self.db_session.add(record)
+        self._aggregates.add_record(record)
+        self._mark_changed(record.path, record.file_id)
 
-    async def _update_file_record(self, record: FileRecord, file: Dict, modified_time: datetime):
+    async def _update_file_record(
+        self,
+        record: FileRecord,
+        file: Dict,
+        modified_time: datetime,
+        path: str,
+        parent_id: str,
+        stamp: Dict
+    ):
         """更新现有文件记录
         
         Args:
             record: 现有记录
             file: 新的文件信息
             modified_time: 修改时间
+            path: 相对路径
+            parent_id: 所在目录ID
+            stamp: 本轮的根目录、代数和检查时间
         """
+        self._aggregates.remove_record(record)
+        self._mark_changed(record.path, record.file_id)
         record.modified_time = modified_time
         record.size = int(file.get('size', 0))
-        record.path = file['name']
+        record.path = path
+        record.parent_id = parent_id
         record.mime_type = file['mimeType']
+        for key, value in stamp.items():
+            setattr(record, key, value)
+        self._aggregates.add_record(record)
+        self._mark_changed(record.path, record.file_id)
 
-    async def _find_deleted_files(self, directory: str, current_file_ids: Set[str]) -> List[Dict]:
+    async def _find_deleted_files(
+        self,
+        directory: str,
+        generation: int,
+        root_path: str,
+        exclude_paths: Sequence[str] = ()
+    ) -> List[Dict]:
         """查找已删除的文件
         
+        本轮遍历到的记录都已写入当前代数，属于该根目录、代数小于本轮的记录
+        视为已删除，沿 (root_id, scan_generation) 索引查找，开销与删除数量成正比。
+        还没有写入过根目录的旧记录按根目录的路径区间查找。
+        
         Args:
-            directory: 目录路径
-            current_file_ids: 当前文件ID集合
+            directory: 根目录ID
+            generation: 本轮扫描代数
+            root_path: 根目录的相对路径
+            exclude_paths: 由其他根目录负责的子路径（只用于旧记录）
             
         Returns:
             删除的文件列表
         """
-        # 查询数据库中的所有文件记录
-        result = await self.db_session.execute(
-            select(FileRecord).where(
-                and_(
-                    FileRecord.path.like(f"{directory}/%"),
-                    FileRecord.file_id.notin_(current_file_ids)
-                )
+        # 会话不自动 flush，先写入本批尚未提交的记录更新，否则刚移动或修改的记录仍是旧代数
+        await self.db_session.flush()
+        missing = list((await self.db_session.execute(
+            select(FileRecord.id).where(
+                FileRecord.root_id == directory,
+                FileRecord.scan_generation < generation
             )
-        )
-        db_records = result.scalars().all()
+        )).scalars())
+        
+        legacy = select(FileRecord.id).where(FileRecord.root_id.is_(None))
+        if root_path:
+            prefix = f"{root_path}/"
+            legacy = legacy.where(FileRecord.path >= prefix, FileRecord.path < prefix + PATH_RANGE_END)
+        for path in exclude_paths:
+            prefix = f"{path}/"
+            legacy = legacy.where(
+                FileRecord.path != path,
+                or_(FileRecord.path < prefix, FileRecord.path >= prefix + PATH_RANGE_END)
+            )
+        missing.extend((await self.db_session.execute(legacy)).scalars())
         
         deleted_files = []
-        for record in db_records:
-            deleted_files.append({
-                'type': 'deleted',
-                'file': record.to_dict()
-            })
-            await self.db_session.delete(record)
+        for i in range(0, len(missing), self.QUERY_CHUNK_SIZE):
+            result = await self.db_session.execute(
+                select(FileRecord).where(FileRecord.id.in_(missing[i:i + self.QUERY_CHUNK_SIZE]))
+            )
+            for record in result.scalars():
+                deleted_files.append({
+                    'type': 'deleted',
+                    'file': record.to_dict()
+                })
+                self._aggregates.remove_record(record)
+                self._mark_changed(record.path, record.file_id)
+                await self.db_session.delete(record)
                 
         return deleted_files
 
-    async def _cleanup_expired_records(self):
-        """清理过期的记录"""
-        try:
-            # 删除超过30天未检查的记录
-            cutoff_date = datetime.utcnow() - timedelta(days=30)
-            await self.db_session.execute(
-                FileRecord.__table__.delete().where(
-                    FileRecord.last_checked < cutoff_date
-                )
-            )
-            await self.db_session.commit()
-        except Exception as e:
-            logger.error(f"清理过期记录失败: {str(e)}")
-            await self.db_session.rollback() 
\ No newline at end of file
+    def _mark_changed(self, path: str, file_id: str):
+        """记录变更的路径和文件，提交后失效相关缓存"""
+        self._changed_tags.update(path_tags(path))
+        self._changed_tags.add(file_tag(file_id))
+        
+    async def _invalidate_cache(self):
+        """失效本次提交涉及的路径前缀和文件缓存"""
+        if self._changed_tags:
+            removed = await default_cache.ainvalidate_tags(*self._changed_tags)
+            logger.debug(f"扫描提交后失效缓存: {len(self._changed_tags)} 个标签，{removed} 个条目")
+            self._changed_tags.clear()
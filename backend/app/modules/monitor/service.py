@@ -2,28 +2,139 @@
 
 提供文件监控服务，管理扫描任务和事件处理。
 """
+from collections import deque
 from datetime import datetime
+from functools import partial
 import asyncio
+import random
+import time
 from typing import Optional, Callable, Dict, List
 from loguru import logger
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from .scanner import FileScanner
 from .gdrive import GoogleDriveClient
-from .events import FileChangeHandler
+from .events import FileChangeHandler, LANE_SCAN, LANE_BACKFILL
+from .watcher import LocalWatcher
+from .retention import RetentionJob
 from app.core.config import settings
 from app.core.cache import cached
+from app.core.database import AsyncSessionLocal
+
+class WatchRoot:
+    """监控根目录
+    
+    每个根目录有自己的扫描器、扫描间隔、抖动和健康状态，由独立的任务调度。
+    启用自适应间隔时，有变更的扫描把间隔缩短一半（不低于最短间隔），
+    没有变更的扫描按倍数放大间隔（不超过最长间隔）。
+    """
+    
+    def __init__(self, path: str, interval: int, jitter: float, scanner: FileScanner, root_path: str = ""):
+        """初始化根目录
+        
+        Args:
+            path: Google Drive 目录ID
+            interval: 扫描间隔（秒）
+            jitter: 扫描间隔的随机抖动比例
+            scanner: 该根目录专用的扫描器
+            root_path: 该目录在源目录中的相对路径
+        """
+        self.path = path
+        self.root_path = root_path
+        self.base_interval = interval
+        self.interval = interval
+        self.jitter = jitter
+        self.scanner = scanner
+        self.task: Optional[asyncio.Task] = None
+        self.wakeup = asyncio.Event()  # 设置后立即扫描
+        
+        # 调度与健康状态
+        self.next_scan_at: Optional[float] = None  # time.monotonic()
+        self.is_scanning = False
+        self.consecutive_failures = 0
+        self.total_scans = 0
+        self.failed_scans = 0
+        self.total_changes = 0
+        self.last_scan_time: Optional[datetime] = None
+        self.last_success_time: Optional[datetime] = None
+        self.last_scan_duration: Optional[float] = None
+        self.last_lag: Optional[float] = None
+        self.last_error: Optional[Exception] = None
+        
+    @property
+    def healthy(self) -> bool:
+        return self.consecutive_failures == 0
+        
+    def adapt(self, changes: int):
+        """根据本次扫描的变更数量调整扫描间隔"""
+        config = settings.monitor
+        if not config.adaptive_interval:
+            return
+        if changes:
+            interval = max(config.min_scan_interval, self.interval / 2)
+        else:
+            interval = min(config.max_scan_interval, self.interval * config.scan_backoff)
+        if interval != self.interval:
+            logger.debug(f"调整扫描间隔 [{self.path}]: {self.interval:.0f}s -> {interval:.0f}s")
+            self.interval = interval
+            
+    def next_delay(self) -> float:
+        """下一次扫描前的等待时间（带随机抖动）"""
+        return self.interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+        
+    @property
+    def lag(self) -> float:
+        """当前落后于计划扫描时间的秒数（等待扫描名额时增长）"""
+        if self.next_scan_at is None or self.is_scanning:
+            return 0.0
+        return max(0.0, time.monotonic() - self.next_scan_at)
+        
+    @property
+    def stats(self) -> Dict:
+        return {
+            "root_path": self.root_path,
+            "interval": self.interval,
+            "base_interval": self.base_interval,
+            "healthy": self.healthy,
+            "is_scanning": self.is_scanning,
+            "total_scans": self.total_scans,
+            "failed_scans": self.failed_scans,
+            "consecutive_failures": self.consecutive_failures,
+            "total_changes": self.total_changes,
+            "last_scan_time": self.last_scan_time.isoformat() if self.last_scan_time else None,
+            "last_success_time": self.last_success_time.isoformat() if self.last_success_time else None,
+            "last_scan_duration": self.last_scan_duration,
+            "last_lag": self.last_lag,
+            "lag": self.lag,
+            "next_scan_in": max(0.0, self.next_scan_at - time.monotonic()) if self.next_scan_at else None,
+            "last_error": str(self.last_error) if self.last_error else None
+        }
 
 class MonitorService:
     """监控服务
     
     提供文件监控服务，管理扫描任务和事件处理。
-    支持本地文件和 Google Drive 文件的监控。
+    每个监控根目录由独立的任务按各自的间隔扫描，同时进行的扫描数量受
+    max_concurrent_scans 限制；某个根目录变慢或失败不会影响其他根目录。
     """
     
+    _instance = None
+    
+    @classmethod
+    def get_instance(cls) -> 'MonitorService':
+        """获取监控服务实例（单例）"""
+        if cls._instance is None:
+            drive_client = GoogleDriveClient()
+            cls._instance = cls(
+                lambda: FileScanner(AsyncSessionLocal(), drive_client),
+                drive_client=drive_client,
+                event_callback=FileChangeHandler.get_instance().handle_changes
+            )
+        return cls._instance
+        
     def __init__(
         self,
-        scanner: FileScanner,
+        scanner_factory: Callable[[], FileScanner],
         drive_client: Optional[GoogleDriveClient] = None,
         event_callback: Optional[Callable] = None,
         max_retries: int = 3,
@@ -32,27 +143,63 @@ class MonitorService:
         """初始化服务
         
         Args:
-            scanner: 文件扫描器
+            scanner_factory: 创建扫描器的函数，每个根目录使用独立的扫描器和数据库会话
             drive_client: Google Drive 客户端
             event_callback: 事件回调函数
-            max_retries: 最大重试次数
+            max_retries: 连续失败多少次后按正常间隔重试（之前按 retry_delay 递增重试）
             retry_delay: 重试延迟（秒）
         """
-        self.scanner = scanner
+        self.scanner_factory = scanner_factory
         self.drive_client = drive_client
         self.event_callback = event_callback
         self.max_retries = max_retries
         self.retry_delay = retry_delay
         
+        # 监控根目录
+        config = settings.monitor
+        self.roots: Dict[str, WatchRoot] = {}
+        for item in [{"path": config.source_dir}] + [watch.dict() for watch in config.watch_paths]:
+            if item["path"] in self.roots:
+                continue
+            self.roots[item["path"]] = WatchRoot(
+                item["path"],
+                item.get("scan_interval") or config.scan_interval,
+                item.get("jitter") if item.get("jitter") is not None else config.scan_jitter,
+                scanner_factory(),
+                item.get("root_path") or ""
+            )
+        self._scan_slots = asyncio.Semaphore(config.max_concurrent_scans)
+        
         # 服务状态
         self.is_running = False
-        self._monitor_task = None
-        self._current_retry_count = 0
-        self._total_scans = 0
-        self._failed_scans = 0
-        self._last_scan_time = None
         self._last_error = None
         
+        # 最近的监控日志
+        self._logs = deque(maxlen=1000)
+        
+    def _add_log(self, level: str, message: str):
+        """记录一条监控日志"""
+        self._logs.append({
+            "time": datetime.now().isoformat(),
+            "level": level,
+            "message": message
+        })
+        
+    def get_logs(self, limit: int = 100) -> List[Dict]:
+        """获取最近的监控日志（新的在前）
+        
+        Args:
+            limit: 最大返回数量
+            
+        Returns:
+            日志列表
+        """
+        return list(reversed(self._logs))[:limit]
+        
+    def clear_logs(self):
+        """清空监控日志"""
+        self._logs.clear()
+        
     async def start(self):
         """启动监控服务"""
         if self.is_running:
@@ -69,37 +216,52 @@ class MonitorService:
                 raise
             
         self.is_running = True
-        self._monitor_task = asyncio.create_task(self._monitor_loop())
-        logger.info("监控服务已启动")
+        for root in self.roots.values():
+            root.task = asyncio.create_task(self._root_loop(root))
+        logger.info(f"监控服务已启动: {len(self.roots)} 个根目录")
         
     async def stop(self):
-        """停止监控服务"""
+        """停止监控服务：取消并等待各根目录的扫描任务"""
         if not self.is_running:
             logger.warning("监控服务未运行")
             return
             
         self.is_running = False
-        if self._monitor_task:
-            self._monitor_task.cancel()
-            try:
-                await self._monitor_task
-            except asyncio.CancelledError:
-                pass
-            self._monitor_task = None
+        tasks = [root.task for root in self.roots.values() if root.task]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for root in self.roots.values():
+            root.task = None
+            root.next_scan_at = None
+            # 被取消的扫描没有回滚，归还会话占用的连接（已提交的批次和检查点保留）
+            await root.scanner.db_session.close()
             
         logger.info("监控服务已停止")
         
     @property
     def stats(self) -> Dict:
         """获取服务统计信息"""
+        roots = list(self.roots.values())
+        last_root = max(
+            (root for root in roots if root.last_scan_time),
+            key=lambda root: root.last_scan_time,
+            default=None
+        )
+        last_error = next((root.last_error for root in roots if root.last_error), None) or self._last_error
         stats = {
             "is_running": self.is_running,
-            "total_scans": self._total_scans,
-            "failed_scans": self._failed_scans,
-            "last_scan_time": self._last_scan_time.isoformat() if self._last_scan_time else None,
-            "current_retry_count": self._current_retry_count,
-            "last_error": str(self._last_error) if self._last_error else None,
-            "scanner_stats": self.scanner.stats if hasattr(self.scanner, 'stats') else None,
+            "total_scans": sum(root.total_scans for root in roots),
+            "failed_scans": sum(root.failed_scans for root in roots),
+            "last_scan_time": last_root.last_scan_time.isoformat() if last_root else None,
+            "last_scan_duration": last_root.last_scan_duration if last_root else None,
+            "total_changes": sum(root.total_changes for root in roots),
+            "last_error": str(last_error) if last_error else None,
+            "roots": {root.path: root.stats for root in roots},
+            "scanner_stats": {root.path: root.scanner.stats for root in roots},
+            "event_stats": FileChangeHandler.get_instance().stats,
+            "local_watch": LocalWatcher._instance.stats if LocalWatcher._instance else None,
+            "retention": RetentionJob._instance.stats if RetentionJob._instance else None,
             "drive_enabled": self.drive_client is not None
         }
         
@@ -109,42 +271,113 @@ class MonitorService:
             
         return stats
         
-    async def _monitor_loop(self):
-        """监控循环"""
+    async def _root_loop(self, root: WatchRoot):
+        """单个根目录的调度循环：首次立即扫描，之后按间隔（带抖动）扫描"""
+        # 首次扫描稍微错开，避免所有根目录同时请求
+        root.next_scan_at = time.monotonic() + random.uniform(0, root.jitter * 10)
         while self.is_running:
-            try:
-                self._total_scans += 1
-                self._last_scan_time = datetime.now()
-                
-                # 执行扫描
-                changes = await self.scanner.scan_directory(settings.monitor.source_dir)
-                
-                # 如果有变更且回调函数存在，则调用回调
-                if changes and self.event_callback:
-                    try:
-                        await self.event_callback(changes)
-                    except Exception as e:
-                        logger.error(f"处理变更回调失败: {str(e)}")
-                
-                # 重置重试计数
-                self._current_retry_count = 0
-                self._last_error = None
-                    
-                # 等待下一次扫描
-                await asyncio.sleep(settings.monitor.scan_interval)
-                
-            except Exception as e:
-                self._failed_scans += 1
-                self._last_error = e
-                logger.error(f"监控循环出错: {str(e)}")
+            delay = root.next_scan_at - time.monotonic()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(root.wakeup.wait(), delay)
+                    # 被立即扫描请求唤醒：从现在开始计算落后时间
+                    root.next_scan_at = time.monotonic()
+                except asyncio.TimeoutError:
+                    pass
+            root.wakeup.clear()
+            
+            async with self._scan_slots:
+                root.last_lag = max(0.0, time.monotonic() - root.next_scan_at)
+                success = await self._scan_root(root)
                 
-                # 处理重试逻辑
-                if self._current_retry_count < self.max_retries:
-                    self._current_retry_count += 1
-                    retry_time = self.retry_delay * self._current_retry_count
-                    logger.info(f"将在 {retry_time} 秒后重试（第 {self._current_retry_count} 次）")
-                    await asyncio.sleep(retry_time)
-                else:
-                    logger.error("达到最大重试次数，停止监控服务")
-                    await self.stop()
-                    break 
\ No newline at end of file
+            if success or root.consecutive_failures > self.max_retries:
+                delay = root.next_delay()
+            else:
+                delay = min(self.retry_delay * root.consecutive_failures, root.interval)
+                logger.info(f"将在 {delay} 秒后重试 [{root.path}]（第 {root.consecutive_failures} 次）")
+            root.next_scan_at = time.monotonic() + delay
+            
+    def request_scan(self, path: Optional[str] = None) -> List[str]:
+        """请求立即扫描（例如收到变更推送时）
+        
+        被请求的根目录同时把扫描间隔重置为最短间隔，之后再按变更情况调整。
+        
+        Args:
+            path: 根目录，为空时扫描全部根目录
+            
+        Returns:
+            被请求扫描的根目录
+            
+        Raises:
+            KeyError: 根目录不存在
+        """
+        roots = [self.roots[path]] if path is not None else list(self.roots.values())
+        for root in roots:
+            if settings.monitor.adaptive_interval:
+                root.interval = min(root.interval, settings.monitor.min_scan_interval)
+            root.wakeup.set()
+        return [root.path for root in roots]
+        
+    async def _scan_root(self, root: WatchRoot) -> bool:
+        """扫描一个根目录并提交变更
+        
+        Returns:
+            是否扫描成功
+        """
+        root.is_scanning = True
+        root.total_scans += 1
+        root.last_scan_time = datetime.now()
+        start_time = time.monotonic()
+        try:
+            changes = await root.scanner.scan_directory(
+                root.path,
+                root.root_path,
+                on_changes=partial(self._emit_changes, root),
+                exclude_paths=self._nested_root_paths(root)
+            )
+        except Exception as e:
+            root.failed_scans += 1
+            root.consecutive_failures += 1
+            root.last_error = e
+            logger.error(f"扫描根目录出错 [{root.path}]: {str(e)}")
+            self._add_log("error", f"扫描失败 [{root.path}]: {str(e)}")
+            if root.consecutive_failures == self.max_retries + 1:
+                logger.error(f"根目录连续失败 {root.consecutive_failures} 次，改为按正常间隔重试 [{root.path}]")
+            return False
+        finally:
+            root.is_scanning = False
+            root.last_scan_duration = time.monotonic() - start_time
+            
+        root.consecutive_failures = 0
+        root.last_error = None
+        root.last_success_time = datetime.now()
+        root.total_changes += changes
+        root.adapt(changes)
+        self._add_log("info", f"扫描完成 [{root.path}]，发现 {changes} 个变更，耗时 {root.last_scan_duration:.1f}s")
+        return True
+        
+    def _nested_root_paths(self, root: WatchRoot) -> List[str]:
+        """位于该根目录路径下的其他根目录路径（它们的记录由各自的扫描负责）"""
+        prefix = f"{root.root_path}/" if root.root_path else ""
+        return [
+            other.root_path
+            for other in self.roots.values()
+            if other is not root
+            and other.root_path
+            and other.root_path.startswith(prefix)
+            and other.root_path != root.root_path
+        ]
+        
+    async def _emit_changes(self, root: WatchRoot, changes: List[Dict]):
+        """扫描每提交一批变更后调用回调（回调失败不影响扫描）
+        
+        完整同步的变更走回填通道，增量扫描的变更走扫描通道。
+        """
+        if not self.event_callback:
+            return
+        lane = LANE_BACKFILL if root.scanner.full_sync else LANE_SCAN
+        try:
+            await self.event_callback(changes, lane=lane)
+        except Exception as e:
+            self._last_error = e
+            logger.error(f"处理变更回调失败: {str(e)}")
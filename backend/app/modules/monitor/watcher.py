@@ -0,0 +1,392 @@
+"""本地文件监控模块
+
+监听本地（或 rclone 挂载的）源目录，把文件变更直接提交给 FileChangeHandler，
+不必等到下一次扫描。Linux 上通过 ctypes 调用 libc 的 inotify 接口，不依赖外部服务；
+不产生 inotify 事件的 FUSE 挂载和其他平台回退为定时轮询。
+"""
+import asyncio
+import ctypes
+import ctypes.util
+import os
+import struct
+import sys
+import threading
+from typing import Dict, List, Optional, Tuple
+from loguru import logger
+
+from .events import FileChangeHandler, LANE_LIVE, LANE_BACKFILL
+from .journal import EventJournal
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+
+# inotify 事件掩码（见 <sys/inotify.h>）
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+# 文件写完（close_write）或移入时才算新增，避免处理写了一半的文件
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_ONLYDIR
+
+# struct inotify_event 的固定部分：wd, mask, cookie, len
+_EVENT_HEADER = struct.Struct("iIII")
+
+# 事件攒批提交的间隔（秒）
+FLUSH_INTERVAL = 0.2
+
+class Inotify:
+    """inotify 的最小 ctypes 封装"""
+    
+    def __init__(self):
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+        self.fd = fd
+        
+    def add_watch(self, path: str, mask: int) -> int:
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error), path)
+        return wd
+        
+    def read_events(self) -> List[Tuple[int, int, str]]:
+        """读取已到达的事件，返回 (wd, mask, name) 列表"""
+        try:
+            data = os.read(self.fd, 256 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            events.append((wd, mask, os.fsdecode(name)))
+        return events
+        
+    def close(self):
+        os.close(self.fd)
+
+def is_fuse_mount(path: str) -> bool:
+    """路径是否位于 FUSE 挂载上（rclone mount 等通常不产生 inotify 事件）"""
+    try:
+        with open("/proc/mounts") as f:
+            mounts = [line.split() for line in f]
+    except OSError:
+        return False
+    best, fstype = "", ""
+    for parts in mounts:
+        mount_point = parts[1].replace("\\040", " ")
+        prefix = mount_point.rstrip("/") + "/"
+        if (path == mount_point or path.startswith(prefix)) and len(mount_point) > len(best):
+            best, fstype = mount_point, parts[2]
+    return fstype.startswith("fuse")
+
+class LocalWatcher:
+    """本地文件监控器
+    
+    每个监控目录独立选择 inotify 或轮询。inotify 为每个子目录注册监听，新目录出现时
+    递归注册并补发其中已有的文件；内核事件队列溢出时重新扫描使用 inotify 的目录，
+    与已知状态比较后补发差异。轮询模式定时遍历目录并比较修改时间和大小。
+    """
+    
+    _instance = None
+    
+    @classmethod
+    def get_instance(cls) -> 'LocalWatcher':
+        """获取本地文件监控器实例（单例）"""
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+        
+    def __init__(self, handler: Optional[FileChangeHandler] = None):
+        """初始化监控器
+        
+        Args:
+            handler: 变更处理器，默认使用全局实例
+        """
+        config = settings.monitor.local_watch
+        self.source_root = os.path.abspath(settings.symlink.source_dir)
+        self.paths = [
+            os.path.abspath(os.path.join(self.source_root, path))
+            for path in config.paths
+        ] or [self.source_root]
+        self.backend = config.backend
+        self.poll_interval = config.poll_interval
+        self.handler = handler or FileChangeHandler.get_instance()
+        
+        self._inotify: Optional[Inotify] = None
+        self._watches: Dict[int, str] = {}  # wd -> 目录绝对路径
+        self._watch_lock = threading.Lock()  # 目录注册在线程中进行
+        self._known: Dict[str, Tuple[float, int]] = {}  # 相对路径 -> (修改时间, 大小)
+        self._pending: Dict[str, List[Dict]] = {}  # 通道 -> 待提交的变更
+        self._inotify_roots: List[str] = []
+        self._poll_roots: List[str] = []
+        self._tasks: List[asyncio.Task] = []
+        self._running = False
+        
+        # 统计信息
+        self._events = 0
+        self._overflows = 0
+        self._rescans = 0
+        self._last_error = None
+        
+    @property
+    def is_running(self) -> bool:
+        return self._running
+        
+    @property
+    def stats(self) -> Dict:
+        """获取监控器统计信息"""
+        return {
+            "is_running": self._running,
+            "inotify_roots": list(self._inotify_roots),
+            "poll_roots": list(self._poll_roots),
+            "watches": len(self._watches),
+            "known_files": len(self._known),
+            "events": self._events,
+            "overflows": self._overflows,
+            "rescans": self._rescans,
+            "last_error": str(self._last_error) if self._last_error else None
+        }
+        
+    def _choose_backend(self, path: str) -> str:
+        if self.backend != "auto":
+            return self.backend
+        if not sys.platform.startswith("linux") or is_fuse_mount(path):
+            return "polling"
+        return "inotify"
+        
+    async def start(self):
+        """注册监听并记录现有文件（已有文件视为已处理，由扫描和重建负责）"""
+        if self._running:
+            return
+        self._running = True
+        loop = asyncio.get_running_loop()
+        
+        for path in self.paths:
+            if not os.path.isdir(path):
+                logger.warning(f"本地监控目录不存在: {path}")
+                continue
+            if self._choose_backend(path) == "inotify":
+                try:
+                    if self._inotify is None:
+                        self._inotify = Inotify()
+                        loop.add_reader(self._inotify.fd, self._on_readable)
+                    await asyncio.to_thread(self._add_tree, path)
+                    self._inotify_roots.append(path)
+                except OSError as e:
+                    # 例如超过 fs.inotify.max_user_watches
+                    logger.warning(f"inotify 不可用，改为轮询 [{path}]: {str(e)}")
+                    self._last_error = e
+                    self._poll_roots.append(path)
+            else:
+                self._poll_roots.append(path)
+            # 先注册监听再记录现有文件，期间出现的文件不会遗漏
+            self._known.update(await asyncio.to_thread(self._walk, path))
+            
+        self._tasks.append(asyncio.create_task(self._flush_loop()))
+        if self._poll_roots:
+            self._tasks.append(asyncio.create_task(self._poll_loop()))
+        logger.info(
+            f"本地文件监控已启动: inotify {len(self._inotify_roots)} 个目录"
+            f"（{len(self._watches)} 个监听），轮询 {len(self._poll_roots)} 个目录"
+        )
+        
+    async def stop(self):
+        """停止监控并提交剩余的变更"""
+        if not self._running:
+            return
+        self._running = False
+        if self._inotify is not None:
+            asyncio.get_running_loop().remove_reader(self._inotify.fd)
+            self._inotify.close()
+            self._inotify = None
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await self._flush()
+        self._watches.clear()
+        self._inotify_roots = []
+        self._poll_roots = []
+        logger.info("本地文件监控已停止")
+        
+    def _relative(self, path: str) -> Optional[str]:
+        relative = os.path.relpath(path, self.source_root).replace(os.sep, "/")
+        return None if relative.startswith("..") else relative
+        
+    def _add_tree(self, path: str):
+        """为目录及其所有子目录注册监听（在线程中运行）"""
+        inotify = self._inotify
+        if inotify is None:
+            return
+        for directory, _, _ in os.walk(path):
+            wd = inotify.add_watch(directory, WATCH_MASK)
+            with self._watch_lock:
+                self._watches[wd] = directory
+                
+    def _walk(self, path: str) -> Dict[str, Tuple[float, int]]:
+        """遍历目录下的所有文件（在线程中运行）"""
+        files = {}
+        for directory, _, names in os.walk(path):
+            for name in names:
+                full_path = os.path.join(directory, name)
+                relative = self._relative(full_path)
+                if relative is None:
+                    continue
+                try:
+                    stat = os.stat(full_path)
+                except OSError:
+                    continue
+                files[relative] = (stat.st_mtime, stat.st_size)
+        return files
+        
+    def _emit(self, change_type: str, relative: str, lane: str = LANE_LIVE):
+        self._events += 1
+        self._pending.setdefault(lane, []).append({
+            'type': change_type,
+            'file': {
+                'id': f"local:{relative}",
+                'path': relative,
+                'name': relative.rsplit('/', 1)[-1],
+                'is_directory': False
+            }
+        })
+        
+    def _file_seen(self, full_path: str, relative: str):
+        try:
+            stat = os.stat(full_path)
+        except OSError:
+            return
+        current = (stat.st_mtime, stat.st_size)
+        previous = self._known.get(relative)
+        if previous == current:
+            return
+        self._known[relative] = current
+        self._emit('modified' if previous else 'added', relative)
+        
+    def _file_gone(self, relative: str):
+        if self._known.pop(relative, None) is not None:
+            self._emit('deleted', relative)
+            
+    def _directory_gone(self, relative: str):
+        prefix = f"{relative}/"
+        for path in [path for path in self._known if path.startswith(prefix)]:
+            self._file_gone(path)
+            
+    def _on_readable(self):
+        """inotify 描述符可读时由事件循环调用"""
+        if self._inotify is None:
+            return
+        for wd, mask, name in self._inotify.read_events():
+            if mask & IN_Q_OVERFLOW:
+                self._overflows += 1
+                logger.warning("inotify 事件队列溢出，重新扫描监听目录")
+                # 整棵目录树的差异可能很多，按回填处理，不挤占实时变更
+                for root in self._inotify_roots:
+                    self._tasks.append(asyncio.create_task(self._rescan(root, register=True, lane=LANE_BACKFILL)))
+                continue
+            if mask & IN_IGNORED:
+                with self._watch_lock:
+                    self._watches.pop(wd, None)
+                continue
+                
+            directory = self._watches.get(wd)
+            if directory is None or not name:
+                continue
+            full_path = os.path.join(directory, name)
+            relative = self._relative(full_path)
+            if relative is None:
+                continue
+                
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    # 新目录中的文件可能在注册监听前就已写入，注册后补扫一次
+                    self._tasks.append(asyncio.create_task(self._rescan(full_path, register=True, lane=LANE_LIVE)))
+                elif mask & (IN_DELETE | IN_MOVED_FROM):
+                    self._directory_gone(relative)
+            elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                self._file_seen(full_path, relative)
+            elif mask & (IN_DELETE | IN_MOVED_FROM):
+                self._file_gone(relative)
+                
+        # 清理已完成的补扫任务
+        self._tasks = [task for task in self._tasks if not task.done()]
+        
+    async def _rescan(self, path: str, register: bool = False, lane: str = LANE_LIVE):
+        """重新扫描目录并与已知状态比较，补发差异
+        
+        Args:
+            path: 目录绝对路径
+            register: 是否同时为其中的子目录注册 inotify 监听
+            lane: 优先级通道，默认按实时变更处理；溢出后的整树补扫走回填通道
+        """
+        self._rescans += 1
+        try:
+            if register:
+                await asyncio.to_thread(self._add_tree, path)
+            current = await asyncio.to_thread(self._walk, path)
+        except OSError as e:
+            logger.error(f"重新扫描本地目录失败 [{path}]: {str(e)}")
+            self._last_error = e
+            return
+            
+        relative = self._relative(path)
+        prefix = "" if not relative or relative == "." else f"{relative}/"
+        for path_key, state in current.items():
+            previous = self._known.get(path_key)
+            if previous != state:
+                self._known[path_key] = state
+                self._emit('modified' if previous else 'added', path_key, lane)
+        for path_key in [path_key for path_key in self._known if path_key.startswith(prefix) and path_key not in current]:
+            del self._known[path_key]
+            self._emit('deleted', path_key, lane)
+            
+    async def _poll_loop(self):
+        """轮询不支持 inotify 的目录"""
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            for root in self._poll_roots:
+                await self._rescan(root, lane=LANE_LIVE)
+                
+    async def _flush(self):
+        """把攒下的变更写入事件日志后提交给处理器"""
+        pending, self._pending = self._pending, {}
+        for lane, changes in pending.items():
+            try:
+                async with AsyncSessionLocal() as session:
+                    await EventJournal.append(session, changes)
+                    await session.commit()
+            except Exception as e:
+                # 写日志失败时仍然处理，只是无法在重启后重放
+                logger.error(f"写入本地变更事件日志失败: {str(e)}")
+                self._last_error = e
+            try:
+                await self.handler.handle_changes(changes, lane=lane)
+            except Exception as e:
+                # 已写入日志的事件在重启后重放，提交循环继续处理之后的变更
+                logger.error(f"提交本地变更失败 [{lane}]: {str(e)}")
+                self._last_error = e
+                
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(FLUSH_INTERVAL)
+            if self._pending:
+                try:
+                    await self._flush()
+                except Exception as e:
+                    logger.error(f"提交本地变更出错: {str(e)}")
+                    self._last_error = e
@@ -2,16 +2,22 @@
 
 提供软链接的创建、管理和监控功能。
 """
+import asyncio
 import os
 import shutil
+import threading
+from bisect import bisect_right
 from datetime import datetime
-from typing import Dict, List, Optional, Set
+from typing import Dict, List, Optional, Set, Tuple
 from pathlib import Path
 from loguru import logger
 from app.utils.symlink import create_symlink
 from app.utils.path import normalize_path, get_relative_path
 from app.utils.config import get_config
-from app.core.cache import cached
+from app.core.cache import cached, default_cache
+
+# verify() 结果的缓存标签，软链接增删时失效
+VERIFY_CACHE_TAG = "symlinks"
 
 class SymlinkError(Exception):
     """软链接操作异常"""
@@ -23,6 +29,15 @@ class SymlinkManager:
     管理文件系统软链接的创建、删除和维护。
     """
     
+    _instance = None
+    
+    @classmethod
+    def get_instance(cls) -> 'SymlinkManager':
+        """获取软链接管理器实例（单例）"""
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+        
     def __init__(self, backup_dir: Optional[str] = None):
         """初始化软链接管理器
         
@@ -31,6 +46,11 @@ class SymlinkManager:
         """
         self.config = get_config()
         self._symlinks: Dict[str, Dict] = {}
+        self._version = 0  # 软链接集合变更版本，用于分页排序缓存
+        # 事件流水线在多个线程中并发增删软链接：_symlinks、版本号和统计的修改都在锁内进行，
+        # 遍历时先在锁内复制快照
+        self._lock = threading.Lock()
+        self._sorted_cache: Tuple[int, List[str]] = (-1, [])
         self._backup_dir = backup_dir or 'data/symlink_backups'
         self._stats = {
             'created': 0,
@@ -48,11 +68,13 @@ class SymlinkManager:
     def stats(self) -> Dict:
         """获取管理器统计信息"""
         verify_result = self.verify()
+        with self._lock:
+            stats = dict(self._stats)
         return {
-            **self._stats,
+            **stats,
             **verify_result,
             'backup_size': self._get_backup_size(),
-            'last_operation_time': self._stats['last_operation'].isoformat() if self._stats['last_operation'] else None
+            'last_operation_time': stats['last_operation'].isoformat() if stats['last_operation'] else None
         }
         
     def _load_symlinks(self):
@@ -73,25 +95,47 @@ class SymlinkManager:
             
     def _add_symlink(self, source: str, target: str):
         """添加软链接记录"""
-        self._symlinks[target] = {
+        info = {
             'source': source,
             'target': target,
             'valid': os.path.exists(source),
             'created_at': datetime.now(),
             'last_checked': datetime.now()
         }
+        with self._lock:
+            self._symlinks[target] = info
+            self._version += 1
+        self._mark_changed()
+        
+    def _discard_symlink(self, target: str):
+        """删除软链接记录"""
+        with self._lock:
+            if self._symlinks.pop(target, None) is None:
+                return
+            self._version += 1
+        self._mark_changed()
+        
+    def _snapshot(self) -> List[Tuple[str, Dict]]:
+        """在锁内复制 (目标路径, 信息) 列表，遍历时其他线程可以继续增删"""
+        with self._lock:
+            return list(self._symlinks.items())
+            
+    def _mark_changed(self):
+        """软链接集合发生变化：失效验证结果缓存"""
+        default_cache.invalidate_tags(VERIFY_CACHE_TAG)
         
     def _update_stats(self, created: bool = False, removed: bool = False, failed: bool = False, error: Optional[Exception] = None):
         """更新统计信息"""
-        if created:
-            self._stats['created'] += 1
-        if removed:
-            self._stats['removed'] += 1
-        if failed:
-            self._stats['failed'] += 1
-        if error:
-            self._stats['last_error'] = str(error)
-        self._stats['last_operation'] = datetime.now()
+        with self._lock:
+            if created:
+                self._stats['created'] += 1
+            if removed:
+                self._stats['removed'] += 1
+            if failed:
+                self._stats['failed'] += 1
+            if error:
+                self._stats['last_error'] = str(error)
+            self._stats['last_operation'] = datetime.now()
             
     def create(self, source: str, target: str, backup: bool = True) -> bool:
         """创建软链接
@@ -146,12 +190,13 @@ class SymlinkManager:
         try:
             target = normalize_path(target)
             if target in self._symlinks:
-                if os.path.exists(target):
+                # 源文件已移走时软链接是断开的，exists 会返回 False
+                if os.path.lexists(target):
                     if not os.path.islink(target):
                         raise SymlinkError(f"目标不是软链接: {target}")
                     os.remove(target)
                 if cleanup:
-                    del self._symlinks[target]
+                    self._discard_symlink(target)
                 self._update_stats(removed=True)
                 logger.info(f"删除软链接成功: {target}")
                 return True
@@ -162,7 +207,7 @@ class SymlinkManager:
             self._update_stats(failed=True, error=e)
             return False
             
-    @cached(prefix="symlink_manager", ttl=300)
+    @cached(prefix="symlink_manager", ttl=300, tags=lambda self: [VERIFY_CACHE_TAG])
     def verify(self) -> Dict[str, int]:
         """验证所有软链接
         
@@ -176,7 +221,8 @@ class SymlinkManager:
             orphaned = set()
             
             # 检查记录的软链接
-            for target, info in self._symlinks.items():
+            symlinks = self._snapshot()
+            for target, info in symlinks:
                 if not os.path.exists(target):
                     missing += 1
                 elif not os.path.exists(info['source']):
@@ -191,7 +237,7 @@ class SymlinkManager:
                 self.remove(target)
                     
             return {
-                'total': len(self._symlinks),
+                'total': len(symlinks),
                 'valid': valid,
                 'invalid': invalid,
                 'missing': missing,
@@ -220,10 +266,10 @@ class SymlinkManager:
         """
         try:
             if verify_first:
-                self.verify()
+                await asyncio.to_thread(self.verify)
                 
             success = True
-            for target, info in self._symlinks.items():
+            for target, info in self._snapshot():
                 if not os.path.exists(target) or not os.path.exists(info['source']):
                     if not self.create(info['source'], target):
                         success = False
@@ -245,7 +291,7 @@ class SymlinkManager:
             是否清除成功
         """
         try:
-            for target in list(self._symlinks.keys()):
+            for target, _ in self._snapshot():
                 if backup and os.path.exists(target):
                     self._backup_file(target)
                 self.remove(target)
@@ -266,9 +312,80 @@ class SymlinkManager:
                 'created_at': info['created_at'].isoformat(),
                 'last_checked': info['last_checked'].isoformat()
             }
-            for target, info in self._symlinks.items()
+            for target, info in self._snapshot()
         ]
         
+    @property
+    def version(self) -> int:
+        """软链接集合的变更版本号"""
+        return self._version
+        
+    def list_page(
+        self,
+        after: Optional[str] = None,
+        limit: int = 100,
+        valid: Optional[bool] = None,
+        keyword: Optional[str] = None
+    ) -> Tuple[List[Dict], Optional[str]]:
+        """按目标路径游标分页获取软链接
+        
+        排序结果按版本号缓存，集合未变化时翻页只需一次二分查找。
+        
+        Args:
+            after: 上一页最后一个目标路径
+            limit: 每页数量
+            valid: 只返回有效或无效的软链接
+            keyword: 目标路径包含的关键字
+            
+        Returns:
+            (软链接信息列表, 下一页游标)
+        """
+        version, targets = self._sorted_cache
+        if version != self._version:
+            with self._lock:
+                version, targets = self._version, list(self._symlinks)
+            targets.sort()
+            self._sorted_cache = (version, targets)
+            
+        items = []
+        index = bisect_right(targets, after) if after else 0
+        while index < len(targets) and len(items) <= limit:
+            target = targets[index]
+            index += 1
+            info = self._symlinks.get(target)
+            if info is None or (keyword and keyword not in target):
+                continue
+            is_valid = os.path.exists(info['source']) and os.path.exists(target)
+            if valid is not None and is_valid != valid:
+                continue
+            items.append({
+                'source': info['source'],
+                'target': target,
+                'valid': is_valid,
+                'created_at': info['created_at'].isoformat(),
+                'last_checked': info['last_checked'].isoformat()
+            })
+            
+        next_cursor = None
+        if len(items) > limit:
+            items = items[:limit]
+            next_cursor = items[-1]['target']
+        return items, next_cursor
+        
+    def sorted_targets(self, valid_only: bool = True) -> List[str]:
+        """按路径排序返回软链接路径
+        
+        Args:
+            valid_only: 是否只返回源文件仍存在的软链接
+            
+        Returns:
+            排序后的软链接路径列表
+        """
+        return sorted(
+            target for target, info in self._snapshot()
+            if not valid_only or os.path.exists(info['source'])
+        )
+        
     def _backup_file(self, file_path: str):
         """备份文件
         
@@ -4,14 +4,107 @@
 """
 import aiohttp
 import asyncio
+import time
 from datetime import datetime
-from typing import Optional, Dict, List, Any
+from typing import Optional, Dict, List, Any, AsyncIterator
 from loguru import logger
 
 class EmbyError(Exception):
     """Emby 操作异常"""
     pass
 
+class CircuitOpenError(EmbyError):
+    """熔断器打开时的快速失败异常"""
+    pass
+
+class CircuitBreaker:
+    """熔断器
+    
+    连续失败达到阈值后打开，在冷却期内直接拒绝请求；
+    冷却结束后进入半开状态，只放行一个探测请求，成功则关闭。
+    """
+    
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+    
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        """初始化熔断器
+        
+        Args:
+            failure_threshold: 打开熔断器所需的连续失败次数
+            reset_timeout: 打开后进入半开状态前的冷却时间（秒）
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._open_count = 0
+        
+    @property
+    def state(self) -> str:
+        """当前状态（冷却结束后自动转为半开）"""
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+            self._probe_in_flight = False
+        return self._state
+        
+    @property
+    def is_open(self) -> bool:
+        """是否处于打开状态"""
+        return self.state == self.OPEN
+        
+    @property
+    def retry_after(self) -> float:
+        """距离允许下一次探测的剩余时间（秒）"""
+        if self.state != self.OPEN:
+            return 0.0
+        return max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+        
+    @property
+    def stats(self) -> Dict:
+        """获取熔断器统计信息"""
+        return {
+            "state": self.state,
+            "consecutive_failures": self._failures,
+            "open_count": self._open_count,
+            "retry_after": round(self.retry_after, 1)
+        }
+        
+    def allow(self) -> bool:
+        """判断当前是否允许发出请求"""
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        return False
+        
+    def release_probe(self):
+        """探测请求没有结果就结束时（例如被取消）按失败处理，冷却后重新探测"""
+        if self._state == self.HALF_OPEN and self._probe_in_flight:
+            self.record_failure()
+            
+    def record_success(self):
+        """记录一次成功请求"""
+        self._failures = 0
+        self._probe_in_flight = False
+        self._state = self.CLOSED
+        
+    def record_failure(self):
+        """记录一次失败请求"""
+        self._failures += 1
+        self._probe_in_flight = False
+        if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+            if self._state != self.OPEN:
+                self._open_count += 1
+                logger.warning(f"Emby 熔断器打开，{self.reset_timeout} 秒内请求将快速失败")
+            self._state = self.OPEN
+            self._opened_at = time.monotonic()
+
 class EmbyClient:
     """Emby 基础客户端
     
@@ -24,7 +117,10 @@ class EmbyClient:
         api_key: str,
         timeout: int = 30,
         max_retries: int = 3,
-        retry_delay: int = 5
+        retry_delay: int = 5,
+        max_concurrency: int = 4,
+        failure_threshold: int = 5,
+        reset_timeout: int = 30
     ):
         """初始化客户端
         
@@ -34,12 +130,20 @@ class EmbyClient:
             timeout: 请求超时时间（秒）
             max_retries: 最大重试次数
             retry_delay: 重试延迟（秒）
+            max_concurrency: 同时进行的最大请求数
+            failure_threshold: 熔断器打开所需的连续失败次数
+            reset_timeout: 熔断器冷却时间（秒）
         """
         self.server_url = server_url.rstrip('/')
         self.api_key = api_key
         self.timeout = timeout
         self.max_retries = max_retries
         self.retry_delay = retry_delay
+        self.max_concurrency = max_concurrency
+        
+        # 并发限制与熔断
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
         
         # 性能统计
         self._request_count = 0
@@ -55,7 +159,9 @@ class EmbyClient:
             "failed_requests": self._failed_requests,
             "success_rate": (self._request_count - self._failed_requests) / self._request_count if self._request_count > 0 else 0,
             "last_request_time": self._last_request_time.isoformat() if self._last_request_time else None,
-            "last_error": str(self._last_error) if self._last_error else None
+            "last_error": str(self._last_error) if self._last_error else None,
+            "max_concurrency": self.max_concurrency,
+            "circuit_breaker": self.breaker.stats
         }
         
     async def _make_request(
@@ -91,42 +197,65 @@ class EmbyClient:
         self._last_request_time = datetime.now()
         
         for attempt in range(self.max_retries):
+            # 熔断器打开时直接失败，不再堆积等待重试的协程
+            probe = self.breaker.state == CircuitBreaker.HALF_OPEN
+            if not self.breaker.allow():
+                self._failed_requests += 1
+                self._last_error = "Emby 熔断器已打开"
+                raise CircuitOpenError(f"Emby 暂不可用，{self.breaker.retry_after:.0f} 秒后重试")
+                
             try:
-                async with aiohttp.ClientSession() as session:
-                    async with session.request(
-                        method,
-                        url,
-                        timeout=aiohttp.ClientTimeout(total=self.timeout),
-                        **kwargs
-                    ) as response:
-                        if response.status in (200, 204):
-                            if response.status == 204:
-                                return None
-                            return await response.json()
-                            
-                        error_msg = f"请求失败: {response.status}"
-                        try:
-                            error_data = await response.json()
-                            if 'error' in error_data:
-                                error_msg = f"{error_msg} - {error_data['error']}"
-                        except:
-                            pass
+                async with self._semaphore:
+                    async with aiohttp.ClientSession() as session:
+                        async with session.request(
+                            method,
+                            url,
+                            timeout=aiohttp.ClientTimeout(total=self.timeout),
+                            **kwargs
+                        ) as response:
+                            if response.status in (200, 204):
+                                self.breaker.record_success()
+                                if response.status == 204:
+                                    return None
+                                return await response.json()
+                                
+                            error_msg = f"请求失败: {response.status}"
+                            try:
+                                error_data = await response.json()
+                                if 'error' in error_data:
+                                    error_msg = f"{error_msg} - {error_data['error']}"
+                            except:
+                                pass
+                                
+                            # 4xx 说明服务器可用，只有 5xx 计入熔断
+                            if response.status >= 500:
+                                self.breaker.record_failure()
+                            else:
+                                self.breaker.record_success()
+                            raise EmbyError(error_msg)
                             
-                        raise EmbyError(error_msg)
-                        
+            except asyncio.CancelledError:
+                # 被取消的请求不记录结果；探测请求要释放名额，否则熔断器一直停在半开状态
+                if probe:
+                    self.breaker.release_probe()
+                raise
+                
             except asyncio.TimeoutError:
+                self.breaker.record_failure()
                 error_msg = f"请求超时 (尝试 {attempt + 1}/{self.max_retries})"
                 logger.warning(error_msg)
-                if attempt == self.max_retries - 1:
+                if attempt == self.max_retries - 1 or self.breaker.is_open:
                     self._failed_requests += 1
                     self._last_error = error_msg
                     raise EmbyError(error_msg)
                 await asyncio.sleep(self.retry_delay)
                 
             except Exception as e:
+                if not isinstance(e, EmbyError):
+                    self.breaker.record_failure()
                 error_msg = f"请求出错: {str(e)}"
                 logger.error(error_msg)
-                if attempt == self.max_retries - 1:
+                if attempt == self.max_retries - 1 or self.breaker.is_open:
                     self._failed_requests += 1
                     self._last_error = error_msg
                     raise EmbyError(error_msg)
@@ -161,6 +290,25 @@ class EmbyClient:
             logger.error(f"刷新媒体库失败: {str(e)}")
             return False
             
+    async def notify_media_updated(self, paths: List[str]):
+        """批量通知 Emby 指定路径已更新
+        
+        与 refresh_library 不同，失败时直接抛出异常，便于调用方决定是否重试。
+        
+        Args:
+            paths: 已更新的媒体路径列表
+        
+        Raises:
+            EmbyError: 请求失败
+        """
+        if not paths:
+            return
+        await self._make_request(
+            'POST',
+            '/Library/Media/Updated',
+            json={'Updates': [{'Path': path, 'UpdateType': 'Modified'} for path in paths]}
+        )
+        
     async def get_server_info(self) -> Optional[Dict]:
         """获取服务器信息"""
         try:
@@ -176,7 +324,8 @@ class EmbyClient:
         recursive: bool = False,
         sort_by: Optional[str] = None,
         sort_order: Optional[str] = None,
-        limit: Optional[int] = None
+        limit: Optional[int] = None,
+        start_index: Optional[int] = None
     ) -> List[Dict]:
         """获取媒体项
         
@@ -187,6 +336,7 @@ class EmbyClient:
             sort_by: 排序字段
             sort_order: 排序顺序
             limit: 限制数量
+            start_index: 起始位置
             
         Returns:
             媒体项列表
@@ -198,7 +348,8 @@ class EmbyClient:
                 'Recursive': str(recursive).lower(),
                 'SortBy': sort_by,
                 'SortOrder': sort_order,
-                'Limit': limit
+                'Limit': limit,
+                'StartIndex': start_index
             }
             params = {k: v for k, v in params.items() if v is not None}
             
@@ -209,6 +360,44 @@ class EmbyClient:
             logger.error(f"获取媒体项失败: {str(e)}")
             return []
             
+    async def iter_item_paths(self, page_size: int = 1000) -> AsyncIterator[str]:
+        """分页遍历所有媒体项的路径
+        
+        与 get_items 不同，请求失败时直接抛出异常，避免把中途失败误当作遍历结束。
+        
+        Args:
+            page_size: 每页数量
+            
+        Yields:
+            媒体项路径
+            
+        Raises:
+            EmbyError: 请求失败
+        """
+        start_index = 0
+        while True:
+            result = await self._make_request(
+                'GET',
+                '/Items',
+                params={
+                    'Recursive': 'true',
+                    'Fields': 'Path',
+                    'EnableImages': 'false',
+                    'EnableUserData': 'false',
+                    'StartIndex': start_index,
+                    'Limit': page_size
+                }
+            ) or {}
+            items = result.get('Items', [])
+            for item in items:
+                if item.get('Path'):
+                    yield item['Path']
+                    
+            start_index += len(items)
+            total = result.get('TotalRecordCount', 0)
+            if not items or start_index >= total:
+                break
+                
     async def get_item(self, item_id: str) -> Optional[Dict]:
         """获取指定媒体项
         
@@ -1,6 +1,7 @@
 import os
 import json
 import logging
+import threading
 from typing import Dict, List, Optional
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
@@ -17,6 +18,7 @@ class GoogleDriveAPI:
         self.client_secret = client_secret
         self.token_file = token_file
         self.creds = None
+        self._local = threading.local()  # Drive service 对象不是线程安全的，每个线程各建一个
         self._load_credentials()
         
     def _load_credentials(self):
@@ -84,22 +86,54 @@ class GoogleDriveAPI:
             logger.error(f"授权失败: {str(e)}")
             return False
             
-    def list_files(self, folder_id: Optional[str] = None) -> List[Dict]:
-        """列出文件"""
+    def _get_service(self):
+        """获取当前线程的 Drive service（凭证变化时重建）"""
+        local = self._local
+        if getattr(local, 'creds', None) is not self.creds:
+            local.service = build('drive', 'v3', credentials=self.creds, cache_discovery=False)
+            local.creds = self.creds
+        return local.service
+        
+    def list_page(
+        self,
+        folder_id: Optional[str] = None,
+        page_token: Optional[str] = None,
+        page_size: int = 1000
+    ) -> Dict:
+        """列出目录下的一页文件
+        
+        与 list_files 不同，请求失败时直接抛出异常，避免把失败当作目录为空。
+        
+        Args:
+            folder_id: 目录ID
+            page_token: 上一页返回的 nextPageToken
+            page_size: 每页数量（最大 1000）
+            
+        Returns:
+            包含 files 和 nextPageToken 的字典
+        """
         if not self.creds:
             raise Exception("未授权")
             
-        service = build('drive', 'v3', credentials=self.creds)
-        query = f"'{folder_id}' in parents" if folder_id else None
+        query = f"'{folder_id}' in parents and trashed = false" if folder_id else "trashed = false"
+        return self._get_service().files().list(
+            q=query,
+            pageSize=page_size,
+            pageToken=page_token,
+            fields="nextPageToken, files(id, name, mimeType, modifiedTime, size)"
+        ).execute()
         
+    def list_files(self, folder_id: Optional[str] = None) -> List[Dict]:
+        """列出目录下的全部文件（自动翻页）"""
         try:
-            results = service.files().list(
-                q=query,
-                pageSize=100,
-                fields="files(id, name, mimeType, modifiedTime)"
-            ).execute()
-            
-            return results.get('files', [])
+            files = []
+            page_token = None
+            while True:
+                result = self.list_page(folder_id, page_token)
+                files.extend(result.get('files', []))
+                page_token = result.get('nextPageToken')
+                if not page_token:
+                    return files
         except Exception as e:
             logger.error(f"列出文件失败: {str(e)}")
             return []
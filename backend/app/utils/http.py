@@ -0,0 +1,69 @@
+"""HTTP 工具模块
+
+提供游标分页和 ETag 条件请求相关的工具函数。
+"""
+import base64
+import hashlib
+import json
+from typing import Any, List, Optional
+
+from fastapi import Request, Response
+
+def encode_cursor(values: List[Any]) -> str:
+    """编码分页游标
+    
+    Args:
+        values: 最后一条记录的排序键值
+        
+    Returns:
+        URL 安全的游标字符串
+    """
+    raw = json.dumps(values, ensure_ascii=False, separators=(',', ':'), default=str)
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor: Optional[str]) -> Optional[List[Any]]:
+    """解码分页游标
+    
+    Args:
+        cursor: 游标字符串
+        
+    Returns:
+        排序键值列表，游标为空时返回 None
+        
+    Raises:
+        ValueError: 游标格式无效
+    """
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+    except Exception:
+        raise ValueError("无效的分页游标")
+    if not isinstance(values, list):
+        raise ValueError("无效的分页游标")
+    return values
+
+def etag_response(request: Request, content: Any) -> Response:
+    """生成带 ETag 的 JSON 响应
+    
+    请求头 If-None-Match 与内容摘要一致时返回 304，不再传输响应体。
+    
+    Args:
+        request: 当前请求
+        content: 响应内容
+        
+    Returns:
+        JSON 响应或 304 响应
+    """
+    body = json.dumps(content, ensure_ascii=False, separators=(',', ':'), default=str).encode('utf-8')
+    etag = f'W/"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        tags = [tag.strip() for tag in if_none_match.split(',')]
+        if '*' in tags or etag in tags:
+            return Response(status_code=304, headers=headers)
+            
+    return Response(content=body, media_type="application/json", headers=headers)
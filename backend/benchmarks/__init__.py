@@ -0,0 +1,4 @@
+"""性能基准测试
+
+使用内存中的 Google Drive 模拟和本地 Emby 模拟服务器，端到端测量扫描器和变更事件流水线的吞吐。
+"""
@@ -0,0 +1,191 @@
+"""Google Drive 模拟
+
+在内存中生成可复现的目录树，实现扫描器用到的 GoogleDriveAPI 接口。
+"""
+from collections import deque
+from datetime import datetime, timedelta, timezone
+import random
+import threading
+import time
+from typing import Dict, Iterator, List, Optional
+
+FOLDER_MIME_TYPE = 'application/vnd.google-apps.folder'
+VIDEO_MIME_TYPE = 'video/x-matroska'
+BASE_TIME = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+def format_time(value: datetime) -> str:
+    """格式化为 Drive 返回的 RFC 3339 时间"""
+    return value.strftime('%Y-%m-%dT%H:%M:%S.') + f"{value.microsecond // 1000:03d}Z"
+
+class FakeGoogleDriveAPI:
+    """内存中的 Google Drive
+    
+    目录树按层生成：每个目录放 files_per_folder 个文件和 subfolders 个子目录，
+    直到文件总数达到 total_files。相同的种子生成相同的目录树和相同的变更。
+    每次请求在调用线程中阻塞 latency 秒，模拟网络往返。
+    """
+    
+    def __init__(
+        self,
+        total_files: int,
+        files_per_folder: int = 100,
+        subfolders: int = 8,
+        latency: float = 0.0,
+        seed: int = 0,
+        root_id: str = 'root'
+    ):
+        """初始化并生成目录树
+        
+        Args:
+            total_files: 文件总数
+            files_per_folder: 每个目录的文件数
+            subfolders: 每个目录的子目录数
+            latency: 每次请求的模拟延迟（秒）
+            seed: 随机种子
+            root_id: 根目录ID
+        """
+        self.root_id = root_id
+        self.latency = latency
+        self.creds = object()  # GoogleDriveClient.stats 读取
+        self.requests = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._children: Dict[str, Dict[str, Dict]] = {root_id: {}}
+        self._paths: Dict[str, str] = {root_id: ''}
+        self._next_id = 0
+        self._clock = BASE_TIME
+        self._seed(total_files, files_per_folder, subfolders)
+        
+    @property
+    def folder_count(self) -> int:
+        return len(self._children)
+        
+    @property
+    def file_count(self) -> int:
+        return sum(
+            1
+            for children in self._children.values()
+            for item in children.values()
+            if item['mimeType'] != FOLDER_MIME_TYPE
+        )
+        
+    def _new_id(self, prefix: str) -> str:
+        self._next_id += 1
+        return f"{prefix}{self._next_id:08d}"
+        
+    def _tick(self) -> str:
+        self._clock += timedelta(seconds=1)
+        return format_time(self._clock)
+        
+    def _add_folder(self, parent_id: str) -> str:
+        folder_id = self._new_id('d')
+        name = f"folder_{folder_id}"
+        self._children[parent_id][folder_id] = {
+            'id': folder_id,
+            'name': name,
+            'mimeType': FOLDER_MIME_TYPE,
+            'modifiedTime': self._tick()
+        }
+        self._children[folder_id] = {}
+        parent_path = self._paths[parent_id]
+        self._paths[folder_id] = f"{parent_path}/{name}" if parent_path else name
+        return folder_id
+        
+    def _add_file(self, parent_id: str) -> str:
+        file_id = self._new_id('f')
+        name = f"{file_id}.mkv"
+        self._children[parent_id][file_id] = {
+            'id': file_id,
+            'name': name,
+            'mimeType': VIDEO_MIME_TYPE,
+            'modifiedTime': self._tick(),
+            'size': str(self._random.randint(1 << 20, 1 << 32))
+        }
+        return self.path_of(parent_id, name)
+        
+    def _seed(self, total_files: int, files_per_folder: int, subfolders: int):
+        folders = deque([self.root_id])
+        created = 0
+        while created < total_files:
+            folder_id = folders.popleft()
+            count = min(files_per_folder, total_files - created)
+            for _ in range(count):
+                self._add_file(folder_id)
+            created += count
+            if created < total_files:
+                for _ in range(subfolders):
+                    folders.append(self._add_folder(folder_id))
+                    
+    def path_of(self, folder_id: str, name: str) -> str:
+        """文件的相对路径"""
+        parent_path = self._paths[folder_id]
+        return f"{parent_path}/{name}" if parent_path else name
+        
+    def iter_file_paths(self) -> Iterator[str]:
+        """遍历所有文件的相对路径"""
+        for folder_id, children in self._children.items():
+            for item in children.values():
+                if item['mimeType'] != FOLDER_MIME_TYPE:
+                    yield self.path_of(folder_id, item['name'])
+                    
+    def mutate(self, change_rate: float) -> Dict[str, List[str]]:
+        """按比例修改、删除和新增文件（三者各占三分之一）
+        
+        Args:
+            change_rate: 变更文件占文件总数的比例
+            
+        Returns:
+            {"modified": [...], "deleted": [...], "added": [...]}，均为相对路径
+        """
+        with self._lock:
+            files = [
+                (folder_id, item)
+                for folder_id, children in self._children.items()
+                for item in children.values()
+                if item['mimeType'] != FOLDER_MIME_TYPE
+            ]
+            count = min(len(files), int(len(files) * change_rate))
+            result = {"modified": [], "deleted": [], "added": []}
+            for index, (folder_id, item) in enumerate(self._random.sample(files, count)):
+                path = self.path_of(folder_id, item['name'])
+                kind = index % 3
+                if kind == 0:
+                    item['modifiedTime'] = self._tick()
+                    item['size'] = str(int(item['size']) + 1)
+                    result["modified"].append(path)
+                elif kind == 1:
+                    del self._children[folder_id][item['id']]
+                    result["deleted"].append(path)
+                else:
+                    result["added"].append(self._add_file(folder_id))
+            return result
+            
+    def list_page(
+        self,
+        folder_id: Optional[str] = None,
+        page_token: Optional[str] = None,
+        page_size: int = 1000
+    ) -> Dict:
+        """列出目录下的一页文件（与 GoogleDriveAPI.list_page 相同的返回格式）"""
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.requests += 1
+            children = list(self._children.get(folder_id or self.root_id, {}).values())
+            start = int(page_token or 0)
+            end = start + page_size
+            return {
+                'files': [dict(item) for item in children[start:end]],
+                'nextPageToken': str(end) if end < len(children) else None
+            }
+            
+    def list_files(self, folder_id: Optional[str] = None) -> List[Dict]:
+        """列出目录下的全部文件（自动翻页）"""
+        files = []
+        page_token = None
+        while True:
+            result = self.list_page(folder_id, page_token)
+            files.extend(result['files'])
+            page_token = result['nextPageToken']
+            if not page_token:
+                return files
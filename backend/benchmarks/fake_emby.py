@@ -0,0 +1,88 @@
+"""Emby 模拟服务器
+
+在本地端口上提供 EmbyClient 用到的接口，记录收到的刷新请求。
+"""
+import asyncio
+import time
+from typing import Dict, Optional
+from aiohttp import web
+
+class FakeEmbyServer:
+    """本地 Emby 模拟服务器
+    
+    /Library/Media/Updated 记录收到的路径数量，其他请求返回空结果。
+    可以为每个请求加上固定延迟，模拟较慢的 Emby 服务器。
+    """
+    
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: float = 0.0):
+        """初始化服务器
+        
+        Args:
+            host: 监听地址
+            port: 监听端口，0 表示随机端口
+            latency: 每个请求的模拟延迟（秒）
+        """
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.requests = 0
+        self.refresh_requests = 0
+        self.refreshed_paths = 0
+        self.last_refresh_time: Optional[float] = None
+        self._runner: Optional[web.AppRunner] = None
+        
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+        
+    @property
+    def stats(self) -> Dict:
+        return {
+            "requests": self.requests,
+            "refresh_requests": self.refresh_requests,
+            "refreshed_paths": self.refreshed_paths
+        }
+        
+    def reset_stats(self):
+        self.requests = 0
+        self.refresh_requests = 0
+        self.refreshed_paths = 0
+        
+    async def start(self) -> str:
+        """启动服务器并返回地址"""
+        app = web.Application()
+        app.router.add_post('/Library/Media/Updated', self._media_updated)
+        app.router.add_get('/System/Info', self._system_info)
+        app.router.add_route('*', '/{tail:.*}', self._empty)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        return self.url
+        
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+            
+    async def _delay(self):
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+            
+    async def _media_updated(self, request: web.Request) -> web.Response:
+        await self._delay()
+        body = await request.json()
+        self.refresh_requests += 1
+        self.refreshed_paths += len(body.get('Updates') or []) or (1 if body.get('Path') else 0)
+        self.last_refresh_time = time.monotonic()
+        return web.Response(status=204)
+        
+    async def _system_info(self, request: web.Request) -> web.Response:
+        await self._delay()
+        return web.json_response({"ServerName": "benchmark", "Version": "4.8.0.0"})
+        
+    async def _empty(self, request: web.Request) -> web.Response:
+        await self._delay()
+        return web.json_response({"Items": [], "TotalRecordCount": 0})
@@ -0,0 +1,335 @@
+"""扫描器与变更事件流水线基准测试
+
+用法（在 backend 目录下）:
+
+    python -m benchmarks.run --files 10000 100000 --latency 0.05 --change-rate 0.01
+
+每个规模依次执行三个阶段：首次完整扫描、无变更重新扫描、按 change_rate 变更后重新扫描。
+扫描器通过 FakeGoogleDriveAPI 列出文件，变更经 FileChangeHandler 创建软链接，
+再由 EmbyService 发送到本地的 FakeEmbyServer。结果以 JSON 输出到标准输出（或 --output 文件）。
+
+多个规模时每个规模在独立的子进程中运行，峰值内存互不影响。
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+import yaml
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 事件到软链接延迟的桶上界（秒），比默认直方图覆盖更长的排队时间
+LATENCY_BOUNDS = (
+    0.001, 0.0025, 0.005,
+    0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0,
+    10.0, 25.0, 50.0,
+    100.0, 250.0, 500.0
+)
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="GrayLink 扫描器与事件流水线基准测试")
+    parser.add_argument("--files", type=int, nargs="+", default=[10000], help="文件数量，可指定多个规模")
+    parser.add_argument("--files-per-folder", type=int, default=100, help="每个目录的文件数")
+    parser.add_argument("--subfolders", type=int, default=8, help="每个目录的子目录数")
+    parser.add_argument("--latency", type=float, default=0.0, help="每次 Drive 请求的模拟延迟（秒）")
+    parser.add_argument("--emby-latency", type=float, default=0.0, help="每次 Emby 请求的模拟延迟（秒）")
+    parser.add_argument("--change-rate", type=float, default=0.01, help="变更阶段修改/删除/新增的文件比例")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    parser.add_argument("--timeout", type=float, default=3600, help="每个阶段等待事件处理完成的最长时间（秒）")
+    parser.add_argument("--workdir", help="工作目录（数据库、源目录和软链接目录），默认使用临时目录并在结束后删除")
+    parser.add_argument("--output", help="结果写入文件，默认输出到标准输出")
+    parser.add_argument("--log-level", default="WARNING", help="日志级别")
+    return parser.parse_args(argv)
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def prepare_environment(workdir: str, emby_port: int):
+    """生成基准测试专用的配置并切换到工作目录
+    
+    必须在导入 app 之前调用：配置和数据库引擎在导入时创建。
+    """
+    with open(os.path.join(BACKEND_DIR, "config", "config.yml"), encoding="utf-8") as f:
+        config = yaml.safe_load(f)
+        
+    source_dir = os.path.join(workdir, "source")
+    target_dir = os.path.join(workdir, "target")
+    os.makedirs(source_dir, exist_ok=True)
+    os.makedirs(target_dir, exist_ok=True)
+    
+    config["database"]["url"] = f"sqlite+aiosqlite:///{os.path.join(workdir, 'benchmark.db')}"
+    config["monitor"]["source_dir"] = "root"
+    config["monitor"]["watch_paths"] = []
+    config["monitor"]["local_watch"]["enabled"] = False
+    config["monitor"]["retention"]["enabled"] = False
+    config["symlink"]["source_dir"] = source_dir
+    config["symlink"]["target_dir"] = target_dir
+    config["symlink"]["backup_dir"] = os.path.join(workdir, "backup")
+    config["emby"].update({
+        "server_url": f"http://127.0.0.1:{emby_port}",
+        "api_key": "benchmark",
+        "library_paths": [target_dir],
+        "refresh_delay": 1,
+        "retry_delay": 1,
+        "refresh_queue_file": os.path.join(workdir, "emby_refresh_queue.db")
+    })
+    config["cache"]["snapshot_enabled"] = False
+    config["cache"]["warmup_enabled"] = False
+    config["cache"]["disk_enabled"] = False
+    
+    config_file = os.path.join(workdir, "config.yml")
+    with open(config_file, "w", encoding="utf-8") as f:
+        yaml.safe_dump(config, f, allow_unicode=True, sort_keys=False)
+    os.environ["GRAYLINK_CONFIG_FILE"] = config_file
+    os.chdir(workdir)
+    if BACKEND_DIR not in sys.path:
+        sys.path.insert(0, BACKEND_DIR)
+
+def materialize(drive, source_dir: str, paths=None) -> int:
+    """在源目录中创建空文件，模拟挂载的 Drive（软链接要求源文件存在）"""
+    count = 0
+    created_dirs = set()
+    for path in drive.iter_file_paths() if paths is None else paths:
+        full_path = os.path.join(source_dir, path)
+        directory = os.path.dirname(full_path)
+        if directory not in created_dirs:
+            os.makedirs(directory, exist_ok=True)
+            created_dirs.add(directory)
+        with open(full_path, "wb"):
+            pass
+        count += 1
+    return count
+
+class WriteCounter:
+    """统计数据库写入的语句数和行数"""
+    
+    def __init__(self, engine):
+        from sqlalchemy import event
+        event.listen(engine.sync_engine, "after_cursor_execute", self._after_execute)
+        self.reset()
+        
+    def reset(self):
+        self.statements = 0
+        self.rows = 0
+        
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        verb = statement.lstrip()[:6].upper()
+        if verb in ("INSERT", "UPDATE", "DELETE"):
+            self.statements += 1
+            self.rows += max(cursor.rowcount or 0, 0)
+
+def peak_rss_mb() -> float:
+    """进程峰值常驻内存（MB，Linux 下 ru_maxrss 单位为 KB）"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+async def run_benchmark(args: argparse.Namespace, total_files: int) -> Dict:
+    """在当前进程中运行一个规模的基准测试"""
+    from loguru import logger
+    logger.remove()
+    logger.add(sys.stderr, level=args.log_level)
+    
+    from app.core.base import Base
+    from app.core.config import settings
+    from app.core.database import engine, AsyncSessionLocal
+    from app.core.metrics import LatencyHistogram
+    from app.modules.emby.service import EmbyService
+    from app.modules.monitor.events import FileChangeHandler, LANE_SCAN, LANE_BACKFILL
+    from app.modules.monitor.gdrive import GoogleDriveClient
+    from app.modules.monitor.scanner import FileScanner
+    from app.modules.symlink.manager import SymlinkManager
+    from .fake_drive import FakeGoogleDriveAPI
+    from .fake_emby import FakeEmbyServer
+    
+    class MeasuredHandler(FileChangeHandler):
+        """记录每个成功事件从进入队列到软链接完成的耗时"""
+        
+        def __init__(self):
+            super().__init__()
+            self.link_latency = LatencyHistogram(LATENCY_BOUNDS)
+            
+        async def _finish(self, batch):
+            now = time.monotonic()
+            for event in batch:
+                if event.is_linkable and not event.failed:
+                    self.link_latency.record(now - event.enqueued_at)
+            await super()._finish(batch)
+            
+    setup_start = time.monotonic()
+    drive = FakeGoogleDriveAPI(
+        total_files,
+        files_per_folder=args.files_per_folder,
+        subfolders=args.subfolders,
+        latency=args.latency,
+        seed=args.seed
+    )
+    materialize(drive, settings.symlink.source_dir)
+    
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    counter = WriteCounter(engine)
+    
+    emby = FakeEmbyServer(port=int(settings.emby.server_url.rsplit(":", 1)[1]), latency=args.emby_latency)
+    await emby.start()
+    handler = FileChangeHandler._instance = MeasuredHandler()
+    handler.start()
+    emby_service = EmbyService.get_instance()
+    symlinks = SymlinkManager.get_instance()
+    setup_seconds = time.monotonic() - setup_start
+    
+    async def wait_drained():
+        """等待事件流水线和 Emby 刷新队列处理完"""
+        deadline = time.monotonic() + args.timeout
+        while time.monotonic() < deadline:
+            stats = handler.stats
+            done = stats["processed_events"] + stats["failed_events"] + stats["coalesced_events"]
+            if done >= stats["total_events"] and not stats["pending_events"]:
+                break
+            await asyncio.sleep(0.05)
+        while time.monotonic() < deadline and await asyncio.to_thread(emby_service.refresh_queue.size):
+            await asyncio.sleep(0.05)
+            
+    async def phase(name: str) -> Dict:
+        counter.reset()
+        emby.reset_stats()
+        handler.link_latency.reset()
+        requests = drive.requests
+        created = symlinks._stats["created"]
+        removed = symlinks._stats["removed"]
+        failed = handler.stats["failed_events"]
+        
+        start = time.monotonic()
+        async with AsyncSessionLocal() as session:
+            scanner = FileScanner(session, GoogleDriveClient(drive))
+            # 与 MonitorService 相同：完整同步走回填通道，增量扫描走扫描通道
+            changes = await scanner.scan_directory(
+                drive.root_id,
+                on_changes=lambda batch: handler.handle_changes(
+                    batch, lane=LANE_BACKFILL if scanner.full_sync else LANE_SCAN
+                )
+            )
+            scan_seconds = time.monotonic() - start
+            skipped_folders = scanner.stats["skipped_folders"]
+        await wait_drained()
+        total_seconds = time.monotonic() - start
+        
+        latency = handler.link_latency.snapshot()
+        files = drive.file_count
+        return {
+            "phase": name,
+            "files": files,
+            "changes": changes,
+            "scan_seconds": round(scan_seconds, 3),
+            "total_seconds": round(total_seconds, 3),
+            "files_per_sec": round(files / scan_seconds, 1) if scan_seconds else None,
+            "drive_requests": drive.requests - requests,
+            "skipped_folders": skipped_folders,
+            "db_statements": counter.statements,
+            "db_rows_written": counter.rows,
+            "db_write_rate": round(counter.rows / total_seconds, 1) if total_seconds else None,
+            # 分位数按桶上界估算，不超过实际最大值
+            "event_to_link_ms": {
+                "samples": latency["samples"],
+                "p50": round(min(latency["p50"], latency["max"]) * 1000, 1),
+                "p99": round(min(latency["p99"], latency["max"]) * 1000, 1),
+                "max": round(latency["max"] * 1000, 1)
+            },
+            "links_created": symlinks._stats["created"] - created,
+            "links_removed": symlinks._stats["removed"] - removed,
+            "failed_events": handler.stats["failed_events"] - failed,
+            "emby": emby.stats
+        }
+        
+    try:
+        phases = [await phase("initial_scan"), await phase("rescan_unchanged")]
+        mutation = drive.mutate(args.change_rate)
+        materialize(drive, settings.symlink.source_dir, mutation["added"])
+        for path in mutation["deleted"]:
+            os.remove(os.path.join(settings.symlink.source_dir, path))
+        phases.append(await phase("rescan_changed"))
+    finally:
+        await handler.stop()
+        await emby_service.stop_refresh_worker()
+        await emby.stop()
+        await engine.dispose()
+        
+    return {
+        "files": total_files,
+        "folders": drive.folder_count,
+        "files_per_folder": args.files_per_folder,
+        "subfolders": args.subfolders,
+        "drive_latency": args.latency,
+        "emby_latency": args.emby_latency,
+        "change_rate": args.change_rate,
+        "seed": args.seed,
+        "scan_batch_size": settings.monitor.scan_batch_size,
+        "list_concurrency": settings.monitor.list_concurrency,
+        "setup_seconds": round(setup_seconds, 3),
+        "phases": phases,
+        "peak_rss_mb": peak_rss_mb()
+    }
+
+def run_single(args: argparse.Namespace, total_files: int) -> Dict:
+    """准备工作目录并运行一个规模（在当前进程中）"""
+    workdir = args.workdir or tempfile.mkdtemp(prefix="graylink-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    try:
+        prepare_environment(os.path.abspath(workdir), _free_port())
+        return asyncio.run(run_benchmark(args, total_files))
+    finally:
+        if not args.workdir:
+            os.chdir(BACKEND_DIR)
+            shutil.rmtree(workdir, ignore_errors=True)
+
+def run_subprocess(args: argparse.Namespace, total_files: int) -> Dict:
+    """在子进程中运行一个规模，返回其 JSON 结果"""
+    child_argv = [
+        "--files", str(total_files),
+        "--files-per-folder", str(args.files_per_folder),
+        "--subfolders", str(args.subfolders),
+        "--latency", str(args.latency),
+        "--emby-latency", str(args.emby_latency),
+        "--change-rate", str(args.change_rate),
+        "--seed", str(args.seed),
+        "--timeout", str(args.timeout),
+        "--log-level", args.log_level
+    ]
+    result = subprocess.run(
+        [sys.executable, "-m", "benchmarks.run", *child_argv],
+        cwd=BACKEND_DIR,
+        stdout=subprocess.PIPE,
+        check=True
+    )
+    return json.loads(result.stdout)
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+    if len(args.files) == 1:
+        results = run_single(args, args.files[0])
+    else:
+        if args.workdir:
+            raise SystemExit("多个规模时不能指定 --workdir")
+        results = {"runs": [run_subprocess(args, total_files) for total_files in args.files]}
+        
+    output = json.dumps(results, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
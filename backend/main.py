@@ -11,12 +11,19 @@ from fastapi.middleware.cors import CORSMiddleware
 from loguru import logger
 
 from app.core.base import Base as BaseModel
-from app.core.database import engine, AsyncSessionLocal
-from app.core.cache import default_cache
+from app.core.database import engine, AsyncSessionLocal, migrate_schema
+from app.core.cache import default_cache, restore_caches, snapshot_caches, warm_up
 from app.core.session import session_manager
 from app.core.auth import AuthManager
 from app.handlers import auth, monitor, file, symlink, emby, gdrive
 from app.core.config import settings
+from app.modules.monitor.events import FileChangeHandler
+from app.modules.monitor.models import FileRecord, upgrade_file_records
+from app.modules.monitor.watcher import LocalWatcher
+from app.modules.monitor.retention import RetentionJob
+from app.modules.monitor.service import MonitorService
+from app.modules.emby.reconcile import LibraryReconciler
+from app.modules.emby.service import EmbyService
 
 def init_directories():
     """初始化必要的目录"""
@@ -71,12 +78,17 @@ async def startup():
         # 初始化必要的目录
         init_directories()
         
-        # 创建数据库表
+        # 创建数据库表，已存在的表补齐新增的列和索引
         async with engine.begin() as conn:
             await conn.run_sync(BaseModel.metadata.create_all)
+            added = await conn.run_sync(migrate_schema)
+            if added.get(FileRecord.__tablename__):
+                await conn.run_sync(upgrade_file_records, added[FileRecord.__tablename__])
             
-        # 初始化缓存
+        # 初始化缓存，恢复上次关闭时保存的快照
         await default_cache.initialize()
+        if settings.cache.snapshot_enabled:
+            await asyncio.to_thread(restore_caches)
         
         # 初始化认证管理器
         auth_manager = AuthManager.get_instance()
@@ -86,6 +98,28 @@ async def startup():
             from app.handlers.auth import init_default_user
             await init_default_user(db)
             
+        # 后台连接 Emby（服务器不可达时不阻塞启动，之后按需重新初始化）
+        app.state.emby_task = asyncio.create_task(EmbyService.get_instance().ensure_ready())
+        
+        # 后台重放上次未处理完的变更事件
+        app.state.replay_task = asyncio.create_task(FileChangeHandler.get_instance().replay())
+        
+        # 监听本地源目录（首次遍历可能较慢，放在后台）
+        if settings.monitor.local_watch.enabled:
+            app.state.watcher_task = asyncio.create_task(LocalWatcher.get_instance().start())
+            
+        # 低峰时段清理不再被监控的过期记录
+        if settings.monitor.retention.enabled:
+            await RetentionJob.get_instance().start()
+            
+        # 定期比对 Emby 媒体项与软链接，只刷新有差异的路径
+        if settings.emby.reconcile_interval > 0:
+            await LibraryReconciler.get_instance().start()
+            
+        # 后台预热常用查询，不阻塞启动
+        if settings.cache.warmup_enabled:
+            app.state.warmup_task = asyncio.create_task(warm_up(settings.cache.warmup_timeout))
+            
         logger.info("应用初始化完成")
         
     except Exception as e:
@@ -96,13 +130,34 @@ async def startup():
 async def shutdown():
     """应用关闭时的清理操作"""
     try:
+        for name in ("emby_task", "replay_task", "watcher_task", "warmup_task"):
+            task = getattr(app.state, name, None)
+            if task and not task.done():
+                task.cancel()
+                
+        # 先停止扫描和本地监听，它们提交变更时会重新启动事件处理器；
+        # 再停止事件处理，未完成的事件留在事件日志中，下次启动时重放
+        if MonitorService._instance is not None and MonitorService._instance.is_running:
+            await MonitorService._instance.stop()
+        if LocalWatcher._instance is not None:
+            await LocalWatcher._instance.stop()
+        await FileChangeHandler.get_instance().stop()
+        if RetentionJob._instance is not None:
+            await RetentionJob._instance.stop()
+            
+        # 停止 Emby 对账和刷新任务，未发送的路径保留在持久化队列中
+        if LibraryReconciler._instance is not None:
+            await LibraryReconciler._instance.stop()
+        if EmbyService._instance is not None:
+            await EmbyService._instance.close()
+        
         # 关闭数据库连接
         await engine.dispose()
         
-        # 清理缓存
-        await default_cache.clear()
-        if default_cache._cleanup_task:
-            default_cache._cleanup_task.cancel()
+        # 保存缓存快照，停止缓存清理任务，待写条目落盘
+        if settings.cache.snapshot_enabled:
+            await asyncio.to_thread(snapshot_caches)
+        await default_cache.close()
             
         logger.info("应用清理完成")
         
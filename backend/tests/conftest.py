@@ -0,0 +1,116 @@
+"""测试公共配置
+
+与基准测试相同，在导入 app 之前生成测试专用的配置并切换到临时工作目录：
+配置和数据库引擎在导入时创建，数据库、软链接目录都放在临时目录中。
+"""
+import os
+import sys
+import tempfile
+from typing import Dict, Optional
+
+import pytest
+import pytest_asyncio
+import yaml
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FOLDER_MIME_TYPE = 'application/vnd.google-apps.folder'
+VIDEO_MIME_TYPE = 'video/x-matroska'
+
+def prepare_environment(workdir: str):
+    """生成测试配置并切换到工作目录（必须在导入 app 之前调用）"""
+    with open(os.path.join(BACKEND_DIR, "config", "config.yml"), encoding="utf-8") as f:
+        config = yaml.safe_load(f)
+        
+    source_dir = os.path.join(workdir, "source")
+    target_dir = os.path.join(workdir, "target")
+    os.makedirs(source_dir, exist_ok=True)
+    os.makedirs(target_dir, exist_ok=True)
+    
+    config["database"]["url"] = f"sqlite+aiosqlite:///{os.path.join(workdir, 'test.db')}"
+    config["monitor"]["source_dir"] = "root"
+    config["monitor"]["watch_paths"] = []
+    config["monitor"]["local_watch"]["enabled"] = False
+    config["monitor"]["retention"]["enabled"] = False
+    config["symlink"]["source_dir"] = source_dir
+    config["symlink"]["target_dir"] = target_dir
+    config["symlink"]["backup_dir"] = os.path.join(workdir, "backup")
+    config["emby"]["api_key"] = None
+    config["emby"]["reconcile_interval"] = 0
+    config["cache"]["snapshot_enabled"] = False
+    config["cache"]["warmup_enabled"] = False
+    config["cache"]["disk_enabled"] = False
+    
+    config_file = os.path.join(workdir, "config.yml")
+    with open(config_file, "w", encoding="utf-8") as f:
+        yaml.safe_dump(config, f, allow_unicode=True, sort_keys=False)
+    os.environ["GRAYLINK_CONFIG_FILE"] = config_file
+    os.chdir(workdir)
+    if BACKEND_DIR not in sys.path:
+        sys.path.insert(0, BACKEND_DIR)
+
+prepare_environment(tempfile.mkdtemp(prefix="graylink-test-"))
+
+class FakeDrive:
+    """内存中的 Google Drive，实现扫描器用到的 list_page 接口
+    
+    子项按ID排序分页返回；fail_folders 中的目录在列出时抛出异常，模拟网络错误。
+    """
+    
+    def __init__(self, page_size: int = 3):
+        self.page_size = page_size
+        self.items: Dict[str, Dict] = {}
+        self.fail_folders = set()
+        
+    def add(
+        self,
+        file_id: str,
+        name: str,
+        parent: str,
+        folder: bool = False,
+        modified: str = '2024-01-01T00:00:00.000Z'
+    ):
+        self.items[file_id] = {
+            'id': file_id,
+            'name': name,
+            'mimeType': FOLDER_MIME_TYPE if folder else VIDEO_MIME_TYPE,
+            'modifiedTime': modified,
+            'size': '1',
+            'parent': parent
+        }
+        
+    def remove(self, file_id: str):
+        del self.items[file_id]
+        
+    async def list_page(self, folder_id: str, page_token: Optional[str] = None) -> Dict:
+        if folder_id in self.fail_folders:
+            raise ConnectionError(f"列出目录失败: {folder_id}")
+        children = sorted(
+            ({k: v for k, v in item.items() if k != 'parent'} for item in self.items.values() if item['parent'] == folder_id),
+            key=lambda item: item['id']
+        )
+        start = int(page_token or 0)
+        end = start + self.page_size
+        return {
+            'files': children[start:end],
+            'nextPageToken': str(end) if end < len(children) else None
+        }
+
+@pytest.fixture
+def drive() -> FakeDrive:
+    return FakeDrive()
+
+@pytest_asyncio.fixture
+async def db():
+    """每个测试使用一个空数据库"""
+    from app.core.base import Base
+    from app.core.cache import default_cache
+    from app.core.database import engine
+    import app.modules.monitor.models  # noqa: F401 注册监控模块的表
+    
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    default_cache.clear()
+    yield
+    # 连接池中的连接绑定在当前测试的事件循环上
+    await engine.dispose()
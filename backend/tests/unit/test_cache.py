@@ -0,0 +1,58 @@
+"""缓存装饰器测试：同步函数的 singleflight"""
+import asyncio
+import threading
+
+import pytest
+
+from app.core.cache import cached
+
+def tagged(result):
+    return ('serialized', result)
+
+@pytest.mark.asyncio
+async def test_sync_call_on_event_loop_is_serialized_while_another_thread_leads():
+    release = threading.Event()
+    started = threading.Event()
+    calls = []
+    
+    @cached(prefix="test_sync_loop", ttl=60, serializer=tagged)
+    def load(key):
+        calls.append(threading.current_thread().name)
+        if threading.current_thread() is not threading.main_thread():
+            started.set()
+            release.wait(5)
+        return key
+        
+    leader = asyncio.get_running_loop().run_in_executor(None, load, 'k')
+    assert await asyncio.to_thread(started.wait, 5)
+    # 其他线程正在执行同一个键：事件循环线程不等待，直接执行，返回值同样经过转换
+    assert load('k') == ('serialized', 'k')
+    release.set()
+    assert await leader == ('serialized', 'k')
+    assert len(calls) == 2
+    # 缓存由执行者写入
+    assert load('k') == ('serialized', 'k')
+    assert len(calls) == 2
+
+def test_sync_callers_in_threads_share_one_execution():
+    release = threading.Event()
+    started = threading.Event()
+    calls = []
+    
+    @cached(prefix="test_sync_threads", ttl=60, serializer=tagged)
+    def load(key):
+        calls.append(key)
+        started.set()
+        release.wait(5)
+        return key
+        
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(load('k'))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    assert started.wait(5)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert results == [('serialized', 'k')] * 4
+    assert calls == ['k']
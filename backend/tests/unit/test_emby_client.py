@@ -0,0 +1,67 @@
+"""Emby 客户端熔断器测试"""
+import asyncio
+
+import pytest
+from aiohttp import web
+
+from app.utils.emby import CircuitBreaker, CircuitOpenError, EmbyClient
+
+pytestmark = pytest.mark.asyncio
+
+class SlowServer:
+    """本地 Emby 替身：请求一直挂起，直到测试结束"""
+    
+    def __init__(self):
+        self.entered = asyncio.Event()
+        self.release = asyncio.Event()
+        self.runner = None
+        
+    async def slow(self, request):
+        self.entered.set()
+        await self.release.wait()
+        return web.Response(status=204)
+        
+    async def __aenter__(self) -> str:
+        app = web.Application()
+        app.router.add_post('/slow', self.slow)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, '127.0.0.1', 0).start()
+        host, port = self.runner.addresses[0][:2]
+        return f"http://{host}:{port}"
+        
+    async def __aexit__(self, *exc_info):
+        self.release.set()
+        await self.runner.cleanup()
+
+async def test_cancelled_probe_reopens_breaker():
+    server = SlowServer()
+    async with server as url:
+        client = EmbyClient(url, 'key', timeout=30, max_retries=1, failure_threshold=1, reset_timeout=0.05)
+        client.breaker.record_failure()
+        await asyncio.sleep(0.06)
+        assert client.breaker.state == CircuitBreaker.HALF_OPEN
+        
+        probe = asyncio.create_task(client._make_request('POST', '/slow'))
+        await asyncio.wait_for(server.entered.wait(), 5)
+        with pytest.raises(CircuitOpenError):
+            await client._make_request('POST', '/slow')
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+            
+        # 被取消的探测按失败处理：重新冷却，之后允许下一次探测
+        assert client.breaker.state == CircuitBreaker.OPEN
+        await asyncio.sleep(0.06)
+        assert client.breaker.allow()
+
+async def test_cancelled_request_does_not_count_as_failure():
+    server = SlowServer()
+    async with server as url:
+        client = EmbyClient(url, 'key', timeout=30, max_retries=1, failure_threshold=1)
+        request = asyncio.create_task(client._make_request('POST', '/slow'))
+        await asyncio.wait_for(server.entered.wait(), 5)
+        request.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await request
+        assert client.breaker.state == CircuitBreaker.CLOSED
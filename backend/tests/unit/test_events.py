@@ -0,0 +1,202 @@
+"""事件合并与优先级通道测试"""
+import asyncio
+from collections import Counter
+
+import pytest
+
+from app.modules.monitor.events import (
+    ChangeEvent, FileChangeHandler, PriorityLanes, coalesce, LANE_LIVE, LANE_SCAN, LANE_BACKFILL
+)
+from app.modules.monitor.scanner import FileScanner
+from app.modules.monitor.service import MonitorService
+
+def event(event_type: str, file_id: str = 'f1', path: str = None, old_path: str = None, journal_id: int = None) -> ChangeEvent:
+    """构造事件：删除事件的文件信息来自数据库记录（file_id + path），其余来自 Drive（id）"""
+    if event_type == 'deleted':
+        file = {'file_id': file_id, 'path': path}
+    else:
+        file = {'id': file_id, 'name': 'a.mkv'}
+        if path:
+            file['path'] = path
+    change = {'type': event_type, 'file': file, 'old_path': old_path}
+    if journal_id:
+        change['journal_id'] = journal_id
+    return ChangeEvent(change)
+
+def fold(*events: ChangeEvent) -> ChangeEvent:
+    merged = coalesce(list(events))
+    assert len(merged) == 1
+    return merged[0]
+
+class TestFold:
+    """同一文件的事件序列折叠为净效果"""
+    
+    def test_added_then_deleted_is_noop(self):
+        merged = fold(event('added'), event('modified'), event('deleted', path='a.mkv'))
+        assert merged.type == 'noop'
+        assert not merged.is_linkable
+        
+    def test_added_then_modified_is_added(self):
+        assert fold(event('added'), event('modified')).type == 'added'
+        
+    def test_added_then_moved_is_added(self):
+        merged = fold(event('added'), event('moved', path='b.mkv', old_path='a.mkv'))
+        assert merged.type == 'added'
+        assert merged.old_path is None
+        
+    def test_modified_only_is_modified(self):
+        merged = fold(event('modified'), event('modified'))
+        assert merged.type == 'modified'
+        assert merged.old_path is None
+        
+    def test_moves_keep_original_path(self):
+        merged = fold(
+            event('moved', path='b.mkv', old_path='a.mkv'),
+            event('modified'),
+            event('moved', path='c.mkv', old_path='b.mkv')
+        )
+        assert merged.type == 'moved'
+        assert merged.old_path == 'a.mkv'
+        assert merged.path == 'c.mkv'
+        
+    def test_moved_then_deleted_removes_original_path(self):
+        # 软链接还在窗口开始前的路径上
+        merged = fold(event('moved', path='b.mkv', old_path='a.mkv'), event('deleted', path='b.mkv'))
+        assert merged.type == 'deleted'
+        assert merged.path == 'a.mkv'
+        
+    def test_deleted_then_added_is_moved_from_deleted_path(self):
+        # 新路径由路径解析阶段补全，相同时降级为 modified
+        merged = fold(event('deleted', path='a.mkv'), event('added'))
+        assert merged.type == 'moved'
+        assert merged.old_path == 'a.mkv'
+        assert merged.path is None
+        
+    def test_merged_event_keeps_all_journal_ids(self):
+        merged = fold(event('added', journal_id=1), event('modified', journal_id=2), event('modified', journal_id=5))
+        assert merged.journal_ids == [1, 2, 5]
+        
+    def test_order_between_files_is_kept(self):
+        events = [
+            event('added', 'f1'),
+            event('added', 'f2'),
+            event('modified', 'f1'),
+            event('added', 'f3')
+        ]
+        merged = coalesce(events)
+        # 合并后的事件排在该文件最后一个事件的位置
+        assert [e.file_id for e in merged] == ['f2', 'f1', 'f3']
+        assert [e.type for e in merged] == ['added', 'added', 'added']
+        
+    def test_events_without_file_id_are_kept(self):
+        events = [ChangeEvent({'type': 'added', 'file': {'name': 'x'}}), event('added')]
+        assert len(coalesce(events)) == 2
+
+class TestPriorityLanes:
+    """按权重公平调度"""
+    
+    WEIGHTS = {LANE_LIVE: 8, LANE_SCAN: 4, LANE_BACKFILL: 1}
+    
+    @staticmethod
+    async def fill(lanes: PriorityLanes, lane: str, count: int):
+        for i in range(count):
+            await lanes.put(lane, (lane, i))
+            
+    @pytest.mark.asyncio
+    async def test_backlogged_lanes_share_by_weight(self):
+        lanes = PriorityLanes(self.WEIGHTS, maxsize=1000)
+        for lane in self.WEIGHTS:
+            await self.fill(lanes, lane, 500)
+        taken = Counter(lanes.get_nowait()[0] for _ in range(130))
+        assert taken == {LANE_LIVE: 80, LANE_SCAN: 40, LANE_BACKFILL: 10}
+        
+    @pytest.mark.asyncio
+    async def test_items_in_a_lane_stay_in_order(self):
+        lanes = PriorityLanes(self.WEIGHTS, maxsize=100)
+        await self.fill(lanes, LANE_SCAN, 10)
+        assert [lanes.get_nowait()[1] for _ in range(10)] == list(range(10))
+        
+    @pytest.mark.asyncio
+    async def test_single_lane_gets_full_throughput(self):
+        lanes = PriorityLanes(self.WEIGHTS, maxsize=100)
+        await self.fill(lanes, LANE_BACKFILL, 50)
+        assert [lanes.get_nowait()[0] for _ in range(50)] == [LANE_BACKFILL] * 50
+        with pytest.raises(asyncio.QueueEmpty):
+            lanes.get_nowait()
+            
+    @pytest.mark.asyncio
+    async def test_idle_lane_does_not_monopolize_when_it_returns(self):
+        lanes = PriorityLanes({LANE_SCAN: 1, LANE_BACKFILL: 1}, maxsize=1000)
+        await self.fill(lanes, LANE_BACKFILL, 500)
+        for _ in range(300):
+            lanes.get_nowait()
+        # 扫描通道空闲期间没有积累虚拟时间上的优势，回来后按权重交替（最多领先一个）
+        await self.fill(lanes, LANE_SCAN, 100)
+        taken = Counter(lanes.get_nowait()[0] for _ in range(20))
+        assert abs(taken[LANE_SCAN] - taken[LANE_BACKFILL]) <= 2
+        
+    @pytest.mark.asyncio
+    async def test_get_waits_for_put(self):
+        lanes = PriorityLanes(self.WEIGHTS, maxsize=10)
+        getter = asyncio.create_task(lanes.get())
+        await asyncio.sleep(0)
+        assert not getter.done()
+        await lanes.put(LANE_LIVE, 'x')
+        assert await asyncio.wait_for(getter, 1) == 'x'
+        
+    @pytest.mark.asyncio
+    async def test_full_lane_blocks_only_itself(self):
+        lanes = PriorityLanes(self.WEIGHTS, maxsize=2)
+        await self.fill(lanes, LANE_BACKFILL, 2)
+        assert lanes.full(LANE_BACKFILL)
+        blocked = asyncio.create_task(lanes.put(LANE_BACKFILL, (LANE_BACKFILL, 2)))
+        await asyncio.sleep(0)
+        assert not blocked.done()
+        # 其他通道不受影响
+        await asyncio.wait_for(lanes.put(LANE_LIVE, (LANE_LIVE, 0)), 1)
+        assert lanes.get_nowait()[0] == LANE_LIVE
+        lanes.get_nowait()
+        await asyncio.wait_for(blocked, 1)
+        assert lanes.qsize(LANE_BACKFILL) == 2
+
+class TestLaneSelection:
+    """变更按来源进入不同通道，回填积压不阻塞其他通道"""
+    
+    @staticmethod
+    def changes(count: int, prefix: str):
+        return [{'type': 'added', 'file': {'id': f'{prefix}{i}', 'name': f'{i}.mkv'}} for i in range(count)]
+        
+    @pytest.mark.asyncio
+    async def test_full_sync_changes_use_backfill_lane(self):
+        lanes = []
+        
+        async def callback(changes, lane):
+            lanes.append(lane)
+            
+        service = MonitorService(lambda: FileScanner(None, None), event_callback=callback)
+        root = next(iter(service.roots.values()))
+        root.scanner.full_sync = True
+        await service._emit_changes(root, self.changes(1, 'f'))
+        root.scanner.full_sync = False
+        await service._emit_changes(root, self.changes(1, 'f'))
+        assert lanes == [LANE_BACKFILL, LANE_SCAN]
+        
+    @pytest.mark.asyncio
+    async def test_backfill_backlog_does_not_block_other_lanes(self):
+        handler = FileChangeHandler(queue_size=10)
+        # 不启动流水线，通道只进不出
+        handler.start = lambda: None
+        try:
+            # 回填由后台任务入队，通道满时调用方不等待
+            await asyncio.wait_for(handler.handle_changes(self.changes(25, 'b'), lane=LANE_BACKFILL), 1)
+            await asyncio.sleep(0)
+            assert handler._lanes.full(LANE_BACKFILL)
+            await asyncio.wait_for(handler.handle_changes(self.changes(5, 's'), lane=LANE_SCAN), 1)
+            await asyncio.wait_for(handler.handle_changes(self.changes(5, 'l'), lane=LANE_LIVE), 1)
+            # 下一批回填要等上一批入队完成
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(handler.handle_changes(self.changes(1, 'x'), lane=LANE_BACKFILL), 0.1)
+            stats = handler.stats["lanes"]
+            assert (stats[LANE_SCAN]["pending"], stats[LANE_LIVE]["pending"]) == (5, 5)
+        finally:
+            await handler.stop()
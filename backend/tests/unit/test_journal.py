@@ -0,0 +1,248 @@
+"""变更事件日志测试：进程异常退出后的重放和失败重试"""
+import asyncio
+import os
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select, update
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.modules.monitor.events import FileChangeHandler
+from app.modules.monitor.journal import EventJournal
+from app.modules.monitor.models import ChangeJournal
+
+pytestmark = [pytest.mark.asyncio, pytest.mark.usefixtures("db")]
+
+async def test_backoff_is_exponential_and_capped():
+    assert EventJournal.backoff(1) == EventJournal.RETRY_BACKOFF
+    assert EventJournal.backoff(3) == EventJournal.RETRY_BACKOFF * 4
+    assert EventJournal.backoff(100) == EventJournal.RETRY_BACKOFF_MAX
+
+def added(file_id: str, path: str) -> dict:
+    return {'type': 'added', 'file': {'id': file_id, 'name': os.path.basename(path), 'path': path}}
+
+async def append(*changes: dict):
+    """像扫描器一样在事务中追加事件并提交"""
+    async with AsyncSessionLocal() as session:
+        await EventJournal.append(session, list(changes))
+        await session.commit()
+
+async def journal_rows() -> dict:
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(select(ChangeJournal))
+        return {row.file_id: row for row in result.scalars()}
+
+async def expire_claims():
+    """让占用和退避时间全部到期，模拟时间流逝"""
+    async with AsyncSessionLocal() as session:
+        await session.execute(
+            update(ChangeJournal)
+            .where(ChangeJournal.next_attempt_at.isnot(None))
+            .values(next_attempt_at=datetime.utcnow() - timedelta(seconds=1))
+        )
+        await session.commit()
+
+def touch_source(path: str):
+    full_path = os.path.join(settings.symlink.source_dir, path)
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+    open(full_path, 'w').close()
+
+async def drain(handler: FileChangeHandler, timeout: float = 5):
+    """等待流水线处理完所有已入队的事件"""
+    deadline = asyncio.get_running_loop().time() + timeout
+    while asyncio.get_running_loop().time() < deadline:
+        stats = handler.stats
+        done = stats["processed_events"] + stats["failed_events"] + stats["coalesced_events"]
+        if done >= stats["total_events"] and not stats["pending_events"]:
+            if all(not stage.queue.qsize() for stage in handler._stages.values()):
+                # 最后一批可能还在标记状态
+                await asyncio.sleep(0.1)
+                return
+        await asyncio.sleep(0.02)
+    raise AssertionError("事件处理超时")
+
+async def test_append_writes_journal_ids_back():
+    changes = [added('f1', 'a/1.mkv'), added('f2', 'a/2.mkv')]
+    await append(*changes)
+    assert [change['journal_id'] for change in changes] == sorted(change['journal_id'] for change in changes)
+    assert all(change['journal_id'] for change in changes)
+
+async def test_unprocessed_events_are_replayed_after_crash():
+    await append(added('f1', 'a/1.mkv'), added('f2', 'a/2.mkv'))
+    # 进程在处理之前退出：新的日志实例读到全部未完成事件
+    pending = await EventJournal().load_pending(0, await EventJournal().last_id(), 100)
+    assert [change['file']['id'] for change in pending] == ['f1', 'f2']
+    assert pending[0]['file']['path'] == 'a/1.mkv'
+
+async def test_claimed_events_return_after_claim_timeout():
+    await append(added('f1', 'a/1.mkv'))
+    journal = EventJournal()
+    upto = await journal.last_id()
+    assert len(await journal.load_pending(0, upto, 100)) == 1
+    
+    # 进程在处理期间退出：占用到期前不会被再次读取
+    restarted = EventJournal()
+    assert await restarted.load_pending(0, upto, 100) == []
+    await expire_claims()
+    # 运行期间的重试也能取回占用到期的事件
+    retried = await restarted.load_pending(0, upto, 100, retry_only=True)
+    assert [change['file']['id'] for change in retried] == ['f1']
+
+async def test_retry_only_skips_fresh_events():
+    await append(added('f1', 'a/1.mkv'))
+    journal = EventJournal()
+    assert await journal.load_pending(0, await journal.last_id(), 100, retry_only=True) == []
+
+async def test_done_events_are_not_replayed():
+    changes = [added('f1', 'a/1.mkv'), added('f2', 'a/2.mkv')]
+    await append(*changes)
+    journal = EventJournal()
+    await journal.mark_done([changes[0]['journal_id']])
+    pending = await EventJournal().load_pending(0, await journal.last_id(), 100)
+    assert [change['file']['id'] for change in pending] == ['f2']
+
+async def test_failed_events_back_off_and_are_abandoned():
+    change = added('f1', 'a/1.mkv')
+    await append(change)
+    journal = EventJournal()
+    upto = await journal.last_id()
+    
+    await journal.mark_failed([change['journal_id']])
+    row = (await journal_rows())['f1']
+    assert row.processed_at is None
+    assert row.attempts == 1
+    assert row.next_attempt_at > datetime.utcnow() + EventJournal.RETRY_BACKOFF - timedelta(seconds=5)
+    # 退避期间不重试
+    assert await journal.load_pending(0, upto, 100, retry_only=True) == []
+    
+    for _ in range(EventJournal.MAX_ATTEMPTS - 1):
+        await expire_claims()
+        assert len(await journal.load_pending(0, upto, 100, retry_only=True)) == 1
+        await journal.mark_failed([change['journal_id']])
+    assert journal.stats['abandoned'] == 1
+    
+    # 达到上限后留在日志中，不再重试
+    await expire_claims()
+    assert await journal.load_pending(0, upto, 100) == []
+    assert (await journal_rows())['f1'].processed_at is None
+
+async def test_handler_replays_crashed_events_end_to_end():
+    touch_source('show/1.mkv')
+    await append(added('f1', 'show/1.mkv'), added('f2', 'show/missing.mkv'))
+    
+    handler = FileChangeHandler(batch_size=10, batch_timeout=0.05)
+    try:
+        assert await handler.replay() == 2
+        await drain(handler)
+    finally:
+        await handler.stop()
+        
+    link = os.path.join(settings.symlink.target_dir, 'show/1.mkv')
+    assert os.path.islink(link)
+    rows = await journal_rows()
+    # 成功的事件标记完成，源文件不存在的事件留待重试
+    assert rows['f1'].processed_at is not None
+    assert rows['f2'].processed_at is None
+    assert rows['f2'].attempts == 1
+    assert handler.stats['journal']['failed'] == 1
+    
+    # 再次启动时不会重放已完成的事件，失败的事件在退避结束前也不会重放
+    restarted = FileChangeHandler(batch_size=10, batch_timeout=0.05)
+    try:
+        assert await restarted.replay() == 0
+    finally:
+        await restarted.stop()
+
+class FailingEmby:
+    """刷新队列不可用的 Emby 服务"""
+    
+    def __init__(self, raises: bool):
+        self.raises = raises
+        
+    async def refresh_by_paths(self, paths):
+        if self.raises:
+            raise ConnectionError("Emby 不可用")
+        return {"success": 0, "failed": len(paths), "processed": [], "error": "database is locked"}
+
+@pytest.mark.parametrize("raises", [False, True])
+async def test_failed_emby_refresh_is_retried(raises):
+    touch_source('show/2.mkv')
+    await append(added('f1', 'show/2.mkv'))
+    
+    handler = FileChangeHandler(batch_size=10, batch_timeout=0.05)
+    handler.emby_service = FailingEmby(raises)
+    try:
+        assert await handler.replay() == 1
+        await drain(handler)
+    finally:
+        await handler.stop()
+        
+    # 软链接已创建，但 Emby 刷新没有入队：事件不标记完成，按退避时间重试
+    assert os.path.islink(os.path.join(settings.symlink.target_dir, 'show/2.mkv'))
+    row = (await journal_rows())['f1']
+    assert row.processed_at is None
+    assert row.attempts == 1
+    assert handler.stats['failed_events'] == 1
+
+async def test_in_flight_events_are_not_retried_after_claim_timeout():
+    changes = [added('f1', 'a/1.mkv'), added('f2', 'a/2.mkv')]
+    await append(*changes)
+    journal = EventJournal()
+    upto = await journal.last_id()
+    assert len(await journal.load_pending(0, upto, 100)) == 2
+    journal.track([changes[0]['journal_id']])
+    
+    # 占用到期时 f1 仍在通道中排队，重试只读取已经离开流水线的 f2
+    await expire_claims()
+    retried = await journal.load_pending(0, upto, 1, retry_only=True)
+    assert [change['file']['id'] for change in retried] == ['f2']
+    
+    await journal.mark_failed([changes[0]['journal_id']])
+    assert journal.stats['in_flight'] == 0
+    await expire_claims()
+    assert len(await journal.load_pending(0, upto, 100, retry_only=True)) == 2
+
+async def test_queued_backlog_is_not_enqueued_again():
+    await append(added('f1', 'a/1.mkv'), added('f2', 'a/2.mkv'))
+    handler = FileChangeHandler(batch_size=10, batch_timeout=0.05)
+    # 不启动流水线，事件留在通道中直到占用到期
+    handler.start = lambda: None
+    try:
+        assert await handler.replay() == 2
+        await handler._backfill_task
+        await expire_claims()
+        assert await handler.replay(retry_only=True) == 0
+        assert handler.stats['pending_events'] == 2
+    finally:
+        await handler.stop()
+    # 停止后事件不再在流水线中，占用到期后可以重试
+    assert handler.journal.stats['in_flight'] == 0
+
+async def test_coalesced_events_mark_every_journal_entry_done():
+    touch_source('show/3.mkv')
+    changes = [
+        added('f1', 'show/3.mkv'),
+        {'type': 'modified', 'file': {'id': 'f1', 'name': '3.mkv', 'path': 'show/3.mkv'}},
+        added('f2', 'show/temp.mkv'),
+        {'type': 'deleted', 'file': {'file_id': 'f2', 'path': 'show/temp.mkv'}}
+    ]
+    await append(*changes)
+    
+    handler = FileChangeHandler(batch_size=10, batch_timeout=0.2)
+    try:
+        await handler.handle_changes(changes)
+        await drain(handler)
+    finally:
+        await handler.stop()
+        
+    # 一个批次内 f1 合并为一次新增，f2 新增后删除为 noop，不做任何文件系统操作
+    assert os.path.islink(os.path.join(settings.symlink.target_dir, 'show/3.mkv'))
+    assert not os.path.lexists(os.path.join(settings.symlink.target_dir, 'show/temp.mkv'))
+    assert handler.stats['coalesced_events'] == 3
+    assert handler.stats['processed_events'] == 2
+    # 合并后的事件携带全部日志ID，一起标记完成
+    async with AsyncSessionLocal() as session:
+        rows = (await session.execute(select(ChangeJournal))).scalars().all()
+    assert len(rows) == 4
+    assert all(row.processed_at is not None for row in rows)
@@ -0,0 +1,205 @@
+"""扫描器测试：按扫描代数检测删除，不完整的遍历不删除记录"""
+from datetime import datetime
+
+import pytest
+from sqlalchemy import select
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.modules.monitor.events import ChangeEvent, coalesce
+from app.modules.monitor.models import FileRecord, DirectoryFingerprint, ScanCheckpoint
+from app.modules.monitor.scanner import FileScanner
+
+pytestmark = [pytest.mark.asyncio, pytest.mark.usefixtures("db")]
+
+ROOT = 'root'
+
+def build_tree(drive):
+    """root/A/a0..a3.mkv，root/B/b0..b1.mkv，root/top.mkv（每页 3 个子项）"""
+    drive.add('A', 'A', ROOT, folder=True)
+    drive.add('B', 'B', ROOT, folder=True)
+    drive.add('top', 'top.mkv', ROOT)
+    for i in range(4):
+        drive.add(f'a{i}', f'a{i}.mkv', 'A')
+    for i in range(2):
+        drive.add(f'b{i}', f'b{i}.mkv', 'B')
+
+async def scan(drive, **kwargs) -> list:
+    changes = []
+    
+    async def collect(batch):
+        changes.extend(batch)
+        
+    async with AsyncSessionLocal() as session:
+        await FileScanner(session, drive).scan_directory(ROOT, on_changes=collect, **kwargs)
+    return changes
+
+async def record_paths() -> set:
+    async with AsyncSessionLocal() as session:
+        return set((await session.execute(select(FileRecord.path))).scalars())
+
+def of_type(changes: list, change_type: str) -> set:
+    return {
+        change['file'].get('path') or change['file']['name']
+        for change in changes if change['type'] == change_type
+    }
+
+async def test_initial_scan_adds_everything(drive):
+    build_tree(drive)
+    changes = await scan(drive)
+    assert len(of_type(changes, 'added')) == 9
+    assert await record_paths() == {
+        'A', 'B', 'top.mkv',
+        'A/a0.mkv', 'A/a1.mkv', 'A/a2.mkv', 'A/a3.mkv',
+        'B/b0.mkv', 'B/b1.mkv'
+    }
+
+async def test_complete_rescan_deletes_missing_files(drive):
+    build_tree(drive)
+    await scan(drive)
+    drive.remove('a1')
+    changes = await scan(drive)
+    assert of_type(changes, 'deleted') == {'A/a1.mkv'}
+    assert 'A/a1.mkv' not in await record_paths()
+
+async def test_failed_listing_deletes_nothing(drive):
+    build_tree(drive)
+    await scan(drive)
+    drive.remove('a1')
+    drive.remove('b0')
+    drive.fail_folders.add('B')
+    
+    with pytest.raises(ConnectionError):
+        await scan(drive)
+    # 遍历没有完成：没有遍历到的 B 和已确认消失的 a1 都不删除
+    paths = await record_paths()
+    assert {'A/a1.mkv', 'B/b0.mkv', 'B/b1.mkv'} <= paths
+    async with AsyncSessionLocal() as session:
+        assert await session.get(ScanCheckpoint, ROOT) is not None
+        
+    # 恢复后从检查点继续，完整遍历后才按代数删除
+    drive.fail_folders.clear()
+    changes = await scan(drive)
+    assert of_type(changes, 'deleted') == {'A/a1.mkv', 'B/b0.mkv'}
+    assert not {'A/a1.mkv', 'B/b0.mkv'} & await record_paths()
+    assert 'B/b1.mkv' in await record_paths()
+    async with AsyncSessionLocal() as session:
+        assert await session.get(ScanCheckpoint, ROOT) is None
+
+async def test_file_that_fails_processing_is_kept(drive):
+    build_tree(drive)
+    await scan(drive)
+    # 无法解析修改时间：该文件处理失败，目录列表不完整
+    drive.items['a2']['modifiedTime'] = 'not a time'
+    drive.remove('a0')
+    changes = await scan(drive, force=True)
+    
+    assert of_type(changes, 'deleted') == {'A/a0.mkv'}
+    assert 'A/a2.mkv' in await record_paths()
+    # 不保存本次的指纹，保留的旧指纹与子项不一致，下次扫描重新比对该目录
+    async with AsyncSessionLocal() as session:
+        assert (await session.get(DirectoryFingerprint, 'A')).child_count == 4
+        assert (await session.get(DirectoryFingerprint, 'B')).child_count == 2
+
+async def test_unchanged_folders_are_not_deleted_when_skipped(drive):
+    build_tree(drive)
+    await scan(drive)
+    drive.remove('b1')
+    # A 的指纹没有变化，整体跳过比对，但仍写入本轮代数
+    changes = await scan(drive)
+    assert of_type(changes, 'deleted') == {'B/b1.mkv'}
+    assert {'A/a0.mkv', 'A/a1.mkv', 'A/a2.mkv', 'A/a3.mkv'} <= await record_paths()
+
+async def test_move_is_not_reported_as_delete(drive):
+    build_tree(drive)
+    await scan(drive)
+    drive.items['a3']['parent'] = 'B'
+    changes = await scan(drive)
+    assert not of_type(changes, 'deleted')
+    moved = [change for change in changes if change['type'] == 'moved']
+    assert [(change['old_path'], change['file']['name']) for change in moved] == [('A/a3.mkv', 'a3.mkv')]
+    assert 'B/a3.mkv' in await record_paths()
+
+async def test_reupload_with_same_name_replaces_record(drive):
+    build_tree(drive)
+    await scan(drive)
+    # 删除后重新上传：新ID，相同路径
+    drive.remove('a0')
+    drive.add('a0b', 'a0.mkv', 'A')
+    changes = await scan(drive)
+    
+    assert of_type(changes, 'deleted') == {'A/a0.mkv'}
+    assert 'a0.mkv' in of_type(changes, 'added')
+    async with AsyncSessionLocal() as session:
+        record = (await session.execute(select(FileRecord).where(FileRecord.path == 'A/a0.mkv'))).scalar_one()
+        assert record.file_id == 'a0b'
+        assert await session.get(ScanCheckpoint, ROOT) is None
+    assert await scan(drive) == []
+
+async def test_swapped_names_are_reported_as_moves(drive):
+    build_tree(drive)
+    await scan(drive)
+    drive.items['a1']['name'] = 'a2.mkv'
+    drive.items['a2']['name'] = 'a1.mkv'
+    changes = await scan(drive)
+    
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(select(FileRecord.path, FileRecord.file_id).where(FileRecord.parent_id == 'A'))
+        assert dict(result.all())['A/a1.mkv'] == 'a2'
+    assert await record_paths() >= {'A/a1.mkv', 'A/a2.mkv'}
+    # 释放路径发出的删除与重新新增在流水线中合并为移动，两个软链接都保留
+    merged = coalesce([ChangeEvent(change) for change in changes])
+    assert sorted((event.type, event.file_id) for event in merged) == [('moved', 'a1'), ('moved', 'a2')]
+    assert await scan(drive) == []
+
+async def test_duplicate_names_keep_first_listed(drive):
+    build_tree(drive)
+    drive.add('a0dup', 'a0.mkv', 'A')
+    drive.add('Bdup', 'B', ROOT, folder=True)
+    drive.add('bdup', 'b0.mkv', 'Bdup')
+    changes = await scan(drive)
+    
+    assert len(of_type(changes, 'added')) == 9
+    async with AsyncSessionLocal() as session:
+        assert (await session.execute(select(FileRecord.file_id).where(FileRecord.path == 'A/a0.mkv'))).scalar_one() == 'a0'
+        assert (await session.execute(select(FileRecord.file_id).where(FileRecord.path == 'B/b0.mkv'))).scalar_one() == 'b0'
+    # 每次扫描保留同一个，不会来回替换
+    assert await scan(drive, force=True) == []
+
+async def test_changes_are_emitted_per_committed_batch(drive, monkeypatch):
+    monkeypatch.setattr(settings.monitor, 'scan_batch_size', 2)
+    build_tree(drive)
+    batches = []
+    
+    async def collect(batch):
+        # 回调时这一批已经提交，其他会话可以读到
+        paths = {change['file']['name'] for change in batch}
+        batches.append((paths, {path.rsplit('/', 1)[-1] for path in await record_paths()}))
+        
+    async with AsyncSessionLocal() as session:
+        total = await FileScanner(session, drive).scan_directory(ROOT, on_changes=collect)
+        
+    assert total == 9
+    assert len(batches) > 2
+    assert all(paths <= committed for paths, committed in batches)
+    # 没有等整棵目录树扫描完成才发出第一批
+    assert len(batches[0][1]) < 9
+
+async def test_legacy_records_are_deleted_outside_nested_roots(drive):
+    build_tree(drive)
+    await scan(drive)
+    async with AsyncSessionLocal() as session:
+        # 升级前写入、没有根目录和代数的记录
+        for file_id, path in [('old', 'gone.mkv'), ('nested', 'Nested/kept.mkv')]:
+            session.add(FileRecord(
+                file_id=file_id,
+                path=path,
+                modified_time=datetime(2024, 1, 1),
+                root_id=None
+            ))
+        await session.commit()
+        
+    changes = await scan(drive, exclude_paths=['Nested'])
+    # 嵌套根目录下的记录由它自己的扫描负责
+    assert of_type(changes, 'deleted') == {'gone.mkv'}
+    assert 'Nested/kept.mkv' in await record_paths()
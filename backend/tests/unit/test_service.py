@@ -0,0 +1,74 @@
+"""监控服务测试：停止服务时取消进行中的扫描，之后从检查点继续"""
+import asyncio
+
+import pytest
+from sqlalchemy import select
+
+from app.core.database import AsyncSessionLocal
+from app.modules.monitor.events import FileChangeHandler
+from app.modules.monitor.models import FileRecord, ScanCheckpoint
+from app.modules.monitor.scanner import FileScanner
+from app.modules.monitor.service import MonitorService
+
+pytestmark = [pytest.mark.asyncio, pytest.mark.usefixtures("db")]
+
+ROOT = 'root'
+
+async def test_stop_cancels_running_scans(drive):
+    drive.add('A', 'A', ROOT, folder=True)
+    drive.add('B', 'B', ROOT, folder=True)
+    drive.add('a0', 'a0.mkv', 'A')
+    drive.add('b0', 'b0.mkv', 'B')
+    drive.add('b1', 'b1.mkv', 'B')
+    gate = asyncio.Event()
+    entered = asyncio.Event()
+    list_page = drive.list_page
+    
+    async def slow_list_page(folder_id, page_token=None):
+        # 列出 B 时挂起，模拟正在进行的扫描
+        if folder_id == 'B':
+            entered.set()
+            await gate.wait()
+        return await list_page(folder_id, page_token)
+        
+    drive.list_page = slow_list_page
+    handler = FileChangeHandler(batch_size=10, batch_timeout=0.05)
+    service = MonitorService(
+        lambda: FileScanner(AsyncSessionLocal(), drive),
+        event_callback=handler.handle_changes
+    )
+    try:
+        await service.start()
+        service.request_scan()
+        await asyncio.wait_for(entered.wait(), 5)
+        await handler.stop()
+        
+        await service.stop()
+        root = service.roots[ROOT]
+        assert root.task is None
+        assert not root.is_scanning
+        # 被取消的扫描不再占用数据库连接
+        assert not root.scanner.db_session.in_transaction()
+        # 停止后不再有扫描提交变更，事件处理器不会被重新启动
+        gate.set()
+        await asyncio.sleep(0.1)
+        assert not handler.is_running
+        async with AsyncSessionLocal() as session:
+            assert await session.get(ScanCheckpoint, ROOT) is not None
+            
+        # 重新启动后从检查点继续，完成扫描
+        await service.start()
+        service.request_scan()
+        for _ in range(250):
+            if root.total_scans == 2 and not root.is_scanning:
+                break
+            await asyncio.sleep(0.02)
+        assert root.last_error is None
+        async with AsyncSessionLocal() as session:
+            assert await session.get(ScanCheckpoint, ROOT) is None
+            paths = set((await session.execute(select(FileRecord.path))).scalars())
+        assert {'B/b0.mkv', 'B/b1.mkv', 'A/a0.mkv'} <= paths
+    finally:
+        if service.is_running:
+            await service.stop()
+        await handler.stop()
@@ -0,0 +1,80 @@
+"""本地文件监控测试：轮询和补扫的变更进入处理器并创建软链接"""
+import asyncio
+import os
+
+import pytest
+import pytest_asyncio
+
+from app.core.config import settings
+from app.modules.monitor.events import FileChangeHandler, LANE_BACKFILL, LANE_LIVE
+from app.modules.monitor.watcher import LocalWatcher
+
+pytestmark = [pytest.mark.asyncio, pytest.mark.usefixtures("db")]
+
+def touch_source(path: str):
+    full_path = os.path.join(settings.symlink.source_dir, path)
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+    open(full_path, 'w').close()
+
+async def wait_for_link(path: str, timeout: float = 5) -> bool:
+    link = os.path.join(settings.symlink.target_dir, path)
+    deadline = asyncio.get_running_loop().time() + timeout
+    while asyncio.get_running_loop().time() < deadline:
+        if os.path.islink(link):
+            return True
+        await asyncio.sleep(0.02)
+    return False
+
+class FailingOnceHandler(FileChangeHandler):
+    """第一次提交时抛出异常"""
+    
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.calls = []
+        
+    async def handle_changes(self, changes, lane=None):
+        self.calls.append(lane)
+        if len(self.calls) == 1:
+            raise RuntimeError("处理器暂时不可用")
+        await super().handle_changes(changes, lane=lane)
+
+@pytest_asyncio.fixture
+async def watcher():
+    handler = FileChangeHandler(batch_size=10, batch_timeout=0.05)
+    watcher = LocalWatcher(handler)
+    watcher.backend = "polling"
+    watcher.poll_interval = 0.05
+    yield watcher
+    await watcher.stop()
+    await handler.stop()
+
+async def test_polled_changes_are_linked(watcher):
+    await watcher.start()
+    assert watcher.stats["poll_roots"]
+    touch_source('show/polled.mkv')
+    assert await wait_for_link('show/polled.mkv')
+    assert watcher.handler.stats["lanes"][LANE_LIVE]["enqueued"] == 1
+
+async def test_overflow_rescan_uses_backfill_lane(watcher):
+    await watcher.start()
+    touch_source('show/overflow.mkv')
+    await watcher._rescan(watcher.source_root, lane=LANE_BACKFILL)
+    assert await wait_for_link('show/overflow.mkv')
+    assert watcher.handler.stats["lanes"][LANE_BACKFILL]["enqueued"] == 1
+
+async def test_flush_loop_survives_handler_errors():
+    handler = FailingOnceHandler(batch_size=10, batch_timeout=0.05)
+    watcher = LocalWatcher(handler)
+    watcher.backend = "polling"
+    watcher.poll_interval = 0.05
+    try:
+        await watcher.start()
+        touch_source('show/first.mkv')
+        while not handler.calls:
+            await asyncio.sleep(0.02)
+        touch_source('show/second.mkv')
+        assert await wait_for_link('show/second.mkv')
+        assert watcher.stats["last_error"] == "处理器暂时不可用"
+    finally:
+        await watcher.stop()
+        await handler.stop()